@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - Unix ドメインソケット上のバイナリプロトコル（ローカル IPC 用）
+
+HTTP/JSON の /mcp と並べて使う、同一マシン内の高頻度クライアント向けの軽量プロトコル。
+1本の接続でリクエスト ID により複数の翻訳を多重化し、トークンを逐次返し、取り消せる。
+
+フレーム: [長さ u32][種別 u8][リクエストID u32][本文]（ビッグエンディアン、長さは本文のバイト数）
+
+    REQUEST (1)  クライアント→サーバー  {"text", "source_language", "target_language"}
+    TOKEN   (2)  サーバー→クライアント  訳文の断片（UTF-8 そのまま）
+    DONE    (3)  サーバー→クライアント  {"processing_time", "cancelled"}
+    ERROR   (4)  サーバー→クライアント  エラーメッセージ（UTF-8）
+    CANCEL  (5)  クライアント→サーバー  本文なし
+
+辞書を運ぶ REQUEST / DONE は msgpack があれば msgpack、なければ JSON で符号化する。
+頻度の高い TOKEN フレームは符号化せずに UTF-8 をそのまま載せる。
+
+起動と計測:
+    python3 binary_ipc.py --serve              # 翻訳エンジンで待ち受け
+    python3 binary_ipc.py --bench              # スタブで HTTP/JSON と比較
+"""
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+DEFAULT_SOCKET_PATH = os.environ.get(
+    "PLAMO_IPC_SOCKET",
+    os.path.expanduser("~/.plamo_translator/plamo.sock")
+)
+
+FRAME_REQUEST = 1
+FRAME_TOKEN = 2
+FRAME_DONE = 3
+FRAME_ERROR = 4
+FRAME_CANCEL = 5
+
+_HEADER = struct.Struct(">IBI")
+# 1フレームの本文の上限（壊れたストリームで巨大な確保をしない）
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+# 翻訳関数: (text, source_lang, target_lang, on_token, cancelled) -> None
+TranslateFn = Callable[[str, str, str, Callable[[str], None], threading.Event], None]
+
+
+class ProtocolError(Exception):
+    """フレームの形式が不正"""
+
+
+def pack_map(value: dict) -> bytes:
+    if MSGPACK_AVAILABLE:
+        return msgpack.packb(value, use_bin_type=True)
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def unpack_map(data: bytes) -> dict:
+    if MSGPACK_AVAILABLE:
+        return msgpack.unpackb(data, raw=False)
+    return json.loads(data)
+
+
+def encode_frame(kind: int, request_id: int, payload: bytes = b"") -> bytes:
+    return _HEADER.pack(len(payload), kind, request_id) + payload
+
+
+def read_frame(reader) -> Optional[Tuple[int, int, bytes]]:
+    """(種別, リクエストID, 本文) を1つ読む。接続が閉じていれば None"""
+    header = reader.read(_HEADER.size)
+    if not header:
+        return None
+    if len(header) < _HEADER.size:
+        raise ProtocolError("フレームヘッダが途中で切れています")
+    length, kind, request_id = _HEADER.unpack(header)
+    if length > MAX_FRAME_BYTES:
+        raise ProtocolError(f"フレームが大きすぎます: {length}バイト")
+    payload = reader.read(length) if length else b""
+    if len(payload) < length:
+        raise ProtocolError("フレーム本文が途中で切れています")
+    return kind, request_id, payload
+
+
+# ---- サーバー ----
+
+def engine_translate(text: str, source_lang: str, target_lang: str,
+                     on_token: Callable[[str], None], cancelled: threading.Event):
+    """StreamingTranslator で翻訳（用語集・翻訳メモリ・優先度制御を含む）"""
+    from streaming_translator import get_translator
+
+    finished = threading.Event()
+    errors = []
+
+    def on_error(message: str):
+        errors.append(message)
+        finished.set()
+
+    get_translator().translate_streaming(
+        text,
+        chunk_callback=on_token,
+        complete_callback=lambda result: finished.set(),
+        error_callback=on_error,
+        partial_callback=lambda partial, message: on_error(message),
+        cancel=cancelled
+    )
+    # 取り消し時はエンジンが次のチャンクで止まり、コールバックは呼ばれない
+    while not finished.wait(0.1):
+        if cancelled.is_set():
+            return
+    if errors:
+        raise RuntimeError(errors[0])
+
+
+def stub_translate(config=None) -> TranslateFn:
+    """mcp_stub と同じ訳文・遅延・8文字ごとの断片で返す翻訳関数（計測用）"""
+    from mcp_stub import StubConfig, fake_translate
+
+    config = config or StubConfig()
+
+    def translate(text, source_lang, target_lang, on_token, cancelled):
+        translated = fake_translate(text, target_lang)
+        config.sleep()
+        step = 8
+        for i in range(0, len(translated), step):
+            if cancelled.is_set():
+                return
+            piece = translated[i:i + step]
+            config.sleep(len(piece))
+            on_token(piece)
+
+    return translate
+
+
+class _IPCHandler(socketserver.BaseRequestHandler):
+    """1接続分: フレームを読み、リクエストごとにスレッドで翻訳して応答を書き戻す"""
+
+    def setup(self):
+        self.reader = self.request.makefile("rb")
+        self.active: Dict[int, threading.Event] = {}
+        self._outbox = []
+        self._outbox_lock = threading.Lock()
+        self._flushing = False
+
+    def send(self, kind: int, request_id: int, payload: bytes = b""):
+        """フレームを送信。書き込み中の別スレッドがいれば、そのスレッドがまとめて送る"""
+        with self._outbox_lock:
+            self._outbox.append(encode_frame(kind, request_id, payload))
+            if self._flushing:
+                return
+            self._flushing = True
+        try:
+            while True:
+                with self._outbox_lock:
+                    if not self._outbox:
+                        return
+                    frames, self._outbox = self._outbox, []
+                # ソケットが詰まっている間に溜まったフレームは1回の書き込みで送る
+                self.request.sendall(b"".join(frames))
+        finally:
+            with self._outbox_lock:
+                self._flushing = False
+
+    def handle(self):
+        try:
+            while True:
+                frame = read_frame(self.reader)
+                if frame is None:
+                    break
+                kind, request_id, payload = frame
+                if kind == FRAME_REQUEST:
+                    cancelled = self.active[request_id] = threading.Event()
+                    try:
+                        self.server.executor.submit(self._run, request_id, unpack_map(payload), cancelled)
+                    except RuntimeError:
+                        # stop() 後も残っている接続からの要求
+                        self.active.pop(request_id, None)
+                        self.send(FRAME_ERROR, request_id, "サーバーは停止しています".encode("utf-8"))
+                elif kind == FRAME_CANCEL:
+                    event = self.active.get(request_id)
+                    if event is not None:
+                        event.set()
+                else:
+                    raise ProtocolError(f"不明なフレーム種別: {kind}")
+        except (ProtocolError, ValueError, ConnectionError) as e:
+            print(f"⚠️ IPC接続を切断: {e}")
+        finally:
+            # 接続が切れたら実行中の翻訳をすべて止める
+            for event in list(self.active.values()):
+                event.set()
+
+    def _run(self, request_id: int, body: dict, cancelled: threading.Event):
+        started = time.perf_counter()
+
+        def on_token(piece: str):
+            if not cancelled.is_set():
+                self.send(FRAME_TOKEN, request_id, piece.encode("utf-8"))
+
+        try:
+            self.server.translate(
+                body["text"], body.get("source_language", "English"),
+                body.get("target_language", "Japanese"), on_token, cancelled
+            )
+            self.send(FRAME_DONE, request_id, pack_map({
+                "processing_time": time.perf_counter() - started,
+                "cancelled": cancelled.is_set(),
+            }))
+        except OSError:
+            pass  # クライアントが切断済み
+        except Exception as e:
+            try:
+                self.send(FRAME_ERROR, request_id, str(e).encode("utf-8"))
+            except OSError:
+                pass
+        finally:
+            self.active.pop(request_id, None)
+
+
+class IPCServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """バイナリプロトコルの Unix ドメインソケットサーバー"""
+
+    daemon_threads = True
+
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH, translate: Optional[TranslateFn] = None,
+                 max_workers: int = 32):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(path)  # 前回の残りのソケットファイル
+        super().__init__(path, _IPCHandler)
+        self.path = path
+        self.translate = translate or engine_translate
+        # リクエストごとにスレッドを作らず使い回す
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ipc")
+
+    def start(self) -> "IPCServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+# ---- クライアント ----
+
+class IPCRequest:
+    """送信済みの翻訳1件（result で訳文を待つ）"""
+
+    __slots__ = ("id", "on_token", "pieces", "done", "error", "info")
+
+    def __init__(self, request_id: int, on_token: Optional[Callable[[str], None]]):
+        self.id = request_id
+        self.on_token = on_token
+        self.pieces = []
+        self.done = threading.Event()
+        self.error: Optional[str] = None
+        self.info: dict = {}
+
+    def result(self, timeout: Optional[float] = None) -> str:
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"リクエスト {self.id} がタイムアウトしました")
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        return "".join(self.pieces)
+
+
+class IPCClient:
+    """1本の接続で複数の翻訳を多重化するクライアント"""
+
+    def __init__(self, path: str = DEFAULT_SOCKET_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self._reader = self.sock.makefile("rb")
+        self._write_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending: Dict[int, IPCRequest] = {}
+        self._next_id = 1
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def _send(self, kind: int, request_id: int, payload: bytes = b""):
+        with self._write_lock:
+            self.sock.sendall(encode_frame(kind, request_id, payload))
+
+    def _read_loop(self):
+        try:
+            while True:
+                frame = read_frame(self._reader)
+                if frame is None:
+                    break
+                kind, request_id, payload = frame
+                pending = self._pending.get(request_id)
+                if pending is None:
+                    continue  # 取り消し済み
+                if kind == FRAME_TOKEN:
+                    piece = payload.decode("utf-8")
+                    pending.pieces.append(piece)
+                    if pending.on_token:
+                        pending.on_token(piece)
+                elif kind in (FRAME_DONE, FRAME_ERROR):
+                    if kind == FRAME_DONE:
+                        pending.info = unpack_map(payload)
+                    else:
+                        pending.error = payload.decode("utf-8")
+                    with self._lock:
+                        self._pending.pop(request_id, None)
+                    pending.done.set()
+        except (OSError, ProtocolError):
+            pass
+        # 接続が切れたら待っている全リクエストを失敗させる
+        with self._lock:
+            pending_all = list(self._pending.values())
+            self._pending.clear()
+        for pending in pending_all:
+            pending.error = pending.error or "接続が切断されました"
+            pending.done.set()
+
+    def submit(self, text: str, source_lang: str, target_lang: str,
+               on_token: Optional[Callable[[str], None]] = None) -> IPCRequest:
+        """翻訳を送信する（on_token は受信スレッドから呼ばれる）"""
+        with self._lock:
+            request = IPCRequest(self._next_id, on_token)
+            self._next_id += 1
+            self._pending[request.id] = request
+        self._send(FRAME_REQUEST, request.id, pack_map({
+            "text": text, "source_language": source_lang, "target_language": target_lang,
+        }))
+        return request
+
+    def translate(self, text: str, source_lang: str, target_lang: str,
+                  on_token: Optional[Callable[[str], None]] = None, timeout: Optional[float] = None) -> str:
+        request = self.submit(text, source_lang, target_lang, on_token)
+        try:
+            return request.result(timeout)
+        except TimeoutError:
+            self.cancel(request.id)
+            raise
+
+    def cancel(self, request_id: int):
+        """翻訳を取り消す（以後のトークンは捨てる）"""
+        with self._lock:
+            pending = self._pending.pop(request_id, None)
+        if pending is not None:
+            pending.error = "取り消されました"
+            pending.done.set()
+            self._send(FRAME_CANCEL, request_id)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+# ---- 計測 ----
+
+def _bench_overhead(requests: int, socket_path: str, http_url: str) -> Dict[str, float]:
+    """短い翻訳1件あたりの往復時間（µs）"""
+    import http.client
+
+    from mcp_stub import MCP_PATH, build_request, parse_url
+
+    text = "Hello, world."
+    client = IPCClient(socket_path)
+    client.translate(text, "English", "Japanese")
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.translate(text, "English", "Japanese")
+    binary = (time.perf_counter() - start) / requests * 1e6
+    client.close()
+
+    host, port = parse_url(http_url)
+    conn = http.client.HTTPConnection(host, port)
+    body = json.dumps(build_request(text, "English", "Japanese"), ensure_ascii=False).encode("utf-8")
+    headers = {"Content-Type": "application/json"}
+    start = time.perf_counter()
+    for _ in range(requests):
+        conn.request("POST", MCP_PATH, body=body, headers=headers)
+        json.loads(conn.getresponse().read())
+    http_json = (time.perf_counter() - start) / requests * 1e6
+    conn.close()
+    return {"binary_uds_us": binary, "http_json_us": http_json}
+
+
+def _bench_tokens(chars: int, socket_path: str, http_url: str) -> Dict[str, float]:
+    """長い訳文を8文字ずつ受け取るときのトークンフレーム数/秒"""
+    import http.client
+
+    from mcp_stub import MCP_PATH, build_request, parse_url
+
+    text = "x" * chars
+    client = IPCClient(socket_path)
+    start = time.perf_counter()
+    received = []
+    client.translate(text, "English", "Japanese", on_token=received.append)
+    binary = len(received) / (time.perf_counter() - start)
+    client.close()
+
+    host, port = parse_url(http_url)
+    conn = http.client.HTTPConnection(host, port)
+    body = json.dumps(build_request(text, "English", "Japanese", stream=True)).encode("utf-8")
+    start = time.perf_counter()
+    conn.request("POST", MCP_PATH, body=body, headers={"Content-Type": "application/json"})
+    response = conn.getresponse()
+    frames = 0
+    while True:
+        line = response.readline()
+        if not line:
+            break
+        if "delta" in json.loads(line):
+            frames += 1
+    http_json = frames / (time.perf_counter() - start)
+    conn.close()
+    return {"binary_uds_frames_per_s": binary, "http_ndjson_frames_per_s": http_json}
+
+
+def _bench_codec(count: int) -> Dict[str, float]:
+    """トークン1個の符号化＋復号（ns）。ネットワークを除いた純粋なコスト"""
+    import io
+
+    piece = "翻訳の断片です"
+    start = time.perf_counter()
+    for i in range(count):
+        data = encode_frame(FRAME_TOKEN, i, piece.encode("utf-8"))
+        read_frame(io.BytesIO(data))[2].decode("utf-8")
+    binary = (time.perf_counter() - start) / count * 1e9
+    start = time.perf_counter()
+    for i in range(count):
+        line = (json.dumps({"delta": piece}, ensure_ascii=False) + "\n").encode("utf-8")
+        json.loads(line)["delta"]
+    ndjson = (time.perf_counter() - start) / count * 1e9
+    return {"binary_frame_ns": binary, "ndjson_line_ns": ndjson}
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    arg_parser = argparse.ArgumentParser(description="バイナリ IPC サーバー / HTTP・JSON との比較")
+    arg_parser.add_argument("--serve", action="store_true", help="翻訳エンジンで待ち受ける")
+    arg_parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH)
+    arg_parser.add_argument("--bench", action="store_true", help="スタブで HTTP/JSON と比較")
+    arg_parser.add_argument("--requests", type=int, default=2000)
+    arg_parser.add_argument("--chars", type=int, default=800_000, help="トークン転送計測の訳文の長さ")
+    args = arg_parser.parse_args()
+
+    if args.serve:
+        server = IPCServer(args.socket)
+        print(f"🔌 バイナリIPC待ち受け: {args.socket}（{'msgpack' if MSGPACK_AVAILABLE else 'JSON'}）")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.stop()
+    else:
+        from mcp_stub import StubConfig, StubServer
+
+        zero = StubConfig(latency_ms=0, per_char_ms=0)
+        socket_path = os.path.join(tempfile.mkdtemp(), "bench.sock")
+        ipc = IPCServer(socket_path, stub_translate(zero)).start()
+        http_stub = StubServer(config=zero).start()
+
+        overhead = _bench_overhead(args.requests, socket_path, http_stub.url)
+        tokens = _bench_tokens(args.chars, socket_path, http_stub.url)
+        codec = _bench_codec(200_000)
+        print(f"📦 制御フレーム: {'msgpack' if MSGPACK_AVAILABLE else 'JSON（msgpack 未インストール）'}")
+        print(f"  1リクエストの往復: バイナリ/UDS {overhead['binary_uds_us']:.0f}µs"
+              f" / HTTP+JSON {overhead['http_json_us']:.0f}µs")
+        print(f"  トークン転送: バイナリ/UDS {tokens['binary_uds_frames_per_s']:,.0f}フレーム/秒"
+              f" / HTTP+NDJSON {tokens['http_ndjson_frames_per_s']:,.0f}フレーム/秒")
+        print(f"  符号化+復号: バイナリ {codec['binary_frame_ns']:.0f}ns / NDJSON {codec['ndjson_line_ns']:.0f}ns")
+
+        ipc.stop()
+        http_stub.stop()
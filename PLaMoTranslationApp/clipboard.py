@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - クリップボード（呼び出しごとにプロセスを起動しない）
+
+pyperclip は呼び出しのたびに pbcopy / pbpaste（Linux では xclip / xsel）を起動するため、
+ホットキー直後の貼り付けに数十ミリ秒かかる。ここでは次の順に使えるものを選び、
+失敗したら次のバックエンドに切り替える。
+
+1. NSPasteboard（macOS、PyObjC があればプロセス内で直接）
+2. Tk のクリップボード（アプリの Tk ルートを使う。Tk スレッドからの呼び出しのみ）
+3. 常駐ヘルパープロセス（Tk を持つ子プロセスを1度だけ起動し、パイプで要求を送る）
+4. pyperclip（従来どおり）
+
+ベンチマーク（Linux では Xvfb 上で実行できる）:
+    xvfb-run python3 clipboard.py --bench 200
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+from typing import List, Optional
+
+try:
+    from AppKit import NSPasteboard, NSPasteboardTypeString
+    APPKIT_AVAILABLE = True
+except ImportError:
+    APPKIT_AVAILABLE = False
+
+try:
+    import pyperclip
+    PYPERCLIP_AVAILABLE = True
+except ImportError:
+    PYPERCLIP_AVAILABLE = False
+
+
+class ClipboardError(Exception):
+    """バックエンドがクリップボードにアクセスできない"""
+
+
+class ClipboardBackend:
+    name = "base"
+
+    def paste(self) -> str:
+        raise NotImplementedError
+
+    def copy(self, text: str):
+        raise NotImplementedError
+
+
+class NSPasteboardBackend(ClipboardBackend):
+    """macOS の NSPasteboard を直接使う"""
+
+    name = "nspasteboard"
+
+    def __init__(self):
+        self._board = NSPasteboard.generalPasteboard()
+
+    def paste(self) -> str:
+        return self._board.stringForType_(NSPasteboardTypeString) or ""
+
+    def copy(self, text: str):
+        self._board.clearContents()
+        if not self._board.setString_forType_(text, NSPasteboardTypeString):
+            raise ClipboardError("NSPasteboard への書き込みに失敗")
+
+
+class TkClipboardBackend(ClipboardBackend):
+    """アプリの Tk ルートのクリップボードを使う（Tk スレッド専用）"""
+
+    name = "tk"
+
+    def __init__(self, root):
+        self.root = root
+        self._thread = threading.get_ident()
+
+    def _check_thread(self):
+        if threading.get_ident() != self._thread:
+            raise ClipboardError("Tk クリップボードは Tk スレッドからのみ使用可能")
+
+    def paste(self) -> str:
+        self._check_thread()
+        import tkinter as tk
+        try:
+            return self.root.clipboard_get()
+        except tk.TclError:
+            return ""  # 空、または文字列以外の内容
+
+    def copy(self, text: str):
+        self._check_thread()
+        self.root.clipboard_clear()
+        self.root.clipboard_append(text)
+        # X11 では他のアプリから要求されるまで内容を保持する必要があるため、即座に処理する
+        self.root.update_idletasks()
+
+
+class HelperProcessBackend(ClipboardBackend):
+    """Tk を持つ常駐子プロセスに JSON 行で要求を送る"""
+
+    name = "helper"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._process: Optional[subprocess.Popen] = None
+
+    def _start(self) -> subprocess.Popen:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1
+        )
+        ready = process.stdout.readline()
+        # 起動できない環境（ディスプレイなしなど）は恒久的な失敗としてチェーンから外させる
+        if not ready:
+            raise RuntimeError("クリップボードヘルパーを起動できません")
+        message = json.loads(ready)
+        if not message.get("ok"):
+            raise RuntimeError(message.get("error", "クリップボードヘルパーの初期化に失敗"))
+        return process
+
+    def _request(self, message: dict) -> dict:
+        with self._lock:
+            for attempt in range(2):
+                if self._process is None or self._process.poll() is not None:
+                    self._process = self._start()
+                try:
+                    self._process.stdin.write(json.dumps(message, ensure_ascii=False) + "\n")
+                    self._process.stdin.flush()
+                    line = self._process.stdout.readline()
+                except (BrokenPipeError, OSError):
+                    line = ""
+                if line:
+                    break
+                # ヘルパーが終了していたら1度だけ起動し直す
+                self._process = None
+            else:
+                raise ClipboardError("クリップボードヘルパーが応答しません")
+        reply = json.loads(line)
+        if not reply.get("ok"):
+            raise ClipboardError(reply.get("error", "クリップボードヘルパーのエラー"))
+        return reply
+
+    def paste(self) -> str:
+        return self._request({"op": "paste"}).get("text", "")
+
+    def copy(self, text: str):
+        self._request({"op": "copy", "text": text})
+
+    def close(self):
+        with self._lock:
+            if self._process is not None and self._process.poll() is None:
+                self._process.stdin.close()
+                self._process.wait(timeout=2)
+            self._process = None
+
+
+class PyperclipBackend(ClipboardBackend):
+    """pyperclip（呼び出しごとに外部コマンドを起動する）"""
+
+    name = "pyperclip"
+
+    def paste(self) -> str:
+        return pyperclip.paste()
+
+    def copy(self, text: str):
+        pyperclip.copy(text)
+
+
+class Clipboard:
+    """利用可能なバックエンドを順に試すクリップボード"""
+
+    def __init__(self, root=None, backends: Optional[List[ClipboardBackend]] = None):
+        if backends is None:
+            backends = []
+            if APPKIT_AVAILABLE:
+                backends.append(NSPasteboardBackend())
+            if root is not None:
+                backends.append(TkClipboardBackend(root))
+            if sys.platform != "darwin" or not APPKIT_AVAILABLE:
+                backends.append(HelperProcessBackend())
+            if PYPERCLIP_AVAILABLE:
+                backends.append(PyperclipBackend())
+        self.backends = backends
+
+    def _call(self, op: str, *args):
+        errors = []
+        for backend in list(self.backends):
+            try:
+                return getattr(backend, op)(*args)
+            except ClipboardError as e:
+                # スレッド制約などの一時的な理由は次のバックエンドで代替
+                errors.append(f"{backend.name}: {e}")
+            except Exception as e:
+                # 恒久的に使えないバックエンドは以後試さない
+                print(f"⚠️ クリップボード({backend.name})を無効化: {e}")
+                self.backends.remove(backend)
+                errors.append(f"{backend.name}: {e}")
+        raise ClipboardError("; ".join(errors) or "使用できるクリップボードがありません")
+
+    def paste(self) -> str:
+        return self._call("paste")
+
+    def copy(self, text: str):
+        self._call("copy", text)
+
+    @property
+    def backend_names(self) -> List[str]:
+        return [backend.name for backend in self.backends]
+
+
+# グローバルインスタンス（シングルトン）
+_clipboard_instance: Optional[Clipboard] = None
+
+
+def get_clipboard(root=None) -> Clipboard:
+    """クリップボードのシングルトンインスタンスを取得（最初の呼び出しで Tk ルートを登録）"""
+    global _clipboard_instance
+    if _clipboard_instance is None:
+        _clipboard_instance = Clipboard(root)
+        print(f"📋 クリップボード: {' → '.join(_clipboard_instance.backend_names)}")
+    return _clipboard_instance
+
+
+def _serve():
+    """ヘルパープロセス本体: 標準入力の JSON 行を Tk イベントループ内で処理"""
+    import tkinter as tk
+
+    try:
+        root = tk.Tk()
+        root.withdraw()
+    except tk.TclError as e:
+        print(json.dumps({"ok": False, "error": str(e)}), flush=True)
+        return
+    print(json.dumps({"ok": True}), flush=True)
+
+    def reply(message: dict):
+        sys.stdout.write(json.dumps(message, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+
+    def on_readable(*_):
+        line = sys.stdin.readline()
+        if not line:
+            root.destroy()
+            return
+        try:
+            request = json.loads(line)
+            if request["op"] == "paste":
+                try:
+                    text = root.clipboard_get()
+                except tk.TclError:
+                    text = ""
+                reply({"ok": True, "text": text})
+            elif request["op"] == "copy":
+                root.clipboard_clear()
+                root.clipboard_append(request["text"])
+                root.update_idletasks()
+                reply({"ok": True})
+            else:
+                reply({"ok": False, "error": f"unknown op: {request['op']}"})
+        except Exception as e:
+            reply({"ok": False, "error": str(e)})
+
+    # イベントループを回したまま要求を待つ（所有中のクリップボードを他アプリへ渡せるように）
+    root.tk.createfilehandler(sys.stdin, tk.READABLE, on_readable)
+    root.mainloop()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    arg_parser = argparse.ArgumentParser(description="クリップボードの貼り付けレイテンシ測定")
+    arg_parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    arg_parser.add_argument("--bench", type=int, default=100, help="各バックエンドの試行回数")
+    args = arg_parser.parse_args()
+
+    if args.serve:
+        _serve()
+        raise SystemExit(0)
+
+    import tkinter as tk
+
+    candidates: List[ClipboardBackend] = []
+    try:
+        tk_root = tk.Tk()
+        tk_root.withdraw()
+        candidates.append(TkClipboardBackend(tk_root))
+    except tk.TclError as e:
+        print(f"⚠️ Tk を使用できません: {e}")
+    if APPKIT_AVAILABLE:
+        candidates.append(NSPasteboardBackend())
+    candidates.append(HelperProcessBackend())
+    if PYPERCLIP_AVAILABLE:
+        candidates.append(PyperclipBackend())
+
+    sample = "Hello, world. こんにちは、世界。" * 4
+    for backend in candidates:
+        try:
+            backend.copy(sample)
+            backend.paste()  # ヘルパーの起動などの初回コストを除く
+            latencies = []
+            for _ in range(args.bench):
+                start = time.perf_counter()
+                text = backend.paste()
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            ok = "✅" if text == sample else "⚠️ 内容不一致"
+            print(f"{ok} {backend.name:12s} paste p50={latencies[len(latencies) // 2]:.3f}ms "
+                  f"p99={latencies[int(len(latencies) * 0.99)]:.3f}ms")
+        except Exception as e:
+            print(f"❌ {backend.name:12s} 使用不可: {e}")
+        finally:
+            if isinstance(backend, HelperProcessBackend):
+                backend.close()
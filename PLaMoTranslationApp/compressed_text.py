@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 辞書付き圧縮によるテキスト列の保存
+
+翻訳メモリや履歴に溜まる短い日英の文は、1件ずつ普通に圧縮してもほとんど縮まない
+（ヘッダと、まだ何も学習していない状態の符号化が支配的なため）。ここでは保存済みの文から
+辞書を1度だけ作り、それを前提に各行を圧縮する。辞書は同じデータベースの
+compression_dicts 表に保存し、各値の先頭に辞書 ID を付けるので、辞書を作り直しても
+古い行はそのまま読める。
+
+値の形式: [方式 u8][辞書ID u16][本文]
+    0: 非圧縮 UTF-8（辞書 ID なし。短すぎて縮まない場合）
+    1: zlib の生 deflate + プリセット辞書（標準ライブラリのみ）
+    2: zstd + 学習済み辞書（zstandard がある場合）
+
+文字列のまま保存された値（圧縮導入前の行）はそのまま返す。
+
+測定:
+    python3 compressed_text.py                            # 合成した日英コーパス
+    python3 compressed_text.py --db ~/.plamo_translator/history.sqlite3 --table history
+"""
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional, Union
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_NAMES = {CODEC_ZLIB: "zlib", CODEC_ZSTD: "zstd"}
+
+# この件数の文が集まったら辞書を作る
+TRAIN_SAMPLES = int(os.environ.get("PLAMO_COMPRESS_TRAIN_SAMPLES", "1000"))
+# 圧縮を無効化（PLAMO_COMPRESS=0）
+COMPRESSION_ENABLED = os.environ.get("PLAMO_COMPRESS", "1") != "0"
+
+_ZLIB_DICT_BYTES = 32 * 1024  # deflate の窓の大きさ
+_ZSTD_DICT_BYTES = 64 * 1024
+_ZLIB_LEVEL = 9
+_HEADER = struct.Struct(">BH")
+
+StoredValue = Union[str, bytes, None]
+
+
+def _train_zlib(samples: List[str]) -> bytes:
+    """zlib のプリセット辞書: 重複を除いた文を新しいものほど後ろに並べる（近い距離ほど短く符号化される）"""
+    seen = set()
+    parts = []
+    size = 0
+    for text in reversed(samples):
+        if text in seen:
+            continue
+        seen.add(text)
+        data = text.encode("utf-8")
+        parts.append(data)
+        size += len(data)
+        if size >= _ZLIB_DICT_BYTES:
+            break
+    return b"".join(reversed(parts))[-_ZLIB_DICT_BYTES:]
+
+
+class _Dictionary:
+    """1つの圧縮辞書と、それを使う圧縮器・伸張器"""
+
+    def __init__(self, dict_id: int, codec: int, data: bytes):
+        self.id = dict_id
+        self.codec = codec
+        self.data = data
+        self._lock = threading.Lock()
+        if codec == CODEC_ZSTD:
+            zdict = zstandard.ZstdCompressionDict(data)
+            self._compressor = zstandard.ZstdCompressor(
+                level=9, dict_data=zdict, write_checksum=False, write_dict_id=False
+            )
+            self._decompressor = zstandard.ZstdDecompressor(dict_data=zdict)
+        else:
+            # 辞書を読み込んだ状態の圧縮器を複製して使う（辞書の再読み込みを省く）
+            self._primed = zlib.compressobj(_ZLIB_LEVEL, zlib.DEFLATED, -15, 8, zlib.Z_DEFAULT_STRATEGY, data)
+
+    def compress(self, data: bytes) -> bytes:
+        with self._lock:
+            if self.codec == CODEC_ZSTD:
+                return self._compressor.compress(data)
+            compressor = self._primed.copy()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        if self.codec == CODEC_ZSTD:
+            with self._lock:
+                return self._decompressor.decompress(data)
+        return zlib.decompressobj(-15, self.data).decompress(data)
+
+
+class CompressedText:
+    """SQLite のテキスト列を辞書付きで圧縮・伸張する
+
+    conn は辞書表の作成と、辞書が無い間の学習用サンプルの読み出しに使う。
+    他のプロセスが作った辞書は path から開いた別接続で読み込む。
+    """
+
+    def __init__(self, conn: sqlite3.Connection, path: str, sample_sql: Optional[str] = None,
+                 enabled: bool = COMPRESSION_ENABLED):
+        self.path = path
+        self.enabled = enabled
+        self._conn = conn
+        self._lock = threading.Lock()
+        self._dicts: Dict[int, _Dictionary] = {}
+        self._current: Optional[_Dictionary] = None
+        self._samples: List[str] = []
+        self._dict_conn: Optional[sqlite3.Connection] = None
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS compression_dicts ("
+                " id INTEGER PRIMARY KEY,"
+                " codec INTEGER NOT NULL,"
+                " data BLOB NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+        for dict_id, codec, data in conn.execute("SELECT id, codec, data FROM compression_dicts ORDER BY id"):
+            self._add_dictionary(dict_id, codec, data)
+        if self._current is None and sample_sql:
+            # 圧縮導入前の行があれば、それから辞書を作る
+            for row in conn.execute(sample_sql):
+                self._samples.extend(value for value in row if isinstance(value, str))
+            self._maybe_train()
+
+    @property
+    def codec_name(self) -> str:
+        return CODEC_NAMES.get(self._current.codec, "none") if self._current else "none"
+
+    def _add_dictionary(self, dict_id: int, codec: int, data: bytes) -> Optional[_Dictionary]:
+        if codec == CODEC_ZSTD and not ZSTD_AVAILABLE:
+            print("⚠️ zstd で圧縮された行がありますが zstandard がインストールされていません")
+            return None
+        dictionary = self._dicts[dict_id] = _Dictionary(dict_id, codec, bytes(data))
+        # 手元で使える最新の辞書で圧縮する
+        if self._current is None or dict_id > self._current.id:
+            if codec == CODEC_ZSTD or not ZSTD_AVAILABLE:
+                self._current = dictionary
+        return dictionary
+
+    def _maybe_train(self):
+        if not self.enabled or self._current is not None or len(self._samples) < TRAIN_SAMPLES:
+            return
+        samples, self._samples = self._samples, []
+        codec, data = CODEC_ZLIB, None
+        if ZSTD_AVAILABLE:
+            try:
+                data = zstandard.train_dictionary(
+                    _ZSTD_DICT_BYTES, [s.encode("utf-8") for s in samples]
+                ).as_bytes()
+                codec = CODEC_ZSTD
+            except zstandard.ZstdError as e:
+                print(f"⚠️ zstd 辞書の学習に失敗（zlib を使用）: {e}")
+        if data is None:
+            data = _train_zlib(samples)
+        # 呼び出し側のトランザクション内なら、その確定に合わせて保存される
+        outer = self._conn.in_transaction
+        cursor = self._conn.execute(
+            "INSERT INTO compression_dicts (codec, data, created) VALUES (?, ?, ?)",
+            (codec, data, time.time())
+        )
+        if not outer:
+            self._conn.commit()
+        self._add_dictionary(cursor.lastrowid, codec, data)
+        print(f"🗜️ 圧縮辞書を作成: {CODEC_NAMES[codec]} {len(data) // 1024}KB（{len(samples)}件から）")
+
+    def encode(self, text: str) -> StoredValue:
+        """保存用の値（辞書ができるまでは文字列のまま）"""
+        if not self.enabled:
+            return text
+        with self._lock:
+            if self._current is None:
+                self._samples.append(text)
+                self._maybe_train()
+                if self._current is None:
+                    return text
+            dictionary = self._current
+        raw = text.encode("utf-8")
+        packed = dictionary.compress(raw)
+        if len(packed) + _HEADER.size >= len(raw) + 1:
+            return bytes([CODEC_RAW]) + raw
+        return _HEADER.pack(dictionary.codec, dictionary.id) + packed
+
+    def decode(self, value: StoredValue) -> Optional[str]:
+        """保存された値を文字列に戻す"""
+        if value is None or isinstance(value, str):
+            return value
+        value = bytes(value)
+        if value[0] == CODEC_RAW:
+            return value[1:].decode("utf-8")
+        _, dict_id = _HEADER.unpack_from(value)
+        dictionary = self._dicts.get(dict_id) or self._load(dict_id)
+        return dictionary.decompress(value[_HEADER.size:]).decode("utf-8")
+
+    def _load(self, dict_id: int) -> _Dictionary:
+        """他のプロセスが作った辞書を読み込む"""
+        with self._lock:
+            if dict_id in self._dicts:
+                return self._dicts[dict_id]
+            if self._dict_conn is None:
+                self._dict_conn = self._conn if self.path == ":memory:" else sqlite3.connect(
+                    self.path, check_same_thread=False
+                )
+            row = self._dict_conn.execute(
+                "SELECT codec, data FROM compression_dicts WHERE id = ?", (dict_id,)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"圧縮辞書 {dict_id} が見つかりません")
+            dictionary = self._add_dictionary(dict_id, row[0], row[1])
+            if dictionary is None:
+                raise ValueError(f"圧縮辞書 {dict_id} は zstandard が必要です")
+            return dictionary
+
+    def register_function(self, conn: sqlite3.Connection, name: str = "plamo_text"):
+        """SQL から伸張できるように関数を登録（トリガーや LIKE 検索用）"""
+        conn.create_function(name, 1, self.decode, deterministic=True)
+
+    def recompress(self, conn: sqlite3.Connection, table: str, columns: Iterable[str],
+                   batch: int = 1000) -> int:
+        """圧縮導入前の行（文字列のまま）を現在の辞書で圧縮し直し、更新件数を返す"""
+        columns = list(columns)
+        if self._current is None:
+            return 0
+        condition = " OR ".join(f"typeof({c}) = 'text'" for c in columns)
+        updated = 0
+        while True:
+            rows = conn.execute(
+                f"SELECT rowid, {', '.join(columns)} FROM {table} WHERE {condition} LIMIT ?", (batch,)
+            ).fetchall()
+            if not rows:
+                return updated
+            with conn:
+                conn.executemany(
+                    f"UPDATE {table} SET {', '.join(f'{c} = ?' for c in columns)} WHERE rowid = ?",
+                    [tuple(self.encode(self.decode(v)) for v in row[1:]) + (row[0],) for row in rows]
+                )
+            updated += len(rows)
+
+
+def measure(texts: List[str], store: CompressedText) -> Dict[str, float]:
+    """圧縮率と1件あたりの圧縮・伸張時間"""
+    raw_bytes = sum(len(t.encode("utf-8")) for t in texts)
+    start = time.perf_counter()
+    encoded = [store.encode(t) for t in texts]
+    encode_us = (time.perf_counter() - start) / len(texts) * 1e6
+    start = time.perf_counter()
+    for value, text in zip(encoded, texts):
+        assert store.decode(value) == text
+    decode_us = (time.perf_counter() - start) / len(texts) * 1e6
+    stored_bytes = sum(len(v) if isinstance(v, bytes) else len(v.encode("utf-8")) for v in encoded)
+    plain_zlib = sum(len(zlib.compress(t.encode("utf-8"), _ZLIB_LEVEL)) for t in texts)
+    return {
+        "entries": len(texts),
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+        "ratio": stored_bytes / raw_bytes if raw_bytes else 1.0,
+        "plain_zlib_ratio": plain_zlib / raw_bytes if raw_bytes else 1.0,
+        "encode_us": encode_us,
+        "decode_us": decode_us,
+    }
+
+
+def _synthetic_corpus(count: int, seed: int = 3) -> List[str]:
+    """日英の短い文（定型的な言い回しと語彙を組み合わせた合成データ）"""
+    import random
+
+    gen = random.Random(seed)
+    subjects = ["The server", "This update", "Our team", "The new version", "The translation engine",
+                "Your request", "The application", "The meeting", "The document", "This feature"]
+    verbs = ["has been deployed", "will be released", "was reviewed", "needs to be restarted",
+             "is running slowly", "has improved significantly", "was postponed", "requires approval"]
+    tails = ["today.", "next week.", "before the meeting.", "on all workstations.", "after the last change.",
+             "in the production environment.", "by the end of the month.", "for the Tokyo office."]
+    ja_subjects = ["サーバーは", "今回の更新は", "私たちのチームは", "新しいバージョンでは", "翻訳エンジンは",
+                   "アプリケーションは", "会議は", "資料は", "この機能は"]
+    ja_tails = ["本日リリースされました。", "来週公開される予定です。", "会議の前に確認してください。",
+                "再起動が必要です。", "動作が遅くなっています。", "大幅に改善されました。",
+                "延期されました。", "承認が必要です。", "月末までに対応します。"]
+    words = [f"{gen.choice('bcdfghklmnprstvz')}{gen.choice('aeiou')}{gen.choice('nrst')}" * gen.randint(1, 3)
+             for _ in range(3000)]
+    texts = []
+    for _ in range(count // 2):
+        extra = " ".join(gen.choice(words) for _ in range(gen.randint(0, 6)))
+        texts.append(f"{gen.choice(subjects)} {gen.choice(verbs)} {extra} {gen.choice(tails)}".replace("  ", " "))
+        number = gen.randint(1, 500)
+        texts.append(f"{gen.choice(ja_subjects)}{number}件の{gen.choice(words)}について{gen.choice(ja_tails)}")
+    return texts
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="辞書付き圧縮の圧縮率・読み出し時間の測定")
+    arg_parser.add_argument("--entries", type=int, default=20000, help="合成コーパスの件数")
+    arg_parser.add_argument("--db", help="既存の履歴・翻訳メモリのデータベースで測定")
+    arg_parser.add_argument("--table", default="history", help="--db の表（history / segments）")
+    arg_parser.add_argument("--recompress", action="store_true",
+                            help="--db の圧縮導入前の行を圧縮し直し、ファイルサイズの変化を表示")
+    args = arg_parser.parse_args()
+
+    if args.db and args.recompress:
+        conn = sqlite3.connect(args.db)
+        store = CompressedText(
+            conn, args.db, sample_sql=f"SELECT source, target FROM {args.table} ORDER BY rowid DESC LIMIT 2000"
+        )
+        before = os.path.getsize(args.db)
+        updated = store.recompress(conn, args.table, ["source", "target"])
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        after = os.path.getsize(args.db)
+        print(f"🗜️ {updated}件を圧縮: {before / 1024:.0f}KB → {after / 1024:.0f}KB（ファイル全体）")
+        raise SystemExit(0)
+
+    if args.db:
+        source = sqlite3.connect(args.db)
+        existing = CompressedText(source, args.db)
+        texts = [existing.decode(value) for row in source.execute(
+            f"SELECT source, target FROM {args.table} ORDER BY rowid DESC LIMIT ?", (args.entries,)
+        ) for value in row]
+    else:
+        texts = _synthetic_corpus(args.entries)
+
+    # 先頭の一部で辞書を作り、残りで測る（学習に使っていない文で評価）
+    train, evaluate = texts[:TRAIN_SAMPLES], texts[TRAIN_SAMPLES:] or texts
+    memory = sqlite3.connect(":memory:")
+    store = CompressedText(memory, ":memory:")
+    for text in train:
+        store.encode(text)
+    report = measure(evaluate, store)
+    print(f"📦 {report['entries']}件 {report['raw_bytes'] / 1024:.0f}KB → {report['stored_bytes'] / 1024:.0f}KB"
+          f"（{report['ratio']:.0%}、辞書なし zlib では {report['plain_zlib_ratio']:.0%}）方式={store.codec_name}")
+    print(f"⏱️ 1件あたり 圧縮 {report['encode_us']:.1f}µs / 伸張 {report['decode_us']:.1f}µs")
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - インプロセス推論の連続バッチ処理（continuous batching）
+
+StreamingTranslator の各リクエストが別々に generate を回すと、同時リクエストは
+直列になるか、それぞれがバッチ化されないデコードループを回すことになる。
+ここでは1本のスケジューラスレッドがデコードの1ステップごとに系列を追加・退出させ、
+実行中のすべての系列の次トークンを1回の forward でまとめて求める。
+生成したトークンは系列ごとに呼び出し元へストリーミングで返す。
+
+同時に保持する系列数（= KVキャッシュの量）は PLAMO_MAX_CONCURRENT_SEQS で制限し、
+超えた分は待ち行列で待つ。各系列の KV キャッシュは系列ごとに持ち、ステップごとに
+左詰めのパディングでバッチにまとめる（ページングはしない）。標準的な KV キャッシュを
+返すモデル（GPT-2 / Llama 系など）が対象で、それ以外のキャッシュ形式のモデルは
+probe() で検出して従来の1リクエスト1 generate に戻す。既定の pfnet/plamo-2-translate は
+Mamba 層の状態を含むキャッシュを使うため対象外。
+
+ベンチマーク（同時リクエスト数ごとのスループット）:
+    python3 continuous_batching.py --model sshleifer/tiny-gpt2
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import torch
+    import torch.nn.functional as F
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+try:
+    from transformers import DynamicCache
+except ImportError:
+    DynamicCache = None
+
+# 同時に生成する系列の上限
+DEFAULT_MAX_CONCURRENT_SEQS = int(os.environ.get("PLAMO_MAX_CONCURRENT_SEQS", "8"))
+DEFAULT_MAX_NEW_TOKENS = 1024
+
+_FINISHED = object()
+
+
+def _to_legacy(cache):
+    """モデルが返したキャッシュを ((key, value), ...) の形にする（扱えない形式はそのまま返す）"""
+    if hasattr(cache, "to_legacy_cache"):
+        return cache.to_legacy_cache()
+    layers = getattr(cache, "layers", None)
+    if layers is not None:
+        # transformers 5 以降の Cache は層ごとに keys / values を持つ
+        if all(getattr(layer, "keys", None) is not None and getattr(layer, "values", None) is not None
+               for layer in layers):
+            return tuple((layer.keys, layer.values) for layer in layers)
+    return cache
+
+
+def _from_legacy(past):
+    if DynamicCache is None:
+        return past
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(past)
+    return DynamicCache(past)
+
+
+class GenerationRequest:
+    """生成中の1系列（stream() で出力を順に受け取る）"""
+
+    def __init__(self, prompt: str, max_new_tokens: int, stop_marker: Optional[str],
+                 cancel: Optional[threading.Event]):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.stop_marker = stop_marker
+        self.cancel = cancel or threading.Event()
+        self.generated: List[int] = []
+        self.finish_reason: Optional[str] = None
+        self.submitted_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # エンジンのスレッドだけが触る状態
+        self.past = None
+        self.length = 0
+        self.next_token: Optional[int] = None
+        self._emitted = 0
+        self._chunks: "queue.Queue" = queue.Queue()
+
+    @property
+    def done(self) -> bool:
+        return self.finish_reason is not None
+
+    def stream(self) -> Iterator[str]:
+        """生成されたテキストを順に返す（エンジン側のエラーはここで送出）"""
+        while True:
+            item = self._chunks.get()
+            if item is _FINISHED:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def _emit(self, text: str):
+        if text:
+            self._chunks.put(text)
+
+    def _finish(self, reason: str, error: Optional[BaseException] = None):
+        if self.done:
+            return
+        self.finish_reason = reason
+        self.finished_at = time.perf_counter()
+        self.past = None
+        if error is not None:
+            self._chunks.put(error)
+        self._chunks.put(_FINISHED)
+
+
+class ContinuousBatchingEngine:
+    """デコードのステップごとに系列を出し入れするバッチ生成エンジン"""
+
+    def __init__(
+        self,
+        model,
+        tokenizer,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT_SEQS,
+        max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
+        stop_marker: Optional[str] = None
+    ):
+        if not TORCH_AVAILABLE:
+            raise ImportError("torch not available")
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_new_tokens = max_new_tokens
+        self.stop_marker = stop_marker
+        self.eos_token_id = tokenizer.eos_token_id
+        self._waiting: deque = deque()
+        self._active: List[GenerationRequest] = []
+        self._cond = threading.Condition()
+        self._running = True
+        self._stats = {"steps": 0, "tokens": 0, "batched_tokens": 0, "max_batch": 0, "completed": 0}
+        self._thread = threading.Thread(target=self._loop, name="plamo-batching", daemon=True)
+        self._thread.start()
+
+    # --- 呼び出し側 ---
+
+    def submit(self, prompt: str, max_new_tokens: Optional[int] = None,
+               cancel: Optional[threading.Event] = None) -> GenerationRequest:
+        """生成を依頼（空きがなければ待ち行列に入り、次のステップ以降に開始）"""
+        request = GenerationRequest(prompt, max_new_tokens or self.max_new_tokens, self.stop_marker, cancel)
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("batching engine stopped")
+            self._waiting.append(request)
+            self._cond.notify()
+        return request
+
+    def generate(self, prompt: str, max_new_tokens: Optional[int] = None) -> str:
+        return "".join(self.submit(prompt, max_new_tokens).stream())
+
+    def stop(self):
+        """スケジューラを止め、待機中・生成中の系列を終了させる"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            stats = dict(self._stats)
+            stats["waiting"] = len(self._waiting)
+            stats["active"] = len(self._active)
+        stats["mean_batch"] = stats["batched_tokens"] / stats["steps"] if stats["steps"] else 0.0
+        return stats
+
+    def probe(self) -> bool:
+        """モデルのキャッシュがこのエンジンで扱える形式か（短い入力で1ステップ試す）"""
+        inputs = self.tokenizer("probe", return_tensors="pt")
+        with torch.inference_mode():
+            out = self.model(input_ids=inputs["input_ids"], use_cache=True)
+        past = _to_legacy(out.past_key_values)
+        try:
+            return all(len(layer) == 2 and layer[0].dim() == 4 for layer in past)
+        except (TypeError, AttributeError):
+            return False
+
+    # --- スケジューラスレッド ---
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._waiting and not self._active:
+                    self._cond.wait()
+                if not self._running:
+                    break
+                admitted = []
+                while self._waiting and len(self._active) + len(admitted) < self.max_concurrent:
+                    admitted.append(self._waiting.popleft())
+            for request in admitted:
+                self._prefill(request)
+            self._retire()
+            if self._active:
+                try:
+                    self._decode_step()
+                except Exception as e:
+                    for request in self._active:
+                        request._finish("error", e)
+                self._retire()
+
+        with self._cond:
+            pending = list(self._waiting) + self._active
+            self._waiting.clear()
+            self._active = []
+        for request in pending:
+            request._finish("stopped", RuntimeError("batching engine stopped"))
+
+    def _retire(self):
+        """終了・取り消しされた系列を外し、KV キャッシュを解放する"""
+        for request in self._active:
+            if request.cancel.is_set():
+                request._finish("cancelled")
+        finished = [r for r in self._active if r.done]
+        if finished:
+            with self._cond:
+                self._active = [r for r in self._active if not r.done]
+                self._stats["completed"] += len(finished)
+
+    def _prefill(self, request: GenerationRequest):
+        """プロンプトを1回の forward で処理し、最初のトークンを決める"""
+        if request.cancel.is_set():
+            request._finish("cancelled")
+            return
+        try:
+            prompt_ids = self.tokenizer(request.prompt)["input_ids"]
+            with torch.inference_mode():
+                out = self.model(input_ids=torch.tensor([prompt_ids]), use_cache=True)
+            request.past = _to_legacy(out.past_key_values)
+            request.length = len(prompt_ids)
+            token = int(out.logits[0, -1].argmax())
+        except Exception as e:
+            request._finish("error", e)
+            return
+        with self._cond:
+            self._active.append(request)
+        self._accept(request, token)
+
+    def _decode_step(self):
+        """実行中のすべての系列を左詰めでそろえ、次のトークンを1回の forward で求める"""
+        active = [r for r in self._active if not r.done]
+        if not active:
+            return
+        max_len = max(r.length for r in active)
+        past = []
+        for layer in range(len(active[0].past)):
+            keys, values = [], []
+            for request in active:
+                key, value = request.past[layer]
+                pad = max_len - request.length
+                if pad:
+                    key = F.pad(key, (0, 0, pad, 0))
+                    value = F.pad(value, (0, 0, pad, 0))
+                keys.append(key)
+                values.append(value)
+            past.append((torch.cat(keys), torch.cat(values)))
+
+        attention_mask = torch.zeros(len(active), max_len + 1, dtype=torch.long)
+        for i, request in enumerate(active):
+            attention_mask[i, max_len - request.length:] = 1
+        with torch.inference_mode():
+            out = self.model(
+                input_ids=torch.tensor([[r.next_token] for r in active]),
+                past_key_values=_from_legacy(tuple(past)),
+                attention_mask=attention_mask,
+                position_ids=torch.tensor([[r.length] for r in active]),
+                use_cache=True
+            )
+        new_past = _to_legacy(out.past_key_values)
+        next_tokens = out.logits[:, -1].argmax(-1).tolist()
+
+        with self._cond:
+            self._stats["steps"] += 1
+            self._stats["batched_tokens"] += len(active)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(active))
+        for i, request in enumerate(active):
+            pad = max_len - request.length
+            request.past = tuple((key[i:i + 1, :, pad:], value[i:i + 1, :, pad:]) for key, value in new_past)
+            request.length += 1
+            self._accept(request, next_tokens[i])
+
+    def _accept(self, request: GenerationRequest, token: int):
+        """トークンを系列に追加し、確定したテキストを流す（停止マーカー・EOS・上限で終了）"""
+        if request.first_token_at is None:
+            request.first_token_at = time.perf_counter()
+        if self.eos_token_id is not None and token == self.eos_token_id:
+            self._flush(request, self._decode(request))
+            request._finish("eos")
+            return
+        request.generated.append(token)
+        request.next_token = token
+        with self._cond:
+            self._stats["tokens"] += 1
+
+        text = self._decode(request)
+        marker = request.stop_marker
+        if marker:
+            stop = text.find(marker, max(0, request._emitted - len(marker)))
+            if stop >= 0:
+                self._flush(request, text[:stop])
+                request._finish("stop")
+                return
+        if len(request.generated) >= request.max_new_tokens:
+            self._flush(request, text)
+            request._finish("length")
+            return
+        # 停止マーカーの途中や、バイト列の途中で切れた文字は保留する
+        safe = len(text) - (len(marker) - 1 if marker else 0)
+        while safe > request._emitted and text[safe - 1] == "�":
+            safe -= 1
+        self._flush(request, text[:safe])
+
+    def _decode(self, request: GenerationRequest) -> str:
+        return self.tokenizer.decode(request.generated, skip_special_tokens=False)
+
+    @staticmethod
+    def _flush(request: GenerationRequest, text: str):
+        if len(text) > request._emitted:
+            request._emit(text[request._emitted:])
+            request._emitted = len(text)
+
+
+if __name__ == "__main__":
+    import argparse
+    import statistics
+
+    arg_parser = argparse.ArgumentParser(description="連続バッチ処理のスループット測定（小型CPUモデル）")
+    arg_parser.add_argument("--model", default="sshleifer/tiny-gpt2")
+    arg_parser.add_argument("--requests", type=int, default=32)
+    arg_parser.add_argument("--max-new-tokens", type=int, default=64)
+    arg_parser.add_argument("--concurrency", default="1,2,4,8,16")
+    arg_parser.add_argument("--threads", type=int, default=None)
+    args = arg_parser.parse_args()
+
+    if not TORCH_AVAILABLE:
+        print("❌ torch/transformers がインストールされていません")
+        raise SystemExit(1)
+
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    bench_tokenizer = AutoTokenizer.from_pretrained(args.model)
+    bench_model = AutoModelForCausalLM.from_pretrained(args.model).eval()
+    prompts = [f"Request {i}: please translate the following sentence about item {i}." for i in range(args.requests)]
+
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        engine = ContinuousBatchingEngine(bench_model, bench_tokenizer, max_concurrent=concurrency,
+                                          max_new_tokens=args.max_new_tokens)
+        # 出力長をそろえて比較するため EOS では止めない
+        engine.eos_token_id = None
+        engine.generate("warmup", 4)
+        latencies: List[float] = []
+        latency_lock = threading.Lock()
+        work = deque(prompts)
+
+        def client():
+            while True:
+                with latency_lock:
+                    if not work:
+                        return
+                    prompt = work.popleft()
+                request = engine.submit(prompt)
+                for _ in request.stream():
+                    pass
+                with latency_lock:
+                    latencies.append(request.finished_at - request.submitted_at)
+
+        start = time.perf_counter()
+        clients = [threading.Thread(target=client) for _ in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        stats = engine.stats()
+        engine.stop()
+        print(f"🧮 同時{concurrency:>2}系列: {args.requests * args.max_new_tokens / elapsed:8.0f} tokens/s / "
+              f"p50 {statistics.median(latencies) * 1000:.0f}ms / 平均バッチ {stats['mean_batch']:.1f}")
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - CPU向けインプロセス推論バックエンド
+
+Apple silicon / GPU のないマシン向けに、PLaMoTranslationChain と同じ
+stream_translate / translate インターフェースを提供する。
+Linear層を torch の動的int8量子化で置き換え、スレッド数を固定して実行する。
+
+ベンチマーク（bf16 と int8 の tokens/sec と出力品質の比較）:
+    python3 cpu_backend.py --model pfnet/plamo-2-translate
+    python3 cpu_backend.py --model sshleifer/tiny-gpt2   # 小型代替モデル
+"""
+import os
+import threading
+import time
+from typing import Iterator, List, Optional
+
+try:
+    import torch
+    from transformers import (
+        AutoModelForCausalLM, AutoTokenizer, StoppingCriteriaList, TextIteratorStreamer
+    )
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+DEFAULT_MODEL = os.environ.get("PLAMO_CPU_MODEL", "pfnet/plamo-2-translate")
+DEFAULT_THREADS = int(os.environ.get("PLAMO_CPU_THREADS", "0")) or None
+# shared_weights.export_mmap_weights で書き出した重み（プロセス間で共有）
+DEFAULT_WEIGHTS_PATH = os.environ.get("PLAMO_CPU_WEIGHTS") or None
+# int8 動的量子化の有無（mmap の重みは量子化しないときだけ使うため、PLAMO_CPU_WEIGHTS があれば既定で無効）
+DEFAULT_QUANTIZE = os.environ.get("PLAMO_CPU_QUANTIZE", "0" if DEFAULT_WEIGHTS_PATH else "1") != "0"
+# 連続バッチ処理で同時に生成する系列数（1 なら従来どおり1リクエストずつ generate）
+DEFAULT_MAX_CONCURRENT = int(os.environ.get("PLAMO_MAX_CONCURRENT_SEQS", "1"))
+
+# plamo-2-translate のプロンプト形式
+PROMPT_TEMPLATE = (
+    "<|plamo:op|>dataset\n"
+    "translation\n"
+    "<|plamo:op|>input lang={source_lang}\n"
+    "{text}\n"
+    "<|plamo:op|>output lang={target_lang}\n"
+)
+STOP_MARKER = "<|plamo:op|>"
+
+_interop_configured = False
+
+
+def configure_threads(threads: Optional[int]):
+    """推論スレッド数を固定（プロセス全体に効くため1ワーカー1プロセス前提）"""
+    global _interop_configured
+    if not threads:
+        return
+    torch.set_num_threads(threads)
+    if not _interop_configured:
+        # set_num_interop_threads は最初の並列処理前に1度だけ呼べる
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+        _interop_configured = True
+
+
+class _StopOnEvent:
+    """停止マーカー検出時に generate を打ち切るための StoppingCriteria"""
+
+    def __init__(self, event: threading.Event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool)
+
+
+class CPUTranslationChain:
+    """動的int8量子化モデルによるCPU翻訳チェーン"""
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        quantize: bool = DEFAULT_QUANTIZE,
+        threads: Optional[int] = DEFAULT_THREADS,
+        max_new_tokens: int = 1024,
+        weights_path: Optional[str] = DEFAULT_WEIGHTS_PATH,
+        max_concurrent: int = DEFAULT_MAX_CONCURRENT
+    ):
+        if not TORCH_AVAILABLE:
+            raise ImportError("torch/transformers not available")
+
+        configure_threads(threads)
+        self.model_name = model_name
+        self.quantize = quantize
+        self.threads = threads
+        self.max_new_tokens = max_new_tokens
+        self.weights_path = weights_path
+        if weights_path and quantize:
+            print("⚠️ int8量子化が有効なため PLAMO_CPU_WEIGHTS の重みは使用しません")
+        self.max_concurrent = max_concurrent
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+        self.model = None
+        self._generate_lock = threading.Lock()
+        self._batching = None
+        self.load_model()
+
+    @property
+    def is_model_loaded(self) -> bool:
+        return self.model is not None
+
+    def load_model(self):
+        """モデル重みを読み込む（release後の再読み込みにも使う）"""
+        if self.model is not None:
+            return
+        if self.weights_path and not self.quantize:
+            # 読み取り専用の mmap で読み込み、ワーカー間でページを共有する
+            from shared_weights import load_mmap_model
+            self.model = load_mmap_model(self.model_name, self.weights_path)
+            self._start_batching()
+            return
+        # 動的量子化は float32 の Linear が対象。非量子化時は bf16 で読み込む
+        dtype = torch.float32 if self.quantize else torch.bfloat16
+        model = AutoModelForCausalLM.from_pretrained(
+            self.model_name,
+            torch_dtype=dtype,
+            trust_remote_code=True,
+            low_cpu_mem_usage=True
+        )
+        model.eval()
+        if self.quantize:
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        self.model = model
+        self._start_batching()
+
+    def _start_batching(self):
+        """同時生成数が2以上なら連続バッチ処理エンジンを起動（非対応のモデルでは使わない）"""
+        if self.max_concurrent <= 1 or self.model is None:
+            return
+        from continuous_batching import ContinuousBatchingEngine
+        engine = ContinuousBatchingEngine(
+            self.model, self.tokenizer, self.max_concurrent, self.max_new_tokens, stop_marker=STOP_MARKER
+        )
+        try:
+            supported = engine.probe()
+        except Exception as e:
+            print(f"⚠️ 連続バッチ処理の確認に失敗: {e}")
+            supported = False
+        if supported:
+            self._batching = engine
+            print(f"🧮 連続バッチ処理: 最大{self.max_concurrent}系列")
+        else:
+            engine.stop()
+            print("⚠️ このモデルのキャッシュ形式は連続バッチ処理に非対応のため、1リクエストずつ生成します")
+
+    def release(self):
+        """モデル重みだけを解放（トークナイザは保持）"""
+        with self._generate_lock:
+            engine, self._batching = self._batching, None
+            self.model = None
+        if engine is not None:
+            engine.stop()
+
+    def _build_inputs(self, text: str, source_lang: str, target_lang: str):
+        prompt = PROMPT_TEMPLATE.format(text=text, source_lang=source_lang, target_lang=target_lang)
+        return self.tokenizer(prompt, return_tensors="pt")
+
+    def _generate_kwargs(self, inputs, streamer=None, stop_event=None):
+        kwargs = dict(
+            inputs,
+            max_new_tokens=self.max_new_tokens,
+            do_sample=False,
+            pad_token_id=self.tokenizer.pad_token_id or self.tokenizer.eos_token_id
+        )
+        if streamer is not None:
+            kwargs["streamer"] = streamer
+        if stop_event is not None:
+            kwargs["stopping_criteria"] = StoppingCriteriaList([_StopOnEvent(stop_event)])
+        return kwargs
+
+    def stream_translate(self, text: str, source_lang: str, target_lang: str) -> Iterator[str]:
+        """ストリーミング翻訳（チャンクを順次yield）"""
+        # 解放スレッドが途中で属性を消しても同じエンジンを使い続けるよう、1度だけ読む
+        engine = self._batching
+        if engine is not None:
+            yield from self._stream_batched(engine, text, source_lang, target_lang)
+            return
+        inputs = self._build_inputs(text, source_lang, target_lang)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=False)
+        stop_event = threading.Event()
+        errors: List[BaseException] = []
+
+        def _run():
+            try:
+                with self._generate_lock, torch.inference_mode():
+                    if self.model is None:
+                        raise RuntimeError("モデルが解放されています")
+                    self.model.generate(**self._generate_kwargs(inputs, streamer, stop_event))
+            except BaseException as e:
+                errors.append(e)
+                # generate が例外で終わっても読み手のループを終わらせる
+                streamer.end()
+
+        thread = threading.Thread(target=_run, daemon=True)
+        thread.start()
+
+        # 停止マーカーをまたいだ出力を防ぐため、マーカー長ぶんだけ保留する
+        pending = ""
+        exhausted = False
+        try:
+            for chunk in streamer:
+                pending += chunk
+                stop = pending.find(STOP_MARKER)
+                if stop >= 0:
+                    stop_event.set()
+                    if stop:
+                        yield pending[:stop]
+                    break
+                safe = len(pending) - len(STOP_MARKER)
+                if safe > 0:
+                    yield pending[:safe]
+                    pending = pending[safe:]
+            else:
+                exhausted = True
+                if errors:
+                    raise errors[0]
+                if pending:
+                    yield pending
+        finally:
+            # 打ち切り（呼び出し側の close() を含む）後に残ったチャンクを読み捨てて
+            # 生成スレッドを終了させる
+            stop_event.set()
+            if not exhausted:
+                for _ in streamer:
+                    pass
+            thread.join()
+
+    def _stream_batched(self, engine, text: str, source_lang: str, target_lang: str) -> Iterator[str]:
+        """連続バッチ処理エンジン経由の生成（停止マーカーはエンジン側で処理）"""
+        prompt = PROMPT_TEMPLATE.format(text=text, source_lang=source_lang, target_lang=target_lang)
+        cancel = threading.Event()
+        request = engine.submit(prompt, cancel=cancel)
+        try:
+            yield from request.stream()
+        finally:
+            # 呼び出し側が close() した場合は次のステップで系列を外す
+            cancel.set()
+
+    def translate(self, text: str, source_lang: str, target_lang: str) -> str:
+        """同期翻訳"""
+        return "".join(self.stream_translate(text, source_lang, target_lang)).strip()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+
+# ベンチマーク用の固定テストセット（入力, 参照訳）
+BENCHMARK_SET = [
+    ("Hello world", "ハローワールド"),
+    ("The meeting has been moved to Thursday afternoon.", "会議は木曜日の午後に変更されました。"),
+    ("Please restart the application after updating the settings.", "設定を更新した後、アプリケーションを再起動してください。"),
+    ("This feature is not available on your current plan.", "この機能は現在のプランではご利用いただけません。"),
+    ("Thank you for your quick reply.", "早速のご返信ありがとうございます。"),
+]
+
+
+def chrf(hypothesis: str, reference: str, n: int = 6, beta: float = 2.0) -> float:
+    """文字n-gram F-score（chrF）"""
+    hypothesis = hypothesis.replace(" ", "")
+    reference = reference.replace(" ", "")
+    precisions: List[float] = []
+    recalls: List[float] = []
+    for k in range(1, n + 1):
+        hyp = {}
+        ref = {}
+        for i in range(len(hypothesis) - k + 1):
+            g = hypothesis[i:i + k]
+            hyp[g] = hyp.get(g, 0) + 1
+        for i in range(len(reference) - k + 1):
+            g = reference[i:i + k]
+            ref[g] = ref.get(g, 0) + 1
+        if not hyp or not ref:
+            continue
+        overlap = sum(min(c, ref.get(g, 0)) for g, c in hyp.items())
+        precisions.append(overlap / sum(hyp.values()))
+        recalls.append(overlap / sum(ref.values()))
+    if not precisions:
+        return 0.0
+    p = sum(precisions) / len(precisions)
+    r = sum(recalls) / len(recalls)
+    if p == 0 and r == 0:
+        return 0.0
+    b2 = beta * beta
+    return 100.0 * (1 + b2) * p * r / (b2 * p + r)
+
+
+def run_benchmark(model_name: str, threads: Optional[int], max_new_tokens: int) -> dict:
+    """bf16 と int8 のスループット・品質を比較"""
+    results = {}
+    outputs = {}
+    for label, quantize in (("bf16", False), ("int8", True)):
+        print(f"🚀 {label} モデルを読み込み中...")
+        chain = CPUTranslationChain(model_name, quantize=quantize, threads=threads,
+                                    max_new_tokens=max_new_tokens)
+        chain.translate("warmup", "English", "Japanese")
+
+        tokens = 0
+        elapsed = 0.0
+        outputs[label] = []
+        for source, _ in BENCHMARK_SET:
+            start = time.perf_counter()
+            translated = chain.translate(source, "English", "Japanese")
+            elapsed += time.perf_counter() - start
+            tokens += max(chain.count_tokens(translated), 1)
+            outputs[label].append(translated)
+
+        scores = [chrf(out, ref) for out, (_, ref) in zip(outputs[label], BENCHMARK_SET)]
+        results[label] = {
+            "tokens_per_sec": tokens / elapsed if elapsed else 0.0,
+            "chrf_vs_reference": sum(scores) / len(scores),
+        }
+        del chain
+
+    agreement = [chrf(q, b) for q, b in zip(outputs["int8"], outputs["bf16"])]
+    results["int8"]["chrf_vs_bf16"] = sum(agreement) / len(agreement)
+    results["speedup"] = (results["int8"]["tokens_per_sec"] / results["bf16"]["tokens_per_sec"]
+                          if results["bf16"]["tokens_per_sec"] else 0.0)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    arg_parser = argparse.ArgumentParser(description="CPUバックエンド ベンチマーク (bf16 vs int8)")
+    arg_parser.add_argument("--model", default=DEFAULT_MODEL)
+    arg_parser.add_argument("--threads", type=int, default=DEFAULT_THREADS)
+    arg_parser.add_argument("--max-new-tokens", type=int, default=64)
+    args = arg_parser.parse_args()
+
+    if not TORCH_AVAILABLE:
+        print("❌ torch/transformers がインストールされていません")
+        raise SystemExit(1)
+
+    print(json.dumps(run_benchmark(args.model, args.threads, args.max_new_tokens),
+                     ensure_ascii=False, indent=2))
@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 入力長に応じた期限と停止検出
+
+固定のタイムアウトでは長文が必ず失敗し、途中まで翻訳された結果も失われる。
+ここでは以下の2つで打ち切りを判断し、打ち切った場合も途中結果を返す。
+
+- 期限: バックエンドごとに実測したスループット（起動時間と入力文字/秒）から
+  入力長に応じて算出する。実測値は翻訳のたびに指数移動平均で更新し保存する。
+- 停止検出: 一定時間まったく出力が進まなければ打ち切る（経過時間ではなく進捗で判断）。
+"""
+import codecs
+import json
+import os
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import profiling
+from scheduler import PRIORITY_INTERACTIVE, get_scheduler
+
+# 出力が進まない状態をこの秒数続けたら打ち切る
+DEFAULT_STALL_TIMEOUT = float(os.environ.get("PLAMO_STALL_TIMEOUT", "15"))
+# 期限 = 予測時間 × この倍率（ばらつきの吸収）
+DEADLINE_SAFETY = float(os.environ.get("PLAMO_DEADLINE_SAFETY", "3.0"))
+MIN_DEADLINE = 20.0
+MAX_DEADLINE = float(os.environ.get("PLAMO_MAX_DEADLINE", "900"))
+
+DEFAULT_THROUGHPUT_PATH = os.environ.get(
+    "PLAMO_THROUGHPUT_PATH",
+    os.path.expanduser("~/.plamo_translator/throughput.json")
+)
+
+# 打ち切りの理由
+REASON_STALL = "stall"
+REASON_DEADLINE = "deadline"
+
+# 実測前の初期値（起動秒数, 入力文字/秒）
+_DEFAULT_PROFILE = {"startup": 3.0, "chars_per_second": 40.0}
+# 1回の実測値として受け入れる範囲（出力がまとめて届いた場合などの外れ値を抑える）
+_STARTUP_RANGE = (0.0, 60.0)
+_CHARS_PER_SECOND_RANGE = (2.0, 2000.0)
+
+
+class DeadlineExceeded(Exception):
+    """期限切れまたは停止検出で打ち切った（partial に途中結果）"""
+
+    def __init__(self, reason: str, partial: str, elapsed: float, limit: float):
+        self.reason = reason
+        self.partial = partial
+        self.elapsed = elapsed
+        self.limit = limit
+        super().__init__(describe_expiry(reason, limit))
+
+
+def describe_expiry(reason: str, limit: float) -> str:
+    """打ち切り理由の表示用文字列"""
+    if reason == REASON_STALL:
+        return f"{limit:.0f}秒間応答がないため中断しました"
+    return f"制限時間 {limit:.0f}秒 を超えたため中断しました"
+
+
+class ThroughputEstimator:
+    """バックエンドごとの実測スループットから翻訳時間の期限を見積もる"""
+
+    def __init__(self, path: Optional[str] = DEFAULT_THROUGHPUT_PATH, alpha: float = 0.3):
+        self.path = path
+        self.alpha = alpha
+        self._lock = threading.Lock()
+        self._profiles: Dict[str, Dict[str, float]] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._profiles = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ スループット記録の読み込みに失敗: {e}")
+
+    def profile(self, backend: str) -> Dict[str, float]:
+        with self._lock:
+            return dict(self._profiles.get(backend, _DEFAULT_PROFILE))
+
+    def expected_seconds(self, backend: str, input_chars: int) -> float:
+        profile = self.profile(backend)
+        return profile["startup"] + input_chars / max(profile["chars_per_second"], 1e-3)
+
+    def deadline_for(self, backend: str, input_chars: int) -> float:
+        """入力長に応じた期限（秒）"""
+        expected = self.expected_seconds(backend, input_chars) * DEADLINE_SAFETY
+        return min(max(expected, MIN_DEADLINE), MAX_DEADLINE)
+
+    def record(self, backend: str, input_chars: int, first_output: float, total: float):
+        """完了した翻訳の実測値で見積もりを更新"""
+        if input_chars <= 0 or total <= 0:
+            return
+        # 出力がバッファされて一度に届くと first_output から完了までの時間はほぼ 0 になるため、
+        # スループットは全体の時間で求める（見積もりは長めになるが、期限が短くなりすぎない）
+        sample = {
+            "startup": min(max(first_output, _STARTUP_RANGE[0]), _STARTUP_RANGE[1]),
+            "chars_per_second": min(max(input_chars / total, _CHARS_PER_SECOND_RANGE[0]),
+                                    _CHARS_PER_SECOND_RANGE[1]),
+        }
+        with self._lock:
+            # 最初の実測値も初期値と混ぜる（1回の外れ値で見積もりが決まらないように）
+            current = self._profiles.setdefault(backend, dict(_DEFAULT_PROFILE))
+            for key, value in sample.items():
+                current[key] += self.alpha * (value - current[key])
+            snapshot = json.dumps(self._profiles)
+        self._save(snapshot)
+
+    def _save(self, snapshot: str):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(snapshot)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"⚠️ スループット記録の保存に失敗: {e}")
+
+
+class ProgressWatchdog:
+    """期限と出力の進捗を監視し、打ち切り時に on_expire(reason) を1度だけ呼ぶ"""
+
+    def __init__(
+        self,
+        deadline: float,
+        stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+        on_expire: Optional[Callable[[str], None]] = None
+    ):
+        self.deadline = deadline
+        self.stall_timeout = stall_timeout
+        self.on_expire = on_expire
+        self.reason: Optional[str] = None
+        self.started = time.monotonic()
+        self.first_progress: Optional[float] = None
+        self._last_progress = self.started
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+
+    def start(self) -> "ProgressWatchdog":
+        self.started = self._last_progress = time.monotonic()
+        self._thread.start()
+        return self
+
+    def progress(self):
+        """出力が進んだことを通知"""
+        now = time.monotonic()
+        if self.first_progress is None:
+            self.first_progress = now - self.started
+        self._last_progress = now
+
+    def stop(self):
+        self._stopped.set()
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def limit(self) -> float:
+        """打ち切り理由に対応する上限秒数"""
+        return self.stall_timeout if self.reason == REASON_STALL else self.deadline
+
+    def _watch(self):
+        interval = min(0.25, self.stall_timeout / 4)
+        while not self._stopped.wait(interval):
+            now = time.monotonic()
+            if now - self.started >= self.deadline:
+                self.reason = REASON_DEADLINE
+            elif now - self._last_progress >= self.stall_timeout:
+                self.reason = REASON_STALL
+            else:
+                continue
+            print(f"⏱️ {describe_expiry(self.reason, self.limit)}")
+            if self.on_expire:
+                self.on_expire(self.reason)
+            return
+
+
+def run_cli_streaming(
+    args: List[str],
+    input_text: str,
+    on_chunk: Optional[Callable[[str], None]] = None,
+    backend: str = "cli",
+    stall_timeout: float = DEFAULT_STALL_TIMEOUT,
+    estimator: Optional[ThroughputEstimator] = None,
+    priority: int = PRIORITY_INTERACTIVE
+) -> str:
+    """CLIをストリーミング実行し出力全体を返す
+
+    実行はエンジンスケジューラの枠を priority の順に確保してから行う
+    （期限は枠を確保した時点から数える）。
+
+    出力はパイプからまとめて読み（1文字ずつ読まない）、UTF-8 の途中で切れた
+    バイト列は次の読み取りまで保留する。期限切れ・停止検出ではプロセスを
+    終了させ、それまでの出力を持つ DeadlineExceeded を送出する。
+    """
+    with get_scheduler().slot(priority):
+        return _run_cli_streaming(args, input_text, on_chunk, backend, stall_timeout,
+                                  estimator or get_throughput_estimator())
+
+
+def _run_cli_streaming(
+    args: List[str],
+    input_text: str,
+    on_chunk: Optional[Callable[[str], None]],
+    backend: str,
+    stall_timeout: float,
+    estimator: ThroughputEstimator
+) -> str:
+    deadline = estimator.deadline_for(backend, len(input_text))
+    with profiling.span("backend.spawn"):
+        process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0
+        )
+    watchdog = ProgressWatchdog(deadline, stall_timeout, on_expire=lambda _: process.kill())
+
+    # 標準入力の書き込みと標準エラーの読み取りは別スレッドで行い、パイプ詰まりを防ぐ
+    def _write():
+        try:
+            process.stdin.write(input_text.encode("utf-8"))
+            process.stdin.close()
+        except OSError:
+            pass
+
+    stderr_parts: List[bytes] = []
+    writer = threading.Thread(target=_write, daemon=True)
+    reader = threading.Thread(target=lambda: stderr_parts.append(process.stderr.read()), daemon=True)
+    writer.start()
+    reader.start()
+    watchdog.start()
+
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    output: List[str] = []
+    fd = process.stdout.fileno()
+    try:
+        while True:
+            data = os.read(fd, 4096)
+            if not data:
+                break
+            text = decoder.decode(data)
+            if not text:
+                continue
+            profiling.mark("first_output")
+            watchdog.progress()
+            output.append(text)
+            if on_chunk:
+                on_chunk(text)
+        rest = decoder.decode(b"", final=True)
+        if rest:
+            output.append(rest)
+            if on_chunk:
+                on_chunk(rest)
+        return_code = process.wait()
+        profiling.mark("backend_exit")
+    finally:
+        watchdog.stop()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+    reader.join(timeout=1)
+
+    result = "".join(output)
+    if watchdog.reason:
+        raise DeadlineExceeded(watchdog.reason, result, watchdog.elapsed, watchdog.limit)
+    if return_code != 0:
+        stderr = b"".join(stderr_parts).decode("utf-8", errors="replace").strip()
+        raise RuntimeError(stderr or f"翻訳エラー (終了コード {return_code})")
+    if watchdog.first_progress is not None:
+        estimator.record(backend, len(input_text), watchdog.first_progress, watchdog.elapsed)
+    return result
+
+
+# グローバルインスタンス（シングルトン）
+_estimator_instance: Optional[ThroughputEstimator] = None
+
+
+def get_throughput_estimator() -> ThroughputEstimator:
+    """スループット推定器のシングルトンインスタンスを取得"""
+    global _estimator_instance
+    if _estimator_instance is None:
+        _estimator_instance = ThroughputEstimator()
+    return _estimator_instance
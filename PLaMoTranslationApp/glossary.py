@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 用語集（Aho–Corasick による用語の固定）
+
+製品名や専門用語を翻訳前にプレースホルダ（⟦0⟧ など）へ置き換えてモデルから守り、
+ストリーミング出力中のプレースホルダを用語集の訳語に戻す。
+用語の検出は Aho–Corasick オートマトン1回の走査、復元はチャンク単位の
+状態機械なので、どちらも入力長に比例する時間で終わる。
+
+用語集ファイル（TSV、1行1用語）:
+    PLaMo<TAB>PLaMo
+    pull request<TAB>プルリクエスト
+"""
+import os
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_GLOSSARY_PATH = os.environ.get(
+    "PLAMO_GLOSSARY_PATH",
+    os.path.expanduser("~/.plamo_translator/glossary.tsv")
+)
+
+PLACEHOLDER_OPEN = "⟦"
+PLACEHOLDER_CLOSE = "⟧"
+# 復元時に保留する最大文字数（⟦ + 数字 + ⟧）
+_MAX_PLACEHOLDER_LEN = 8
+_PLACEHOLDER_RE = re.compile(f"{PLACEHOLDER_OPEN}(\\d+){PLACEHOLDER_CLOSE}")
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isascii() and (ch.isalnum() or ch == "_")
+
+
+class AhoCorasick:
+    """複数パターンの一括検索（最左最長・重なりなし）"""
+
+    def __init__(self, patterns: Iterable[str], ignore_case: bool = True):
+        self.ignore_case = ignore_case
+        self.patterns: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[int] = [-1]       # この状態で終わるパターン
+        self._dict_link: List[int] = [0]  # 出力を持つ最長の失敗先
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str):
+        if not pattern:
+            return
+        key = pattern.lower() if self.ignore_case else pattern
+        state = 0
+        for ch in key:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(-1)
+                self._dict_link.append(0)
+            state = nxt
+        if self._out[state] < 0:
+            self._out[state] = len(self.patterns)
+            self.patterns.append(pattern)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                f = self._fail[nxt]
+                self._dict_link[nxt] = f if self._out[f] >= 0 else self._dict_link[f]
+
+    def find(self, text: str) -> List[Tuple[int, int, int]]:
+        """(開始, 終了, パターン番号) のリスト。最左最長で重なりを除く"""
+        haystack = text
+        if self.ignore_case:
+            lowered = text.lower()
+            # 小文字化で長さが変わる文字を含む場合は大文字小文字を区別して探す
+            if len(lowered) == len(text):
+                haystack = lowered
+
+        goto, fail, out, dict_link = self._goto, self._fail, self._out, self._dict_link
+        patterns = self.patterns
+        matches = []
+        state = 0
+        for end, ch in enumerate(haystack, 1):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            s = state if out[state] >= 0 else dict_link[state]
+            while s:
+                index = out[s]
+                matches.append((end - len(patterns[index]), end, index))
+                s = dict_link[s]
+
+        # 最左最長を優先して重なりを除去
+        matches.sort(key=lambda m: (m[0], m[0] - m[1]))
+        selected = []
+        last_end = 0
+        for start, end, index in matches:
+            if start < last_end:
+                continue
+            if not self._on_word_boundary(text, start, end):
+                continue
+            selected.append((start, end, index))
+            last_end = end
+        return selected
+
+    @staticmethod
+    def _on_word_boundary(text: str, start: int, end: int) -> bool:
+        """英数字の用語が単語の途中（例: Go と Google）で一致しないようにする"""
+        if _is_word_char(text[start]) and start > 0 and _is_word_char(text[start - 1]):
+            return False
+        if _is_word_char(text[end - 1]) and end < len(text) and _is_word_char(text[end]):
+            return False
+        return True
+
+
+class GlossaryRestorer:
+    """ストリーミング出力のプレースホルダを訳語に戻す状態機械"""
+
+    def __init__(self, targets: List[str]):
+        self.targets = targets
+        self._pending = ""
+
+    def feed(self, chunk: str) -> str:
+        """チャンクを受け取り、確定した出力を返す（途中のプレースホルダは保留）"""
+        if not self.targets:
+            return chunk
+        data = self._pending + chunk
+        self._pending = ""
+        out = []
+        pos = 0
+        while True:
+            open_at = data.find(PLACEHOLDER_OPEN, pos)
+            if open_at < 0:
+                out.append(data[pos:])
+                break
+            out.append(data[pos:open_at])
+            close_at = data.find(PLACEHOLDER_CLOSE, open_at + 1, open_at + _MAX_PLACEHOLDER_LEN)
+            if close_at < 0:
+                if len(data) - open_at < _MAX_PLACEHOLDER_LEN:
+                    # 閉じ括弧がまだ届いていない
+                    self._pending = data[open_at:]
+                    break
+                out.append(PLACEHOLDER_OPEN)
+                pos = open_at + 1
+                continue
+            out.append(self._resolve(data[open_at:close_at + 1]))
+            pos = close_at + 1
+        return "".join(out)
+
+    def finish(self) -> str:
+        """残りの保留分を出力"""
+        rest, self._pending = self._pending, ""
+        return rest
+
+    def _resolve(self, token: str) -> str:
+        match = _PLACEHOLDER_RE.fullmatch(token)
+        if match:
+            index = int(match.group(1))
+            if index < len(self.targets):
+                return self.targets[index]
+        return token
+
+
+class Glossary:
+    """用語ペアの集合（英→日と日→英の両方向で使う）"""
+
+    def __init__(self, pairs: Iterable[Tuple[str, str]] = (), ignore_case: bool = True):
+        self.forward: Dict[str, str] = {}
+        self.backward: Dict[str, str] = {}
+        for source, target in pairs:
+            if source and target:
+                self.forward.setdefault(source, target)
+                self.backward.setdefault(target, source)
+        self.ignore_case = ignore_case
+        self._automata: Dict[bool, AhoCorasick] = {}
+
+    def __len__(self) -> int:
+        return len(self.forward)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_GLOSSARY_PATH) -> "Glossary":
+        """TSVファイルから読み込む（存在しなければ空）"""
+        pairs = []
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.rstrip("\n")
+                    if not line or line.startswith("#"):
+                        continue
+                    parts = line.split("\t")
+                    if len(parts) >= 2:
+                        pairs.append((parts[0].strip(), parts[1].strip()))
+        return cls(pairs)
+
+    def _mapping(self, source_lang: str) -> Tuple[Dict[str, str], bool]:
+        # 用語集の1列目は英語、2列目は日本語
+        reverse = source_lang == "Japanese"
+        return (self.backward if reverse else self.forward), reverse
+
+    def _automaton(self, source_lang: str) -> AhoCorasick:
+        mapping, reverse = self._mapping(source_lang)
+        automaton = self._automata.get(reverse)
+        if automaton is None:
+            automaton = AhoCorasick(mapping.keys(), ignore_case=self.ignore_case)
+            self._automata[reverse] = automaton
+        return automaton
+
+    def protect(self, text: str, source_lang: str) -> Tuple[str, List[str]]:
+        """一致した用語をプレースホルダへ置換し、(置換後テキスト, 訳語リスト) を返す"""
+        if not self.forward:
+            return text, []
+        mapping, _ = self._mapping(source_lang)
+        automaton = self._automaton(source_lang)
+        parts = []
+        targets: List[str] = []
+        slots: Dict[str, int] = {}
+        last = 0
+        for start, end, index in automaton.find(text):
+            target = mapping[automaton.patterns[index]]
+            slot = slots.get(target)
+            if slot is None:
+                slot = slots[target] = len(targets)
+                targets.append(target)
+            parts.append(text[last:start])
+            parts.append(f"{PLACEHOLDER_OPEN}{slot}{PLACEHOLDER_CLOSE}")
+            last = end
+        if not targets:
+            return text, []
+        parts.append(text[last:])
+        return "".join(parts), targets
+
+    @staticmethod
+    def restore(text: str, targets: List[str]) -> str:
+        """一括出力のプレースホルダを訳語に戻す"""
+        restorer = GlossaryRestorer(targets)
+        return restorer.feed(text) + restorer.finish()
+
+
+# グローバルインスタンス（シングルトン）
+_glossary_instance: Optional[Glossary] = None
+
+
+def get_glossary() -> Glossary:
+    """用語集のシングルトンインスタンスを取得"""
+    global _glossary_instance
+    if _glossary_instance is None:
+        _glossary_instance = Glossary.load()
+        if len(_glossary_instance):
+            print(f"📘 用語集を読み込みました ({len(_glossary_instance)}語)")
+    return _glossary_instance
+
+
+if __name__ == "__main__":
+    import random
+    import time
+
+    gen = random.Random(0)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    terms = [("".join(gen.choice(letters) for _ in range(gen.randint(4, 12))).capitalize(),
+              f"用語{i}") for i in range(5000)]
+    glossary = Glossary(terms)
+
+    start = time.perf_counter()
+    glossary.protect("warmup", "English")
+    print(f"🔧 オートマトン構築: {len(terms)}語 {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    words = [t for t, _ in terms[:200]] + ["the", "a", "system", "update", "release", "is", "ready"] * 200
+    document = " ".join(gen.choice(words) for _ in range(200_000))
+    start = time.perf_counter()
+    protected, targets = glossary.protect(document, "English")
+    protect_ms = (time.perf_counter() - start) * 1000
+
+    restorer = GlossaryRestorer(targets)
+    start = time.perf_counter()
+    restored = "".join(restorer.feed(protected[i:i + 7]) for i in range(0, len(protected), 7))
+    restored += restorer.finish()
+    restore_ms = (time.perf_counter() - start) * 1000
+
+    print(f"📄 文書 {len(document) / 1e6:.1f}M文字: 保護 {protect_ms:.0f}ms, "
+          f"ストリーミング復元 {restore_ms:.0f}ms, 用語 {len(targets)}種")
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 共有グローバルホットキーエンジン
+
+システム全体のキー入力を1つの pynput リスナーで受け取り、
+Command(Ctrl)+C の連続押下を固定長リングバッファで検出する。
+全てのキー入力がこのコールバックを通るため、1イベントあたりの処理は
+属性参照と比較数回に抑えている（リスト再構築・ログ出力なし）。
+"""
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+try:
+    from pynput import keyboard
+    PYNPUT_AVAILABLE = True
+except ImportError:
+    keyboard = None
+    PYNPUT_AVAILABLE = False
+
+
+def _default_modifiers() -> frozenset:
+    """Command/Ctrl として扱うキーの集合"""
+    if not PYNPUT_AVAILABLE:
+        return frozenset()
+    names = ('cmd', 'cmd_l', 'cmd_r', 'ctrl', 'ctrl_l', 'ctrl_r')
+    return frozenset(getattr(keyboard.Key, n) for n in names if hasattr(keyboard.Key, n))
+
+
+class MultiPressDetector:
+    """固定長リングバッファによる連続押下検出"""
+
+    __slots__ = ('_times', '_size', '_index', 'window')
+
+    def __init__(self, presses: int = 2, window: float = 1.0):
+        if presses < 2:
+            raise ValueError("presses must be >= 2")
+        self._size = presses
+        self._times = [float('-inf')] * presses
+        self._index = 0
+        self.window = window
+
+    def press(self, now: float) -> bool:
+        """押下を記録し、window秒以内にpresses回揃ったらTrue"""
+        i = self._index
+        self._times[i] = now
+        i += 1
+        if i == self._size:
+            i = 0
+        self._index = i
+        # 次に上書きされるスロットが最も古い押下
+        if now - self._times[i] < self.window:
+            self.reset()
+            return True
+        return False
+
+    def reset(self):
+        """押下履歴をクリア"""
+        times = self._times
+        for i in range(self._size):
+            times[i] = float('-inf')
+
+
+class HotkeyEngine:
+    """単一リスナーで Command+C 連続押下を監視するエンジン"""
+
+    def __init__(
+        self,
+        presses: int = 2,
+        window: float = 1.0,
+        trigger_chars: Iterable[str] = ('c', '\x03'),
+        modifiers: Optional[Iterable] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.detector = MultiPressDetector(presses, window)
+        self.trigger_chars = frozenset(trigger_chars)
+        self.modifiers = frozenset(modifiers) if modifiers is not None else _default_modifiers()
+        self.clock = clock
+        self.listener = None
+        self._callbacks: List[Callable[[], None]] = []
+        self._held = 0
+        self._lock = threading.Lock()
+
+    def add_callback(self, callback: Callable[[], None]):
+        """連続押下検出時のコールバックを登録（リスナースレッドで呼ばれる）"""
+        with self._lock:
+            # コピーオンライト: イベント処理側はロック不要
+            self._callbacks = self._callbacks + [callback]
+
+    def remove_callback(self, callback: Callable[[], None]):
+        """コールバックの登録を解除"""
+        with self._lock:
+            self._callbacks = [cb for cb in self._callbacks if cb is not callback]
+
+    @property
+    def is_running(self) -> bool:
+        return self.listener is not None
+
+    def start(self):
+        """グローバルキーボード監視を開始（多重起動しない）"""
+        if not PYNPUT_AVAILABLE:
+            raise RuntimeError("pynput is not available")
+        with self._lock:
+            if self.listener is not None:
+                return
+            self.listener = keyboard.Listener(on_press=self._on_press, on_release=self._on_release)
+            self.listener.daemon = True
+            self.listener.start()
+
+    def stop(self):
+        """グローバルキーボード監視を停止"""
+        with self._lock:
+            listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+        self._held = 0
+        self.detector.reset()
+
+    def _on_press(self, key):
+        if key in self.modifiers:
+            self._held += 1
+            return
+        if self._held and getattr(key, 'char', None) in self.trigger_chars:
+            if self.detector.press(self.clock()):
+                self._fire()
+
+    def _on_release(self, key):
+        if key in self.modifiers and self._held:
+            self._held -= 1
+
+    def _fire(self):
+        for callback in self._callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️ ホットキーコールバックエラー: {e}")
+
+
+# グローバルインスタンス（シングルトン）
+_engine_instance = None
+
+
+def get_hotkey_engine() -> HotkeyEngine:
+    """ホットキーエンジンのシングルトンインスタンスを取得"""
+    global _engine_instance
+    if _engine_instance is None:
+        _engine_instance = HotkeyEngine()
+    return _engine_instance
+
+
+# マイクロベンチマーク: 1キー入力あたりのコールバックコスト
+if __name__ == "__main__":
+    class _Key:
+        """ベンチマーク用のキー代替"""
+        __slots__ = ('char',)
+
+        def __init__(self, char=None):
+            self.char = char
+
+    events = 1_000_000
+    cmd = _Key()
+    letters = [_Key(ch) for ch in "the quick brown fox jumps over the lazy dog"]
+    c_key = _Key('c')
+
+    def legacy_cost():
+        """旧実装（pressed_keys集合 + 2リスナー + 内包表記）の近似"""
+        pressed = set()
+        times = []
+
+        def on_down(key):
+            pressed.add(key)
+
+        def on_up(key):
+            if key in pressed:
+                pressed.remove(key)
+
+        def on_press(key):
+            if hasattr(key, 'char') and key.char == 'c':
+                if cmd in pressed:
+                    now = time.time()
+                    times.append(now)
+                    times[:] = [t for t in times if now - t < 1.0]
+
+        start = time.perf_counter()
+        for i in range(events):
+            key = letters[i % len(letters)]
+            on_down(key)
+            on_press(key)
+            on_up(key)
+        return (time.perf_counter() - start) / events
+
+    def engine_cost():
+        engine = HotkeyEngine(modifiers=[cmd])
+        on_press, on_release = engine._on_press, engine._on_release
+        start = time.perf_counter()
+        for i in range(events):
+            key = letters[i % len(letters)]
+            on_press(key)
+            on_release(key)
+        return (time.perf_counter() - start) / events
+
+    def engine_hotkey_cost():
+        engine = HotkeyEngine(modifiers=[cmd])
+        engine.add_callback(lambda: None)
+        on_press, on_release = engine._on_press, engine._on_release
+        start = time.perf_counter()
+        for _ in range(events // 4):
+            on_press(cmd)
+            on_press(c_key)
+            on_release(c_key)
+            on_release(cmd)
+        return (time.perf_counter() - start) / events
+
+    print(f"⏱️ 旧実装:               {legacy_cost() * 1e9:7.1f} ns/event")
+    print(f"⏱️ HotkeyEngine:         {engine_cost() * 1e9:7.1f} ns/event")
+    print(f"⏱️ HotkeyEngine(Cmd+C): {engine_hotkey_cost() * 1e9:7.1f} ns/event")
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 入力しながらのライブ翻訳
+
+キー入力をまとめて（デバウンス）、前回の翻訳から変わった文だけをエンジンに送る。
+文末記号を入力した時点と、入力が続いても一定時間ごとには待たずに翻訳する。
+新しい入力が来たら実行中の翻訳を取り消し、翻訳済みの文の訳はそのまま表示し続ける。
+編集中の文は、新しい訳が届くまで前回の訳を表示しておく（画面がちらつかない）。
+
+入力途中の文（文末記号で終わっていない文）の訳は翻訳メモリに登録しない。
+
+測定（スタブエンジンでタイピングを再現）:
+    python3 live_translate.py --chars 240
+"""
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from token_chunker import split_paragraphs, split_sentences
+
+# 最後のキー入力から翻訳を始めるまでの待ち時間
+DEFAULT_DEBOUNCE_MS = int(os.environ.get("PLAMO_LIVE_DEBOUNCE_MS", "350"))
+# 入力が続いていてもこの時間ごとには翻訳する
+DEFAULT_MAX_WAIT_MS = int(os.environ.get("PLAMO_LIVE_MAX_WAIT_MS", "1500"))
+# 文ごとの訳のキャッシュ件数
+_CACHE_SIZE = 512
+_SENTENCE_END_RE = re.compile(r"[。！？!?.][」』）)\"']*$")
+
+# translate_fn(文, 取り消しイベント, チャンクのコールバック) -> 訳（取り消されたら None）
+TranslateFn = Callable[[str, threading.Event, Callable[[str], None]], Optional[str]]
+# on_update(表示する断片の列)。断片は (テキスト, 確定済みか)
+UpdateFn = Callable[[List[Tuple[str, bool]]], None]
+
+
+def is_complete_sentence(sentence: str) -> bool:
+    return bool(_SENTENCE_END_RE.search(sentence.strip()))
+
+
+def split_live(text: str) -> List[Tuple[str, str]]:
+    """(文の本体, 後ろの空白) の列。前の空白は直前の文の後ろに含める"""
+    pieces: List[Tuple[str, str]] = []
+    lead = text[:len(text) - len(text.lstrip())]
+    if lead:
+        pieces.append(("", lead))
+    for paragraph in split_paragraphs(text[len(lead):]):
+        for sentence in split_sentences(paragraph):
+            core = sentence.rstrip()
+            pieces.append((core, sentence[len(core):]))
+    return pieces
+
+
+def _joiner(translation: str, trail: str) -> str:
+    """訳のあとに置く空白（改行は保ち、日本語の訳のあとには空白を入れない）"""
+    if "\n" in trail:
+        return "\n" * trail.count("\n")
+    if trail and translation[-1:].isascii():
+        return " "
+    return ""
+
+
+class LiveTranslator:
+    """キー入力ごとに schedule() を呼ぶと、デバウンスして変わった文だけを翻訳する
+
+    root（Tk）を渡すとタイマーと on_update は Tk のメインループで実行され、
+    省略するとタイマーはスレッド、on_update は翻訳スレッドから呼ばれる。
+    """
+
+    def __init__(
+        self,
+        translate_fn: TranslateFn,
+        on_update: UpdateFn,
+        root=None,
+        debounce_ms: int = DEFAULT_DEBOUNCE_MS,
+        max_wait_ms: int = DEFAULT_MAX_WAIT_MS
+    ):
+        self.translate_fn = translate_fn
+        self.on_update = on_update
+        self.root = root
+        self.debounce_ms = debounce_ms
+        self.max_wait_ms = max_wait_ms
+        self._waiting_since: Optional[float] = None
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        # タイマー・翻訳スレッド・呼び出し側から触る状態（キャッシュ・表示中の訳・統計など）を守る
+        self._lock = threading.RLock()
+        self._timer = None
+        self._pending_text: Optional[str] = None
+        self._last_text: Optional[str] = None
+        self._cancel: Optional[threading.Event] = None
+        self._shown: List[str] = []
+        self.stats: Dict[str, int] = {
+            "keystrokes": 0, "runs": 0, "cancelled": 0, "engine_calls": 0, "reused": 0, "chars_sent": 0,
+        }
+
+    # --- スケジューリング ---
+
+    def _call_later(self, delay_ms: int, fn: Callable[[], None]):
+        if self.root is not None:
+            return self.root.after(delay_ms, fn)
+        timer = threading.Timer(delay_ms / 1000, fn)
+        timer.daemon = True
+        timer.start()
+        return timer
+
+    def _cancel_timer(self):
+        if self._timer is None:
+            return
+        if self.root is not None:
+            self.root.after_cancel(self._timer)
+        else:
+            self._timer.cancel()
+        self._timer = None
+
+    def _post(self, fn: Callable[[], None]):
+        if self.root is not None:
+            self.root.after(0, fn)
+        else:
+            fn()
+
+    def schedule(self, text: str):
+        """入力が変わったときに呼ぶ（デバウンス後に run が実行される）"""
+        with self._lock:
+            self.stats["keystrokes"] += 1
+            self._pending_text = text
+            self._cancel_timer()
+            now = time.monotonic()
+            if self._waiting_since is None:
+                self._waiting_since = now
+            delay = self.debounce_ms
+            if is_complete_sentence(text) or (now - self._waiting_since) * 1000 >= self.max_wait_ms:
+                # 文が書き終わった・長く待たせている場合はすぐに翻訳する
+                delay = 0
+            self._timer = self._call_later(delay, self._fire)
+
+    def _fire(self):
+        with self._lock:
+            self._timer = None
+            self._waiting_since = None
+            text, self._pending_text = self._pending_text, None
+        if text is not None:
+            self.run(text)
+
+    def stop(self):
+        """待機中のタイマーと実行中の翻訳を取り消す"""
+        with self._lock:
+            self._cancel_timer()
+            self._waiting_since = None
+            self._last_text = None
+            if self._cancel is not None:
+                self._cancel.set()
+                self._cancel = None
+
+    # --- 翻訳 ---
+
+    def _cached(self, core: str) -> Optional[str]:
+        with self._lock:
+            translation = self._cache.get(core)
+            if translation is not None:
+                self._cache.move_to_end(core)
+            return translation
+
+    def _remember(self, core: str, translation: str):
+        with self._lock:
+            self._cache[core] = translation
+            self._cache.move_to_end(core)
+            while len(self._cache) > _CACHE_SIZE:
+                self._cache.popitem(last=False)
+
+    def run(self, text: str):
+        """text を翻訳する（実行中の古い翻訳は取り消す）"""
+        cancel = threading.Event()
+        with self._lock:
+            if text == self._last_text:
+                return
+            self._last_text = text
+            if self._cancel is not None:
+                self._cancel.set()
+                self.stats["cancelled"] += 1
+            self._cancel = cancel
+            self.stats["runs"] += 1
+        pieces = self.split(text)
+        threading.Thread(target=self._translate_pieces, args=(pieces, cancel), daemon=True).start()
+
+    def split(self, text: str) -> List[Tuple[str, str]]:
+        return split_live(text)
+
+    def _render(self, pieces: List[Tuple[str, str]], streaming: Optional[Tuple[int, str]] = None):
+        """確定した訳と、翻訳中の文の途中結果（なければ前回表示した訳）を並べて表示"""
+        out: List[Tuple[str, bool]] = []
+        shown: List[str] = []
+        with self._lock:
+            for index, (core, trail) in enumerate(pieces):
+                if not core:
+                    out.append((trail, True))
+                    shown.append("")
+                    continue
+                translation = self._cached(core)
+                stable = translation is not None
+                if not stable:
+                    if streaming is not None and streaming[0] == index and streaming[1]:
+                        translation = streaming[1]
+                    else:
+                        translation = self._shown[index] if index < len(self._shown) else ""
+                shown.append(translation)
+                if translation:
+                    out.append((translation + _joiner(translation, trail), stable))
+            self._shown = shown
+        self._post(lambda: self.on_update(out))
+
+    def _translate_pieces(self, pieces: List[Tuple[str, str]], cancel: threading.Event):
+        changed = [i for i, (core, _) in enumerate(pieces) if core and self._cached(core) is None]
+        with self._lock:
+            self.stats["reused"] += sum(1 for core, _ in pieces if core) - len(changed)
+        self._render(pieces)
+        for index in changed:
+            if cancel.is_set():
+                return
+            core = pieces[index][0]
+            partial: List[str] = []
+
+            def on_chunk(chunk: str, index=index):
+                if cancel.is_set():
+                    return
+                partial.append(chunk)
+                self._render(pieces, (index, "".join(partial).strip()))
+
+            with self._lock:
+                self.stats["engine_calls"] += 1
+                self.stats["chars_sent"] += len(core)
+            translation = self.translate_fn(core, cancel, on_chunk)
+            if translation is None or cancel.is_set():
+                return
+            self._remember(core, translation.strip())
+            self._render(pieces)
+
+
+def streaming_translate_fn(translator) -> TranslateFn:
+    """StreamingTranslator を LiveTranslator の translate_fn として使う"""
+    def translate(sentence: str, cancel: threading.Event, on_chunk: Callable[[str], None]) -> Optional[str]:
+        done = threading.Event()
+        result: List[Optional[str]] = [None]
+
+        def finish(text: Optional[str]):
+            result[0] = text
+            done.set()
+
+        translator.translate_streaming(
+            text=sentence,
+            chunk_callback=on_chunk,
+            complete_callback=finish,
+            error_callback=lambda error: finish(None),
+            partial_callback=lambda partial, reason: finish(None),
+            cancel=cancel,
+            remember=is_complete_sentence(sentence)
+        )
+        # 取り消されると translate_streaming はどのコールバックも呼ばないので、こちらでも待ちを止める
+        while not done.wait(0.05):
+            if cancel.is_set():
+                return None
+        return result[0]
+    return translate
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from mcp_stub import StubConfig
+
+    arg_parser = argparse.ArgumentParser(description="ライブ翻訳のシミュレーション（スタブエンジン）")
+    arg_parser.add_argument("--chars", type=int, default=240, help="タイプする文字数")
+    arg_parser.add_argument("--keystroke-ms", type=float, default=60)
+    arg_parser.add_argument("--debounce-ms", type=int, default=DEFAULT_DEBOUNCE_MS)
+    args = arg_parser.parse_args()
+
+    stub = StubConfig(latency_ms=80, per_char_ms=4)
+    engine_lock = threading.Lock()
+
+    def stub_translate(sentence: str, cancel: threading.Event, on_chunk) -> Optional[str]:
+        # エンジンは1つなので直列化し、8文字ごとにチャンクを返す
+        with engine_lock:
+            stub.sleep()
+            out = []
+            for start in range(0, len(sentence), 8):
+                if cancel.is_set():
+                    return None
+                stub.sleep(min(8, len(sentence) - start))
+                out.append(f"<{sentence[start:start + 8]}>")
+                on_chunk(out[-1])
+            return "".join(out)
+
+    class FullTextLive(LiveTranslator):
+        """比較用: 毎回全文を1文として翻訳する"""
+
+        def split(self, text: str) -> List[Tuple[str, str]]:
+            with self._lock:
+                self._cache.clear()
+            return [(text.strip(), "")]
+
+    source = ("Live mode translates while you type. Only sentences that changed are sent again. "
+              "Finished sentences keep their translation on screen. ") * 4
+    source = source[:args.chars]
+
+    for name, cls, debounce in (("毎キー・全文", FullTextLive, 0),
+                                (f"デバウンス{args.debounce_ms}ms・変更文のみ", LiveTranslator, args.debounce_ms)):
+        final = threading.Event()
+        last_update = [0.0]
+
+        def on_update(pieces, final=final, last_update=last_update):
+            last_update[0] = time.perf_counter()
+            if pieces and all(stable for _, stable in pieces):
+                final.set()
+
+        live = cls(stub_translate, on_update, debounce_ms=debounce)
+        for i in range(1, len(source) + 1):
+            final.clear()
+            live.schedule(source[:i])
+            time.sleep(args.keystroke_ms / 1000)
+        typed_at = time.perf_counter()
+        final.wait(30)
+        latency = (last_update[0] - typed_at) * 1000
+        stats = live.stats
+        print(f"⌨️ {name}: エンジン呼び出し {stats['engine_calls']}回 / 送信 {stats['chars_sent']}文字 / "
+              f"取り消し {stats['cancelled']}回 / 再利用 {stats['reused']}文 / 入力終了から確定まで {latency:.0f}ms")
+        live.stop()
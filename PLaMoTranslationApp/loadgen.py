@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - /mcp エンドポイントの負荷試験
+
+コーパスの各行を TranslationRequest として送り、レイテンシ（p50/p95/p99）、
+最初のトークンまでの時間、スループット、エラー率を JSON で出力する。
+
+- 同時実行数固定（--concurrency）: 各ワーカーが応答を待って次を送る
+- 到着率固定（--rate）: ポアソン到着で送信し、待ち時間も含めて計測する
+  （サーバーが遅れても送信予定時刻から測るため、遅延を過小評価しない）
+
+例:
+    python3 loadgen.py --stub --concurrency 8 --requests 500
+    python3 loadgen.py --url http://127.0.0.1:30000 --rate 5 --duration 60 --corpus corpus.txt
+"""
+import http.client
+import json
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from mcp_stub import MCP_PATH, StubConfig, StubServer, build_request, parse_url
+
+DEFAULT_CORPUS = [
+    "Hello, how are you today?",
+    "The quick brown fox jumps over the lazy dog.",
+    "Please review the pull request before the release.",
+    "Machine translation quality has improved significantly in recent years.",
+    "今日はいい天気ですね。",
+    "この資料を明日までに確認してください。",
+    "新しいバージョンでは起動時間が半分になりました。",
+]
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def _target_language(text: str) -> str:
+    has_japanese = any('\u3040' <= ch <= '\u30ff' or '\u4e00' <= ch <= '\u9fff' for ch in text)
+    return "English" if has_japanese else "Japanese"
+
+
+class _Result:
+    __slots__ = ("ok", "error", "latency", "ttft", "chars")
+
+    def __init__(self, ok: bool, latency: float, ttft: Optional[float] = None,
+                 chars: int = 0, error: Optional[str] = None):
+        self.ok = ok
+        self.latency = latency
+        self.ttft = ttft
+        self.chars = chars
+        self.error = error
+
+
+class LoadTester:
+    """/mcp への負荷生成と結果集計"""
+
+    def __init__(self, url: str, corpus: List[str], stream: bool = False, timeout: float = 60.0):
+        self.host, self.port = parse_url(url)
+        self.corpus = corpus
+        self.stream = stream
+        self.timeout = timeout
+        self._results: List[_Result] = []
+        self._lock = threading.Lock()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _send(self, conn: http.client.HTTPConnection, text: str, started: float) -> _Result:
+        """1リクエスト送信（started は計測の起点）"""
+        source_lang = "Japanese" if _target_language(text) == "English" else "English"
+        body = json.dumps(
+            build_request(text, source_lang, _target_language(text), stream=self.stream),
+            ensure_ascii=False
+        ).encode("utf-8")
+        conn.request("POST", MCP_PATH, body=body, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        if response.status != 200:
+            response.read()
+            return _Result(False, time.perf_counter() - started, error=f"http_{response.status}")
+
+        if not self.stream:
+            # 非ストリーミングでは応答ヘッダの到着を最初のトークンとみなす
+            ttft = time.perf_counter() - started
+            translated = json.loads(response.read())["translated_text"]
+            return _Result(True, time.perf_counter() - started, ttft, len(translated))
+
+        ttft = None
+        translated = ""
+        while True:
+            line = response.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if "delta" in message:
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+            else:
+                translated = message["translated_text"]
+        return _Result(True, time.perf_counter() - started, ttft, len(translated))
+
+    def _execute(self, conn: Optional[http.client.HTTPConnection], text: str, started: float):
+        """送信して結果を記録し、再利用できる接続を返す"""
+        if conn is None:
+            conn = self._connection()
+        try:
+            result = self._send(conn, text, started)
+        except (ConnectionError, http.client.HTTPException, OSError) as e:
+            kind = "timeout" if isinstance(e, TimeoutError) else "connection"
+            result = _Result(False, time.perf_counter() - started, error=kind)
+            conn.close()
+            conn = None
+        except (ValueError, KeyError):
+            result = _Result(False, time.perf_counter() - started, error="invalid_response")
+            conn.close()
+            conn = None
+        with self._lock:
+            self._results.append(result)
+        return conn
+
+    def run_closed(self, concurrency: int, requests: Optional[int], duration: Optional[float]) -> Dict:
+        """同時実行数固定で実行"""
+        counter = iter(range(requests)) if requests else None
+        counter_lock = threading.Lock()
+        stop_at = time.perf_counter() + duration if duration else None
+
+        def worker():
+            conn = None
+            while True:
+                if stop_at is not None and time.perf_counter() >= stop_at:
+                    break
+                if counter is not None:
+                    with counter_lock:
+                        index = next(counter, None)
+                    if index is None:
+                        break
+                else:
+                    index = random.randrange(len(self.corpus))
+                conn = self._execute(conn, self.corpus[index % len(self.corpus)], time.perf_counter())
+            if conn is not None:
+                conn.close()
+
+        return self._run_workers(worker, concurrency, {"mode": "closed", "concurrency": concurrency})
+
+    def run_open(self, rate: float, duration: float, max_in_flight: int) -> Dict:
+        """ポアソン到着（平均 rate 件/秒）で実行"""
+        arrivals: "queue.Queue" = queue.Queue()
+        gen = random.Random(0)
+
+        def worker():
+            conn = None
+            while True:
+                item = arrivals.get()
+                if item is None:
+                    break
+                scheduled, text = item
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                conn = self._execute(conn, text, scheduled)
+            if conn is not None:
+                conn.close()
+
+        def generate():
+            start = time.perf_counter()
+            at = start
+            index = 0
+            while at - start < duration:
+                at += gen.expovariate(rate)
+                arrivals.put((at, self.corpus[index % len(self.corpus)]))
+                index += 1
+            for _ in range(max_in_flight):
+                arrivals.put(None)
+
+        threading.Thread(target=generate, daemon=True).start()
+        return self._run_workers(worker, max_in_flight, {
+            "mode": "open", "rate": rate, "max_in_flight": max_in_flight
+        })
+
+    def _run_workers(self, worker, count: int, settings: Dict) -> Dict:
+        self._results = []
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - started, settings)
+
+    def report(self, elapsed: float, settings: Dict) -> Dict:
+        results = self._results
+        ok = [r for r in results if r.ok]
+        latencies = [r.latency * 1000 for r in ok]
+        ttfts = [r.ttft * 1000 for r in ok if r.ttft is not None]
+        errors = Counter(r.error for r in results if not r.ok)
+        return {
+            "settings": dict(settings, stream=self.stream, url=f"http://{self.host}:{self.port}"),
+            "requests": len(results),
+            "succeeded": len(ok),
+            "error_rate": (len(results) - len(ok)) / len(results) if results else 0.0,
+            "errors": dict(errors),
+            "duration_s": elapsed,
+            "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+            "throughput_chars_per_s": sum(r.chars for r in ok) / elapsed if elapsed else 0.0,
+            "latency_ms": {
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+                "max": max(latencies) if latencies else None,
+            },
+            "ttft_ms": {
+                "p50": percentile(ttfts, 0.50),
+                "p95": percentile(ttfts, 0.95),
+                "p99": percentile(ttfts, 0.99),
+            },
+        }
+
+
+def load_corpus(path: Optional[str]) -> List[str]:
+    if not path:
+        return list(DEFAULT_CORPUS)
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    if not lines:
+        raise SystemExit(f"❌ コーパスが空です: {path}")
+    return lines
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="/mcp エンドポイントの負荷試験")
+    arg_parser.add_argument("--url", default="http://127.0.0.1:30000")
+    arg_parser.add_argument("--stub", action="store_true", help="スタブサーバーを起動してそこに送る")
+    arg_parser.add_argument("--stub-latency-ms", type=float, default=50.0)
+    arg_parser.add_argument("--stub-per-char-ms", type=float, default=1.0)
+    arg_parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--corpus", help="1行1リクエストのテキストファイル")
+    arg_parser.add_argument("--concurrency", type=int, default=4)
+    arg_parser.add_argument("--requests", type=int, help="送信件数（同時実行数固定モード）")
+    arg_parser.add_argument("--rate", type=float, help="到着率（件/秒）。指定すると到着率固定モード")
+    arg_parser.add_argument("--duration", type=float, help="実行秒数")
+    arg_parser.add_argument("--stream", action="store_true", help="ストリーミング応答を要求")
+    arg_parser.add_argument("--timeout", type=float, default=60.0)
+    arg_parser.add_argument("--output", help="JSONの出力先（省略時は標準出力）")
+    args = arg_parser.parse_args()
+
+    stub = None
+    url = args.url
+    if args.stub:
+        stub = StubServer(config=StubConfig(
+            args.stub_latency_ms, args.stub_per_char_ms, args.stub_error_rate, seed=0
+        )).start()
+        url = stub.url
+
+    tester = LoadTester(url, load_corpus(args.corpus), stream=args.stream, timeout=args.timeout)
+    if args.rate:
+        report = tester.run_open(args.rate, args.duration or 30.0, max_in_flight=args.concurrency)
+    else:
+        requests = args.requests if args.requests or args.duration else 100
+        report = tester.run_closed(args.concurrency, requests, args.duration)
+
+    if stub is not None:
+        stub.stop()
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"📄 結果を保存: {args.output}")
+    else:
+        print(output)
@@ -0,0 +1,540 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 複数の翻訳サーバーへの /mcp ルーター
+
+Swift版 TranslationService と同じ /mcp 契約を受け付け、設定した複数のサーバーへ
+リクエストを振り分けるプロキシ。アプリ側は serverEndpoint をこのルーターに
+向けるだけで、複数台のエンジンをまとめて使える。
+
+- 振り分け: 処理中リクエスト数が最小のサーバー（同数なら平均レイテンシが短い方）
+- ヘルスチェック: GET /mcp を定期的に送り、応答しないサーバーを外す
+- サーキットブレーカー: 連続して失敗したサーバーを一定時間外し、その後1件だけ試す
+- ヘッジ: 最初のサーバーが直近の p95 を過ぎても応答しなければ、別のサーバーにも送り
+  先に返った方を採用する（ストリーミングは応答ヘッダが届くまでが対象）
+- 再試行: 接続エラーと 5xx は別のサーバーで再試行（4xx はそのまま返す）
+
+起動:
+    python3 mcp_router.py --port 30000 --backend http://10.0.0.2:30000 --backend http://10.0.0.3:30000
+    PLAMO_BACKENDS=http://10.0.0.2:30000,http://10.0.0.3:30000 python3 mcp_router.py
+    python3 mcp_router.py --demo   # ローカルのスタブサーバー4台で動作確認
+"""
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from mcp_stub import MCP_PATH, parse_url
+
+STATS_PATH = "/router/stats"
+
+# ヘルスチェック間隔（秒）
+HEALTH_INTERVAL = float(os.environ.get("PLAMO_ROUTER_HEALTH_INTERVAL", "2"))
+# この回数連続で失敗したらサーキットを開く
+FAILURE_THRESHOLD = int(os.environ.get("PLAMO_ROUTER_FAILURES", "3"))
+# サーキットを開いてから再び試すまでの秒数
+RESET_TIMEOUT = float(os.environ.get("PLAMO_ROUTER_RESET_TIMEOUT", "10"))
+# ヘッジまでの待ち時間(ms)。未設定なら直近レイテンシの p95
+HEDGE_MS = os.environ.get("PLAMO_HEDGE_MS")
+# 1リクエストで試すサーバー数の上限
+MAX_ATTEMPTS = int(os.environ.get("PLAMO_ROUTER_ATTEMPTS", "3"))
+BACKEND_TIMEOUT = float(os.environ.get("PLAMO_ROUTER_TIMEOUT", "120"))
+
+_HEDGE_MIN = 0.05
+_HEDGE_DEFAULT = 0.5
+_HEDGE_WARMUP = 20
+_LATENCY_SAMPLES = 200
+_EWMA_ALPHA = 0.2
+
+
+class CircuitBreaker:
+    """連続失敗でサーバーを一時的に外す"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, reset_timeout: float = RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """今リクエストを送ってよいか（状態は変えない）"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            return not self._probing
+
+    def acquire(self):
+        """送信を開始（開いている場合は半開にして試行を1件だけ通す）"""
+        with self._lock:
+            if self.state == self.OPEN:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"🔌 サーキットを開きました（連続失敗 {self.failures}回）")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class Backend:
+    """振り分け先の翻訳サーバー"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.host, self.port = parse_url(self.url)
+        self.breaker = CircuitBreaker()
+        self.healthy = True
+        self.outstanding = 0
+        self.latency = 0.0  # 成功したリクエストの EWMA（秒）
+        self.requests = 0
+        self.failures = 0
+        self.hedges = 0
+        self.wins = 0
+
+    def connection(self, timeout: float = BACKEND_TIMEOUT) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def record_latency(self, seconds: float):
+        self.latency = seconds if not self.latency else (
+            _EWMA_ALPHA * seconds + (1 - _EWMA_ALPHA) * self.latency
+        )
+
+    def stats(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit": self.breaker.state,
+            "outstanding": self.outstanding,
+            "latency_ms": self.latency * 1000,
+            "requests": self.requests,
+            "failures": self.failures,
+            "hedges": self.hedges,
+            "wins": self.wins,
+        }
+
+
+class _Attempt:
+    """1台のサーバーへの送信。非ストリーミングは本文まで、ストリーミングは応答ヘッダまで読む"""
+
+    def __init__(self, router: "Router", backend: Backend, body: bytes, stream: bool, hedge: bool):
+        self.router = router
+        self.backend = backend
+        self.body = body
+        self.stream = stream
+        self.hedge = hedge
+        self.conn: Optional[http.client.HTTPConnection] = None
+        self.response: Optional[http.client.HTTPResponse] = None
+        self.status = 0
+        self.headers: Dict[str, str] = {}
+        self.payload = b""
+        self.error: Optional[str] = None
+        self.elapsed = 0.0
+        self._released = False
+
+    @property
+    def retryable(self) -> bool:
+        return self.error is not None or self.status >= 500
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            self.conn = self.backend.connection()
+            self.conn.request("POST", MCP_PATH, body=self.body, headers={"Content-Type": "application/json"})
+            self.response = self.conn.getresponse()
+            self.status = self.response.status
+            self.headers = {"Content-Type": self.response.getheader("Content-Type", "application/json")}
+            if not self.stream or self.status != 200:
+                self.payload = self.response.read()
+        except (ConnectionError, http.client.HTTPException, OSError) as e:
+            self.error = f"{type(e).__name__}: {e}"
+        self.elapsed = time.perf_counter() - started
+        if self.error is not None or not self.stream or self.status != 200:
+            self.finish()
+
+    def finish(self, stream_error: bool = False):
+        """結果を記録して接続を閉じ、処理中の数を戻す（1度だけ）"""
+        if self._released:
+            return
+        self._released = True
+        if self.conn is not None:
+            self.conn.close()
+        self.router.release(self, stream_error)
+
+
+class Router:
+    """処理中リクエスト数最小のサーバーへ振り分け、失敗時は再試行・遅延時はヘッジする"""
+
+    def __init__(self, urls: List[str], hedge: bool = True, hedge_ms: Optional[float] = None,
+                 max_attempts: int = MAX_ATTEMPTS):
+        if not urls:
+            raise ValueError("バックエンドが1つも指定されていません")
+        self.backends = [Backend(url) for url in urls]
+        self.hedge = hedge and len(self.backends) > 1
+        self.hedge_delay_fixed = hedge_ms / 1000 if hedge_ms is not None else None
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # 非ストリーミングは応答完了まで、ストリーミングは応答ヘッダまでの時間
+        self._latencies = {False: deque(maxlen=_LATENCY_SAMPLES), True: deque(maxlen=_LATENCY_SAMPLES)}
+        self._stopped = threading.Event()
+        self.requests = 0
+        self.failed = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    # ---- 振り分け ----
+
+    def pick(self, exclude: List[Backend]) -> Optional[Backend]:
+        """処理中リクエスト数が最小の、送信可能なサーバーを選んで処理中に数える"""
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude and b.breaker.available()]
+            healthy = [b for b in candidates if b.healthy]
+            # 全台がヘルスチェックに落ちていても、サーキットが許すなら試す
+            pool = healthy or candidates
+            if not pool:
+                return None
+            backend = min(pool, key=lambda b: (b.outstanding, b.latency))
+            backend.breaker.acquire()
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, attempt: _Attempt, stream_error: bool = False):
+        backend = attempt.backend
+        with self._lock:
+            backend.outstanding -= 1
+        if attempt.retryable or stream_error:
+            backend.failures += 1
+            backend.breaker.record_failure()
+        else:
+            backend.breaker.record_success()
+            backend.record_latency(attempt.elapsed)
+
+    def hedge_delay(self, stream: bool) -> float:
+        if self.hedge_delay_fixed is not None:
+            return self.hedge_delay_fixed
+        samples = self._latencies[stream]
+        if len(samples) < _HEDGE_WARMUP:
+            return _HEDGE_DEFAULT
+        ordered = sorted(samples)
+        return max(_HEDGE_MIN, ordered[int(len(ordered) * 0.95)])
+
+    def _start(self, backend: Backend, body: bytes, stream: bool, hedge: bool,
+               results: "queue.Queue") -> _Attempt:
+        attempt = _Attempt(self, backend, body, stream, hedge)
+
+        def run():
+            attempt.run()
+            results.put(attempt)
+
+        threading.Thread(target=run, daemon=True).start()
+        return attempt
+
+    def forward(self, body: bytes, stream: bool) -> Optional[_Attempt]:
+        """リクエストを転送し、採用した試行を返す（全台失敗なら最後の失敗、送信先なしなら None）"""
+        with self._lock:
+            self.requests += 1
+        results: "queue.Queue[_Attempt]" = queue.Queue()
+        tried: List[Backend] = []
+        pending = 0
+        last_failure: Optional[_Attempt] = None
+        winner: Optional[_Attempt] = None
+        hedged = False
+
+        backend = self.pick(tried)
+        if backend is None:
+            with self._lock:
+                self.failed += 1
+            return None
+        tried.append(backend)
+        self._start(backend, body, stream, False, results)
+        pending = 1
+
+        while pending:
+            timeout = None
+            if self.hedge and not hedged and len(tried) < self.max_attempts:
+                timeout = self.hedge_delay(stream)
+            try:
+                attempt = results.get(timeout=timeout)
+            except queue.Empty:
+                # 応答が遅い: 別のサーバーにも同じリクエストを送る
+                hedged = True
+                backend = self.pick(tried)
+                if backend is not None:
+                    tried.append(backend)
+                    backend.hedges += 1
+                    with self._lock:
+                        self.hedges += 1
+                    self._start(backend, body, stream, True, results)
+                    pending += 1
+                continue
+            pending -= 1
+            if not attempt.retryable:
+                winner = attempt
+                break
+            last_failure = attempt
+            if pending == 0 and len(tried) < self.max_attempts:
+                backend = self.pick(tried)
+                if backend is not None:
+                    tried.append(backend)
+                    with self._lock:
+                        self.retries += 1
+                    self._start(backend, body, stream, False, results)
+                    pending = 1
+
+        if pending:
+            # 負けた試行は届き次第閉じる
+            threading.Thread(target=self._discard, args=(results, pending), daemon=True).start()
+        if winner is None:
+            with self._lock:
+                self.failed += 1
+            return last_failure
+        winner.backend.wins += 1
+        if winner.hedge:
+            with self._lock:
+                self.hedge_wins += 1
+        if winner.status == 200:
+            self._latencies[stream].append(winner.elapsed)
+        return winner
+
+    @staticmethod
+    def _discard(results: "queue.Queue", count: int):
+        for _ in range(count):
+            results.get().finish()
+
+    # ---- ヘルスチェック ----
+
+    def check_health(self):
+        for backend in self.backends:
+            try:
+                conn = backend.connection(timeout=1.0)
+                conn.request("GET", MCP_PATH)
+                response = conn.getresponse()
+                response.read()
+                conn.close()
+                # MCP サーバーは素の GET に 405 / 406 を返すことがあるため、5xx 以外は稼働中とみなす
+                # （TranslationService.swift の接続確認と同じ基準）
+                healthy = response.status < 500
+            except (ConnectionError, http.client.HTTPException, OSError):
+                healthy = False
+            if healthy != backend.healthy:
+                print(f"{'💚' if healthy else '💔'} {backend.url}: {'復帰' if healthy else '応答なし'}")
+            backend.healthy = healthy
+
+    def start_health_checks(self, interval: float = HEALTH_INTERVAL) -> "Router":
+        def loop():
+            while not self._stopped.wait(interval):
+                self.check_health()
+
+        self.check_health()
+        threading.Thread(target=loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "failed": self.failed,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_delay_ms": {
+                "json": self.hedge_delay(False) * 1000,
+                "stream": self.hedge_delay(True) * 1000,
+            },
+            "backends": [backend.stats() for backend in self.backends],
+        }
+
+
+class _RouterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "PLaMoRouter/1.0"
+    # ヘッダと本文を別々に書くため、keep-alive 接続で Nagle と遅延 ACK が重ならないようにする
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        self._send_bytes(status, json.dumps(body, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    def _send_bytes(self, status: int, data: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        router: Router = self.server.router
+        if self.path == STATS_PATH:
+            self._send_json(200, router.stats())
+        elif self.path == MCP_PATH:
+            healthy = any(b.healthy and b.breaker.available() for b in router.backends)
+            self._send_json(200 if healthy else 503, {
+                "status": "ok" if healthy else "unavailable",
+                "backends": [b.stats() for b in router.backends],
+            })
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.path != MCP_PATH:
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            stream = bool(json.loads(body).get("stream"))
+        except (ValueError, AttributeError):
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+
+        router: Router = self.server.router
+        attempt = router.forward(body, stream)
+        if attempt is None:
+            self._send_json(503, {"error": "no backend available"})
+            return
+        if attempt.error is not None:
+            self._send_json(502, {"error": attempt.error, "backend": attempt.backend.url})
+            return
+        if not stream or attempt.status != 200:
+            self._send_bytes(attempt.status, attempt.payload, attempt.headers["Content-Type"])
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", attempt.headers["Content-Type"])
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        stream_error = False
+        try:
+            while True:
+                line = attempt.response.readline()
+                if not line:
+                    break
+                self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (ConnectionError, http.client.HTTPException, OSError):
+            # 途中で切れた場合は再試行できない（送信済みのトークンがある）ので接続を閉じる
+            stream_error = True
+            self.close_connection = True
+        finally:
+            attempt.finish(stream_error)
+
+
+class RouterServer(ThreadingHTTPServer):
+    """ルーターの HTTP サーバー（port=0 で空きポートを使う）"""
+
+    daemon_threads = True
+
+    def __init__(self, router: Router, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _RouterHandler)
+        self.router = router
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "RouterServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.router.stop()
+        self.shutdown()
+        self.server_close()
+
+
+def _run_demo(requests: int, concurrency: int, stream: bool):
+    """通常2台・遅い1台・不安定な1台のスタブでヘッジあり/なしを比較"""
+    from loadgen import DEFAULT_CORPUS, LoadTester
+    from mcp_stub import StubConfig, StubServer
+
+    for hedge in (False, True):
+        stubs = [
+            StubServer(config=StubConfig(latency_ms=30, per_char_ms=0.5, seed=1)).start(),
+            StubServer(config=StubConfig(latency_ms=30, per_char_ms=0.5, seed=2)).start(),
+            # 遅いサーバー（テールの原因）
+            StubServer(config=StubConfig(latency_ms=30, per_char_ms=0.5, seed=3)).start(),
+            # 3割失敗する
+            StubServer(config=StubConfig(latency_ms=30, per_char_ms=0.5, error_rate=0.3, seed=4)).start(),
+        ]
+        slow = stubs[2]
+        slow.config.latency_ms = 800
+        router = Router([stub.url for stub in stubs], hedge=hedge).start_health_checks(0.5)
+        server = RouterServer(router).start()
+        report = LoadTester(server.url, list(DEFAULT_CORPUS), stream=stream).run_closed(
+            concurrency, requests, None
+        )
+        latency = report["latency_ms"]
+        print(f"\n{'🪄 ヘッジあり' if hedge else '➖ ヘッジなし'}: 成功 {report['succeeded']}/{report['requests']}"
+              f" p50={latency['p50']:.0f}ms p95={latency['p95']:.0f}ms p99={latency['p99']:.0f}ms")
+        stats = router.stats()
+        print(f"  再試行 {stats['retries']} / ヘッジ {stats['hedges']}（採用 {stats['hedge_wins']}）")
+        for backend in stats["backends"]:
+            print(f"  {backend['url']}: 送信 {backend['requests']} 採用 {backend['wins']}"
+                  f" 失敗 {backend['failures']} 回路 {backend['circuit']}")
+        server.stop()
+        for stub in stubs:
+            stub.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="複数の翻訳サーバーへの /mcp ルーター")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=30000)
+    arg_parser.add_argument("--backend", action="append", default=[], help="振り分け先（複数指定可）")
+    arg_parser.add_argument("--no-hedge", action="store_true", help="ヘッジを無効化")
+    arg_parser.add_argument("--hedge-ms", type=float, default=float(HEDGE_MS) if HEDGE_MS else None)
+    arg_parser.add_argument("--demo", action="store_true", help="ローカルのスタブサーバーで動作確認")
+    arg_parser.add_argument("--requests", type=int, default=300)
+    arg_parser.add_argument("--concurrency", type=int, default=8)
+    arg_parser.add_argument("--stream", action="store_true")
+    args = arg_parser.parse_args()
+
+    if args.demo:
+        _run_demo(args.requests, args.concurrency, args.stream)
+        raise SystemExit(0)
+
+    urls = args.backend or [u for u in os.environ.get("PLAMO_BACKENDS", "").split(",") if u.strip()]
+    if not urls:
+        raise SystemExit("❌ --backend または PLAMO_BACKENDS で振り分け先を指定してください")
+    router = Router(urls, hedge=not args.no_hedge, hedge_ms=args.hedge_ms).start_health_checks()
+    server = RouterServer(router, args.host, args.port)
+    print(f"🔀 ルーター起動: {server.url}{MCP_PATH} → {', '.join(b.url for b in router.backends)}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        router.stop()
+        server.server_close()
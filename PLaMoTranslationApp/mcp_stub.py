@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - /mcp エンドポイントのスタブサーバー
+
+Swift版 TranslationService と同じ JSON 契約（TranslationRequest / TranslationResponse）を
+話す翻訳サーバーの代わり。実エンジンなしで負荷試験やルーティングの確認に使う。
+遅延は「基本遅延 + 文字数 × 文字あたり遅延」で、エラー率も指定できる。
+
+リクエストに "stream": true を付けると、訳文を NDJSON の行
+（{"delta": "..."}、最後に TranslationResponse と同じ形の行）として
+チャンク転送で返す（最初のトークンまでの時間の測定用）。
+
+起動:
+    python3 mcp_stub.py --port 30000 --latency-ms 50 --per-char-ms 2
+"""
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+MCP_PATH = "/mcp"
+
+
+def build_request(text: str, source_lang: str, target_lang: str, stream: bool = False) -> dict:
+    """TranslationRequest（Models.swift）と同じ形のリクエスト本文"""
+    body = {
+        "messages": [{"role": "user", "content": text}],
+        "source_language": source_lang,
+        "target_language": target_lang,
+    }
+    if stream:
+        body["stream"] = True
+    return body
+
+
+def build_response(translated: str, source_lang: str, target_lang: str, processing_time: float) -> dict:
+    """TranslationResponse（Models.swift）と同じ形のレスポンス本文"""
+    return {
+        "translated_text": translated,
+        "source_language": source_lang,
+        "target_language": target_lang,
+        "processing_time": processing_time,
+    }
+
+
+def request_text(body: dict) -> str:
+    """リクエストの messages から翻訳対象のテキストを取り出す"""
+    messages = body.get("messages")
+    if not isinstance(messages, list) or not messages:
+        raise ValueError("messages is required")
+    content = messages[-1].get("content") if isinstance(messages[-1], dict) else None
+    if not isinstance(content, str):
+        raise ValueError("messages[-1].content must be a string")
+    return content
+
+
+def fake_translate(text: str, target_lang: str) -> str:
+    """スタブの訳文（文字数を保った決定的な変換）"""
+    return f"[{target_lang}] {text}"
+
+
+class StubConfig:
+    """スタブサーバーの遅延・エラー設定"""
+
+    def __init__(self, latency_ms: float = 50.0, per_char_ms: float = 1.0,
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.per_char_ms = per_char_ms
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def sleep(self, chars: int = 0):
+        """文字数ぶんの遅延（chars=0 なら基本遅延）。0ms なら sleep を呼ばない"""
+        delay = (self.per_char_ms * chars if chars else self.latency_ms) / 1000
+        if delay > 0:
+            time.sleep(delay)
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "PLaMoStub/1.0"
+    # ヘッダと本文を別々に書くため、keep-alive 接続で Nagle と遅延 ACK が重ならないようにする
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass  # リクエストごとのログは出さない
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != MCP_PATH:
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, {"status": "ok"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        if self.path != MCP_PATH:
+            self._send_json(404, {"error": "not found"})
+            return
+        try:
+            body = json.loads(raw)
+            text = request_text(body)
+        except (ValueError, AttributeError) as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        config: StubConfig = self.server.config
+        if config.should_fail():
+            self._send_json(500, {"error": "stub failure"})
+            return
+
+        started = time.perf_counter()
+        source_lang = body.get("source_language", "English")
+        target_lang = body.get("target_language", "Japanese")
+        translated = fake_translate(text, target_lang)
+        config.sleep()
+
+        if not body.get("stream"):
+            config.sleep(len(translated))
+            self._send_json(200, build_response(
+                translated, source_lang, target_lang, time.perf_counter() - started
+            ))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = 8
+        try:
+            for i in range(0, len(translated), step):
+                piece = translated[i:i + step]
+                config.sleep(len(piece))
+                self._write_chunk({"delta": piece})
+            self._write_chunk(build_response(
+                translated, source_lang, target_lang, time.perf_counter() - started
+            ))
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # クライアントが途中で切断した（ルーターのヘッジで負けた場合など）
+            self.close_connection = True
+
+    def _write_chunk(self, body: dict):
+        data = (json.dumps(body, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    """スタブ翻訳サーバー（port=0 で空きポートを使う）"""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[StubConfig] = None):
+        super().__init__((host, port), _StubHandler)
+        self.config = config or StubConfig()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubServer":
+        """バックグラウンドスレッドで起動"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def parse_url(url: str) -> Tuple[str, int]:
+    """http://host:port から (host, port) を取り出す"""
+    from urllib.parse import urlsplit
+    parts = urlsplit(url)
+    return parts.hostname or "127.0.0.1", parts.port or 80
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="/mcp スタブ翻訳サーバー")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=30000)
+    arg_parser.add_argument("--latency-ms", type=float, default=50.0)
+    arg_parser.add_argument("--per-char-ms", type=float, default=1.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    args = arg_parser.parse_args()
+
+    server = StubServer(args.host, args.port, StubConfig(args.latency_ms, args.per_char_ms, args.error_rate))
+    print(f"🧪 スタブサーバー起動: {server.url}{MCP_PATH}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - ストリーミング後処理パイプライン
+
+翻訳結果の整形（改行の圧縮、空白の除去、用語集の復元、BudouXによる文節分割）を
+チャンク単位の状態機械として実装する。各段は feed(chunk) で確定した出力だけを返し、
+判断に必要な最小限の文字だけを保留するため、ストリーミング中も整形済みの
+テキストを表示でき、完了時に全文を走査し直す必要がない。
+"""
+from typing import Iterator, List, Optional, Tuple
+
+import profiling
+from glossary import GlossaryRestorer
+
+# BudouX for adaptive Japanese text formatting (optional)
+try:
+    import budoux
+    BUDOUX_AVAILABLE = True
+    _budoux_parser = budoux.load_default_japanese_parser()
+except ImportError:
+    BUDOUX_AVAILABLE = False
+    _budoux_parser = None
+
+# 文節の区切り（表示時に極小スペースへ変換する）
+PHRASE_BREAK = "\u200b"
+
+_SENTENCE_ENDS = frozenset("。！？!?\n")
+
+
+class StreamStage:
+    """パイプラインの1段"""
+
+    def feed(self, chunk: str) -> str:
+        return chunk
+
+    def finish(self) -> str:
+        return ""
+
+
+class GlossaryStage(StreamStage):
+    """用語集プレースホルダの復元"""
+
+    def __init__(self, targets: List[str]):
+        self.restorer = GlossaryRestorer(targets)
+
+    def feed(self, chunk: str) -> str:
+        return self.restorer.feed(chunk)
+
+    def finish(self) -> str:
+        return self.restorer.finish()
+
+
+class NewlineCollapser(StreamStage):
+    """PLaMo が出力する二重改行を単一改行に変換（str.replace('\\n\\n', '\\n') と同じ結果）"""
+
+    def __init__(self):
+        self._run = 0
+
+    def feed(self, chunk: str) -> str:
+        out = []
+        run = self._run
+        for ch in chunk:
+            if ch == "\n":
+                run += 1
+                continue
+            if run:
+                out.append("\n" * ((run + 1) // 2))
+                run = 0
+            out.append(ch)
+        self._run = run
+        return "".join(out)
+
+    def finish(self) -> str:
+        run, self._run = self._run, 0
+        return "\n" * ((run + 1) // 2)
+
+
+class WhitespaceCleaner(StreamStage):
+    """先頭・末尾の空白と行末の空白を除去（str.strip() と行末 rstrip 相当）"""
+
+    def __init__(self):
+        self._pending = ""
+        self._started = False
+
+    def feed(self, chunk: str) -> str:
+        out = []
+        pending = self._pending
+        for ch in chunk:
+            if ch.isspace():
+                if ch == "\n":
+                    # 行末の空白は捨てて改行だけ保留
+                    pending = pending.rstrip(" \t　") + ch
+                else:
+                    pending += ch
+                continue
+            if pending:
+                if self._started:
+                    out.append(pending)
+                pending = ""
+            self._started = True
+            out.append(ch)
+        self._pending = pending
+        return "".join(out)
+
+    def finish(self) -> str:
+        # 末尾の空白・改行は出力しない
+        self._pending = ""
+        return ""
+
+
+class PhraseSegmenter(StreamStage):
+    """BudouX で文節境界に PHRASE_BREAK を挿入（文末まで保留、長すぎる場合は途中で確定）"""
+
+    def __init__(self, max_hold: int = 60):
+        self.max_hold = max_hold
+        self._buffer: List[str] = []
+        self._size = 0
+
+    def feed(self, chunk: str) -> str:
+        if not BUDOUX_AVAILABLE:
+            return chunk
+        out = []
+        for ch in chunk:
+            self._buffer.append(ch)
+            self._size += 1
+            if ch in _SENTENCE_ENDS or self._size >= self.max_hold:
+                out.append(self._flush())
+        return "".join(out)
+
+    def finish(self) -> str:
+        if not BUDOUX_AVAILABLE:
+            return ""
+        return self._flush()
+
+    @profiling.profiled("budoux")
+    def _flush(self) -> str:
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        if not text.strip():
+            return text
+        lines = text.split("\n")
+        return "\n".join(PHRASE_BREAK.join(_budoux_parser.parse(line)) if line else line
+                         for line in lines)
+
+
+class StreamPipeline:
+    """後処理段を直列に接続したパイプライン"""
+
+    def __init__(self, stages: List[StreamStage]):
+        self.stages = stages
+
+    def feed(self, chunk: str) -> str:
+        for stage in self.stages:
+            if not chunk:
+                return ""
+            chunk = stage.feed(chunk)
+        return chunk
+
+    def finish(self) -> str:
+        """保留中の出力を後段に流しながら全段を確定"""
+        carried = ""
+        for stage in self.stages:
+            if carried:
+                carried = stage.feed(carried)
+            carried += stage.finish()
+        return carried
+
+    def process(self, text: str) -> str:
+        """一括処理（非ストリーミング経路用）"""
+        return self.feed(text) + self.finish()
+
+
+def build_pipeline(
+    glossary_targets: Optional[List[str]] = None,
+    segment: bool = False
+) -> StreamPipeline:
+    """標準の後処理パイプラインを構築"""
+    stages: List[StreamStage] = []
+    if glossary_targets:
+        stages.append(GlossaryStage(glossary_targets))
+    stages.append(NewlineCollapser())
+    stages.append(WhitespaceCleaner())
+    if segment and BUDOUX_AVAILABLE:
+        stages.append(PhraseSegmenter())
+    return StreamPipeline(stages)
+
+
+def display_pieces(text: str) -> Iterator[Tuple[str, bool]]:
+    """(テキスト, 極小スペースか) の列に分解（Text ウィジェットへの挿入用）"""
+    if PHRASE_BREAK not in text:
+        if text:
+            yield text, False
+        return
+    parts = text.split(PHRASE_BREAK)
+    for i, part in enumerate(parts):
+        if i:
+            yield " ", True
+        if part:
+            yield part, False
+
+
+def strip_breaks(text: str) -> str:
+    """文節区切りを除いたプレーンテキスト"""
+    return text.replace(PHRASE_BREAK, "")
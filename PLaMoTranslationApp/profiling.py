@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 翻訳処理のプロファイリング（オプトイン）
+
+PLAMO_PROFILE_DIR を設定するか、アプリを --profile [DIR] 付きで起動すると
+翻訳1回ごとに次のファイルを書き出す。
+
+- <id>.pstats    : 翻訳スレッドの決定的プロファイル（python3 -m pstats で閲覧）
+- <id>.collapsed : 全スレッドのサンプリング結果（flamegraph.pl / speedscope 用の折り畳み形式）
+- <id>.json      : 区間ごとの所要時間（プロセス起動・最初の出力・デコード・Tk挿入・BudouX）
+
+無効時の各フックはフラグを1つ確認するだけで、計測処理は一切行わない。
+"""
+import cProfile
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Iterator, List, Optional
+
+DEFAULT_PROFILE_DIR = "profiles"
+# サンプリング間隔（ミリ秒）
+SAMPLE_INTERVAL_MS = float(os.environ.get("PLAMO_PROFILE_INTERVAL_MS", "5"))
+# 折り畳みスタックの最大深さ
+_MAX_STACK_DEPTH = 64
+
+_enabled = False
+_directory: Optional[str] = None
+_current: Optional["RequestProfile"] = None
+_ids = itertools.count(1)
+
+
+def enable(directory: str = DEFAULT_PROFILE_DIR):
+    """プロファイリングを有効化し、出力先を設定"""
+    global _enabled, _directory
+    os.makedirs(directory, exist_ok=True)
+    _directory = directory
+    _enabled = True
+    print(f"🔬 プロファイリング有効: {os.path.abspath(directory)}")
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def configure_from_argv(argv: Optional[List[str]] = None):
+    """--profile [DIR] 引数または PLAMO_PROFILE_DIR で有効化"""
+    argv = sys.argv if argv is None else argv
+    if "--profile" in argv:
+        index = argv.index("--profile")
+        value = argv[index + 1] if index + 1 < len(argv) else ""
+        enable(value if value and not value.startswith("-") else DEFAULT_PROFILE_DIR)
+    elif os.environ.get("PLAMO_PROFILE_DIR"):
+        enable(os.environ["PLAMO_PROFILE_DIR"])
+
+
+class _StackSampler:
+    """全スレッドのスタックを一定間隔で採取し、折り畳み形式で集計"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < _MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfile:
+    """翻訳1回分の計測"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{next(_ids):04d}-{name}"
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.marks: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._profiler = cProfile.Profile()
+        self._sampler = _StackSampler(SAMPLE_INTERVAL_MS / 1000)
+
+    def start(self):
+        self._sampler.start()
+        self._profiler.enable()
+
+    def add_span(self, name: str, seconds: float):
+        with self._lock:
+            self.spans[name] += seconds
+            self.counts[name] += 1
+
+    def mark(self, name: str):
+        """最初の1回だけ、開始からの経過時間を記録"""
+        with self._lock:
+            self.marks.setdefault(name, time.perf_counter() - self.started)
+
+    def finish(self, directory: str) -> str:
+        self._profiler.disable()
+        self._sampler.stop()
+        base = os.path.join(directory, self.id)
+        self._profiler.dump_stats(base + ".pstats")
+        self._sampler.write(base + ".collapsed")
+        summary = {
+            "name": self.name,
+            "total_ms": (time.perf_counter() - self.started) * 1000,
+            "marks_ms": {k: v * 1000 for k, v in self.marks.items()},
+            "spans_ms": {k: v * 1000 for k, v in self.spans.items()},
+            "span_counts": dict(self.counts),
+            "samples": sum(self._sampler.samples.values()),
+        }
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+        print(f"🔬 プロファイル保存: {base}.* ({summary['total_ms']:.0f}ms)")
+        return base
+
+
+@contextmanager
+def request(name: str) -> Iterator[Optional[RequestProfile]]:
+    """翻訳1回を計測（呼び出したスレッドを決定的に、全スレッドをサンプリングで）"""
+    global _current
+    if not _enabled or _current is not None:
+        yield None
+        return
+    profile = _current = RequestProfile(name)
+    profile.start()
+    try:
+        yield profile
+    finally:
+        _current = None
+        profile.finish(_directory)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profile", "name", "started")
+
+    def __init__(self, profile: RequestProfile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.add_span(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def span(name: str):
+    """区間の所要時間を計測中の翻訳に加算（無効時は何もしない）"""
+    profile = _current
+    if profile is None:
+        return _NULL_SPAN
+    return _Span(profile, name)
+
+
+def mark(name: str):
+    """計測中の翻訳の開始からの経過時間を記録（最初の1回のみ）"""
+    profile = _current
+    if profile is not None:
+        profile.mark(name)
+
+
+def profiled(name: str):
+    """関数呼び出しを区間として計測するデコレータ"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            profile = _current
+            if profile is None:
+                return fn(*args, **kwargs)
+            with _Span(profile, name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def profiled_request(name: str):
+    """関数呼び出し全体を翻訳1回として計測するデコレータ"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with request(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
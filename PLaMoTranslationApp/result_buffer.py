@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 翻訳結果のチャンクバッファ
+
+ストリーミング出力を文字列の連結（full_result += chunk、長さに対して二乗の時間）で
+組み立てる代わりに、チャンクのリストとして保持する。追記は O(1)、全文は必要に
+なったときに1度だけ結合してキャッシュし、区間の取り出しは累積長の二分探索で
+該当チャンクだけを結合する。翻訳スレッドが追記し UI スレッドが読むため排他制御付き。
+
+ベンチマーク:
+    python3 result_buffer.py --chars 400000
+"""
+import threading
+from bisect import bisect_right
+from typing import Iterator, List, Optional
+
+
+class ResultBuffer:
+    """追記専用の翻訳結果バッファ（ロープの簡易版）"""
+
+    def __init__(self, text: str = ""):
+        self._lock = threading.Lock()
+        self._chunks: List[str] = []
+        self._ends: List[int] = []  # 各チャンク末尾までの累積文字数
+        self._length = 0
+        self._joined: Optional[str] = None
+        if text:
+            self.append(text)
+
+    def append(self, chunk: str):
+        if not chunk:
+            return
+        with self._lock:
+            self._chunks.append(chunk)
+            self._length += len(chunk)
+            self._ends.append(self._length)
+            self._joined = None
+
+    def clear(self):
+        with self._lock:
+            self._chunks = []
+            self._ends = []
+            self._length = 0
+            self._joined = None
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __bool__(self) -> bool:
+        return self._length > 0
+
+    def text(self) -> str:
+        """全文（結合結果はキャッシュし、チャンクも1つにまとめる）"""
+        with self._lock:
+            if self._joined is None:
+                self._joined = "".join(self._chunks)
+                if len(self._chunks) > 1:
+                    self._chunks = [self._joined]
+                    self._ends = [self._length]
+            return self._joined
+
+    __str__ = text
+
+    def slice(self, start: int, end: Optional[int] = None) -> str:
+        """[start, end) の区間（該当するチャンクだけを結合）"""
+        with self._lock:
+            start, end, _ = slice(start, end).indices(self._length)
+            if start >= end:
+                return ""
+            if self._joined is not None:
+                return self._joined[start:end]
+            first = bisect_right(self._ends, start)
+            last = bisect_right(self._ends, end - 1)
+            offset = self._ends[first - 1] if first else 0
+            joined = "".join(self._chunks[first:last + 1])
+            return joined[start - offset:end - offset]
+
+    def tail(self, count: int) -> str:
+        """末尾 count 文字"""
+        return self.slice(max(0, self._length - count))
+
+    def chunks(self) -> Iterator[str]:
+        """チャンクを順に返す（結合せずに書き出す場合用）"""
+        with self._lock:
+            chunks = list(self._chunks)
+        return iter(chunks)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    arg_parser = argparse.ArgumentParser(description="結果バッファの追記・結合ベンチマーク")
+    arg_parser.add_argument("--chars", type=int, default=400_000)
+    arg_parser.add_argument("--chunk", type=int, default=3, help="1チャンクの文字数")
+    args = arg_parser.parse_args()
+
+    pieces = ["翻訳結果"[i % 4] * args.chunk for i in range(args.chars // args.chunk)]
+
+    start = time.perf_counter()
+    text = ""
+    for piece in pieces:
+        # 途中の文字列を別の場所（UIへのコールバックなど）が参照していると
+        # CPython のその場連結最適化が効かず、毎回全体がコピーされる
+        shown = text
+        text += piece
+    concat_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    buffer = ResultBuffer()
+    for piece in pieces:
+        buffer.append(piece)
+    append_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    assert buffer.slice(1000, 1010) == text[1000:1010]
+    slice_us = (time.perf_counter() - start) * 1e6
+    start = time.perf_counter()
+    assert buffer.text() == text
+    join_ms = (time.perf_counter() - start) * 1000
+
+    print(f"📄 {args.chars / 1e6:.1f}M文字 / {len(pieces)}チャンク")
+    print(f"  文字列連結: {concat_ms:.0f}ms")
+    print(f"  バッファ追記: {append_ms:.0f}ms, 区間取得: {slice_us:.0f}µs, 全文結合: {join_ms:.0f}ms")
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 対話的翻訳と一括翻訳の優先度スケジューリング
+
+翻訳エンジンの実行枠（スロット）を優先度順に割り当てる。一括翻訳は
+セグメントごとに枠を取り直すため、ホットキーからの対話的な翻訳は
+実行中のセグメントが終わった時点で一括翻訳の残りより先に実行される。
+クラスごとの待ち行列の長さと待ち時間を記録する。
+
+測定:
+    python3 scheduler.py --segments 200
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+# 優先度クラス（小さいほど優先）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BULK: "bulk"}
+
+# 同時に翻訳エンジンを使える数
+DEFAULT_CONCURRENCY = int(os.environ.get("PLAMO_ENGINE_CONCURRENCY", "1"))
+# 待ち時間の統計に使う直近のサンプル数
+_WAIT_SAMPLES = 1000
+
+
+class _ClassStats:
+    """優先度クラスごとの統計"""
+
+    def __init__(self):
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.max_depth = 0
+        self.waits: deque = deque(maxlen=_WAIT_SAMPLES)
+
+    def snapshot(self) -> Dict[str, float]:
+        waits = sorted(self.waits)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return waits[min(len(waits) - 1, int(len(waits) * p))] * 1000
+
+        return {
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "completed": self.completed,
+            "max_queue_depth": self.max_depth,
+            "wait_p50_ms": percentile(0.5),
+            "wait_p95_ms": percentile(0.95),
+            "wait_max_ms": waits[-1] * 1000 if waits else 0.0,
+        }
+
+
+class EngineScheduler:
+    """翻訳エンジンの実行枠を優先度順（同じ優先度なら到着順）に割り当てる"""
+
+    def __init__(self, concurrency: int = DEFAULT_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self._cond = threading.Condition()
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._stats = {priority: _ClassStats() for priority in PRIORITY_NAMES}
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_INTERACTIVE) -> Iterator[None]:
+        """エンジンの実行枠を確保（with 文の間だけ保持）"""
+        stats = self._stats[priority]
+        ticket = (priority, next(self._seq))
+        requested = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._heap, ticket)
+            stats.waiting += 1
+            stats.max_depth = max(stats.max_depth, stats.waiting)
+            try:
+                while self._active >= self.concurrency or self._heap[0] != ticket:
+                    self._cond.wait()
+            except BaseException:
+                # 待機中に中断されたら券を取り除く（残すと後続の待ち手が先頭を取れない）
+                self._heap.remove(ticket)
+                heapq.heapify(self._heap)
+                stats.waiting -= 1
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._heap)
+            self._active += 1
+            stats.waiting -= 1
+            stats.running += 1
+            stats.waits.append(time.monotonic() - requested)
+            # 枠が残っていれば次の待ち手も起こす
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._active -= 1
+                stats.running -= 1
+                stats.completed += 1
+                self._cond.notify_all()
+
+    def run(self, fn: Callable, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs):
+        """実行枠を確保して fn を呼ぶ"""
+        with self.slot(priority):
+            return fn(*args, **kwargs)
+
+    def translate_batch(
+        self,
+        segments: List[str],
+        translate_fn: Callable[[str], str],
+        priority: int = PRIORITY_BULK,
+        cancel: Optional[threading.Event] = None
+    ) -> List[Optional[str]]:
+        """セグメントごとに枠を取り直して翻訳（間に対話的な翻訳が割り込める）"""
+        results: List[Optional[str]] = []
+        for segment in segments:
+            if cancel is not None and cancel.is_set():
+                results.extend([None] * (len(segments) - len(results)))
+                break
+            with self.slot(priority):
+                results.append(translate_fn(segment))
+        return results
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """クラスごとの待ち行列の長さ・待ち時間"""
+        with self._cond:
+            return {PRIORITY_NAMES[p]: stats.snapshot() for p, stats in self._stats.items()}
+
+
+# グローバルインスタンス（シングルトン）
+_scheduler_instance: Optional[EngineScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> EngineScheduler:
+    """エンジンスケジューラのシングルトンインスタンスを取得"""
+    global _scheduler_instance
+    with _scheduler_lock:
+        if _scheduler_instance is None:
+            _scheduler_instance = EngineScheduler()
+        return _scheduler_instance
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    arg_parser = argparse.ArgumentParser(description="一括翻訳中の対話的翻訳の待ち時間測定")
+    arg_parser.add_argument("--segments", type=int, default=200, help="一括翻訳のセグメント数")
+    arg_parser.add_argument("--segment-ms", type=float, default=20.0, help="1セグメントの翻訳時間")
+    arg_parser.add_argument("--interactive", type=int, default=20, help="対話的翻訳の回数")
+    args = arg_parser.parse_args()
+
+    def fake_engine(text: str) -> str:
+        time.sleep(args.segment_ms / 1000)
+        return text.upper()
+
+    segments = [f"segment {i}" for i in range(args.segments)]
+    report = {}
+    for mode in ("whole_batch", "per_segment"):
+        scheduler = EngineScheduler(concurrency=1)
+        if mode == "whole_batch":
+            # 従来どおり一括翻訳が1回でエンジンを占有する場合
+            bulk = threading.Thread(target=scheduler.run, args=(
+                lambda: [fake_engine(segment) for segment in segments],
+            ), kwargs={"priority": PRIORITY_BULK})
+        else:
+            bulk = threading.Thread(
+                target=scheduler.translate_batch, args=(segments, fake_engine, PRIORITY_BULK)
+            )
+        bulk.start()
+        latencies = []
+        for _ in range(args.interactive):
+            time.sleep(args.segments * args.segment_ms / 1000 / args.interactive / 2)
+            start = time.perf_counter()
+            scheduler.run(fake_engine, "hotkey", priority=PRIORITY_INTERACTIVE)
+            latencies.append((time.perf_counter() - start) * 1000)
+        bulk.join()
+        latencies.sort()
+        report[mode] = {
+            "interactive_latency_p50_ms": latencies[len(latencies) // 2],
+            "interactive_latency_max_ms": latencies[-1],
+            "metrics": scheduler.metrics(),
+        }
+        print(f"📊 {mode}: 対話的翻訳 p50={latencies[len(latencies) // 2]:.0f}ms "
+              f"max={latencies[-1]:.0f}ms")
+
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - ワーカープロセス間のモデル重み共有
+
+複数プロセスで翻訳する際に、重みをプロセスごとに複製しないための仕組み。
+
+- mmap: 重みを torch.save 形式で書き出し、torch.load(mmap=True) で読み取り専用に
+  マップする。各ワーカーはページキャッシュ上の同じページを参照する。
+- fork: 親プロセスで1度だけ読み込み、fork でワーカーを作る（コピーオンライト）。
+  int8量子化モデルのように書き出せない重みはこちらを使う。Linux 専用
+  （macOS では fork 後の Objective-C ランタイムや Accelerate が安全でないため mmap と spawn を使う）。
+
+ワーカーごとの増分メモリ測定:
+    python3 shared_weights.py --model sshleifer/tiny-gpt2 --workers 4
+"""
+import gc
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+try:
+    import torch
+    from transformers import AutoConfig, AutoModelForCausalLM
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+
+def export_mmap_weights(model_name: str, weights_path: str, dtype: str = "bfloat16"):
+    """モデル重みを mmap 読み込み可能な形式で書き出す"""
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=getattr(torch, dtype),
+        trust_remote_code=True,
+        low_cpu_mem_usage=True
+    )
+    # torch.save の zip 形式はストレージ境界が揃っているため mmap できる
+    torch.save(model.state_dict(), weights_path)
+    return weights_path
+
+
+def load_mmap_model(model_name: str, weights_path: str, dtype: str = "bfloat16"):
+    """書き出した重みを読み取り専用でマップしてモデルを構築"""
+    from accelerate import init_empty_weights
+
+    config = AutoConfig.from_pretrained(model_name, trust_remote_code=True)
+    state_dict = torch.load(weights_path, mmap=True, weights_only=True, map_location="cpu")
+    # パラメータだけ meta デバイスに置いて骨組みを作り、mmap されたテンソルをそのまま割り当てる。
+    # state_dict に含まれないバッファ（rotary の inv_freq や因果マスクなど）は
+    # 通常どおり CPU 上で初期化される
+    with init_empty_weights(include_buffers=False):
+        model = AutoModelForCausalLM.from_config(
+            config, torch_dtype=getattr(torch, dtype), trust_remote_code=True
+        )
+    result = model.load_state_dict(state_dict, assign=True, strict=False)
+    model.tie_weights()
+    # 共有される重み（tie_weights で埋まるもの）以外が欠けていれば読み込み失敗
+    on_meta = [
+        name for name, tensor in itertools.chain(model.named_parameters(), model.named_buffers())
+        if tensor.is_meta
+    ]
+    if on_meta:
+        missing = [key for key in result.missing_keys if key in on_meta] or on_meta
+        raise RuntimeError(
+            f"重みファイルに含まれないテンソルがあります（{weights_path}）: {', '.join(missing[:10])}"
+        )
+    model.eval()
+    return model
+
+
+def process_memory(pid: int) -> Dict[str, Optional[int]]:
+    """プロセスのRSS / PSS / USS（プライベート）をバイト単位で取得"""
+    if PSUTIL_AVAILABLE:
+        info = psutil.Process(pid).memory_full_info()
+        return {"rss": info.rss, "pss": getattr(info, "pss", None), "uss": info.uss}
+    result = {"rss": None, "pss": None, "uss": None}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) * 1024
+        result["rss"] = fields.get("Rss")
+        result["pss"] = fields.get("Pss")
+        result["uss"] = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    except OSError:
+        pass
+    return result
+
+
+def _worker_main(factory, chain, tasks, results, ready):
+    """ワーカープロセス: タスクキューから翻訳要求を処理"""
+    if chain is None:
+        chain = factory()
+    ready.put(os.getpid())
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        request_id, text, source_lang, target_lang = task
+        try:
+            results.put((request_id, True, chain.translate(
+                text=text, source_lang=source_lang, target_lang=target_lang
+            )))
+        except Exception as e:
+            results.put((request_id, False, str(e)))
+
+
+class SharedWeightWorkerPool:
+    """重みを共有する翻訳ワーカープロセス群"""
+
+    def __init__(self, factory: Callable, workers: int = 2, share: str = "fork"):
+        """
+        share="fork": 親で factory() を1度呼び、fork で共有（Linux のみ。macOS は "mmap" を使う）
+        share="mmap": 各ワーカーが mmap ローダーの factory() を呼ぶ（spawn）
+        share="none": 各ワーカーが独立にロード（比較用）
+        """
+        if share == "fork":
+            context = multiprocessing.get_context("fork")
+            # fork 後の tokenizers 並列処理によるデッドロックを避ける
+            os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+            chain = factory()
+            # fork 前に既存オブジェクトをGC対象外にし、書き込みによるページ複製を減らす
+            gc.collect()
+            gc.freeze()
+        else:
+            context = multiprocessing.get_context("spawn")
+            chain = None
+
+        self.share = share
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        ready = context.Queue()
+        self.processes = [
+            context.Process(
+                target=_worker_main,
+                args=(factory, chain, self._tasks, self._results, ready),
+                daemon=True
+            )
+            for _ in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+        for _ in self.processes:
+            ready.get()
+        if share == "fork":
+            gc.unfreeze()
+
+        self._ids = itertools.count()
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+
+    @property
+    def pids(self) -> List[int]:
+        return [process.pid for process in self.processes]
+
+    def submit(self, text: str, source_lang: str, target_lang: str) -> Future:
+        """翻訳要求を投入し Future を返す"""
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+        self._tasks.put((request_id, text, source_lang, target_lang))
+        return future
+
+    def _collect(self):
+        while True:
+            item = self._results.get()
+            if item is None:
+                break
+            request_id, ok, value = item
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+
+    def memory_report(self) -> List[Dict[str, Optional[int]]]:
+        """各ワーカーのメモリ使用量"""
+        return [dict(pid=pid, **process_memory(pid)) for pid in self.pids]
+
+    def close(self):
+        """全ワーカーを終了"""
+        for _ in self.processes:
+            self._tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=10)
+        self._results.put(None)
+
+
+def _mmap_chain_factory(model_name: str, weights_path: str):
+    from cpu_backend import CPUTranslationChain
+    return CPUTranslationChain(model_name, quantize=False, weights_path=weights_path)
+
+
+def _private_chain_factory(model_name: str, quantize: bool):
+    from cpu_backend import CPUTranslationChain
+    return CPUTranslationChain(model_name, quantize=quantize, weights_path=None)
+
+
+if __name__ == "__main__":
+    import argparse
+    import functools
+    import json
+    import tempfile
+
+    arg_parser = argparse.ArgumentParser(description="ワーカーごとの増分メモリ測定")
+    arg_parser.add_argument("--model", default="sshleifer/tiny-gpt2")
+    arg_parser.add_argument("--workers", type=int, default=4)
+    arg_parser.add_argument("--quantize", action="store_true", help="fork/none で int8 モデルを使う")
+    args = arg_parser.parse_args()
+
+    if not TORCH_AVAILABLE:
+        print("❌ torch/transformers がインストールされていません")
+        raise SystemExit(1)
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        weights_path = os.path.join(tmp, "weights.pt")
+        export_mmap_weights(args.model, weights_path)
+
+        factories = {
+            "none": functools.partial(_private_chain_factory, args.model, args.quantize),
+            "mmap": functools.partial(_mmap_chain_factory, args.model, weights_path),
+            "fork": functools.partial(_private_chain_factory, args.model, args.quantize),
+        }
+        for share, factory in factories.items():
+            pool = SharedWeightWorkerPool(factory, workers=args.workers, share=share)
+            futures = [pool.submit("Hello world", "English", "Japanese") for _ in pool.pids]
+            for future in futures:
+                future.result()
+            memory = pool.memory_report()
+            pool.close()
+            mb = 1024 * 1024
+            uss = [m["uss"] for m in memory if m["uss"] is not None]
+            pss = [m["pss"] for m in memory if m["pss"] is not None]
+            report[share] = {
+                "workers": args.workers,
+                "mean_incremental_uss_mb": sum(uss) / len(uss) / mb if uss else None,
+                "total_pss_mb": sum(pss) / mb if pss else None,
+            }
+            print(f"📊 {share}: {report[share]}")
+
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - エンジンプロセスと UI プロセス間の共有メモリ・リングバッファ
+
+翻訳エンジンを別プロセスに移して Tk の GUI を軽く保つ場合、チャンクごとに
+pickle やパイプへの書き込み（translator_fixed.py の stdout.read(1) のような読み方）を
+していては、チャンクの数だけシステムコールとコピーが発生する。
+ここでは multiprocessing.shared_memory 上の単一生産者・単一消費者のリングバッファに
+トークンを書き込み、書き込み位置を進めるだけで受け渡す。
+
+通知は「読み手が眠っているときだけ」セマフォで起こす。読み手が処理中なら
+書き手は共有メモリに書いて位置を進めるだけで、システムコールは発生しない。
+バッファが満杯のときは書き手が同じ仕組みで空きを待つ。
+
+レコード: [長さ u32][種別 u8][ストリームID u32][本文]（リトルエンディアン）
+種別は binary_ipc と同じ TOKEN / DONE / ERROR を使う。
+
+計測（パイプ・multiprocessing.Queue との比較）:
+    python3 shm_ring.py --bench
+"""
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import shared_memory
+from typing import Callable, Dict, List, Optional, Tuple
+
+from binary_ipc import FRAME_DONE, FRAME_ERROR, FRAME_TOKEN, IPCRequest, pack_map, unpack_map
+
+DEFAULT_CAPACITY = int(os.environ.get("PLAMO_SHM_RING_BYTES", str(1024 * 1024)))
+
+# ヘッダ: 書き込み位置と読み込み位置は別のキャッシュラインに置く
+_WRITE_POS = 0
+_READ_POS = 64
+_READER_WAITING = 128
+_WRITER_WAITING = 132
+_CLOSED = 136
+_DATA = 192
+_U32 = struct.Struct("<I")
+_RECORD = struct.Struct("<IBI")
+# 通知を取りこぼしても止まらないよう、待機はこの間隔で起きて確認し直す
+_WAIT_SLICE = 0.05
+# 眠る前に書き込み位置を見張る時間（連続するトークンはセマフォを使わずに受け取る）
+_SPIN_SECONDS = 0.0002
+
+RingSpec = namedtuple("RingSpec", ["name", "capacity", "data_ready", "space_ready"])
+
+
+class RingClosed(Exception):
+    """相手がリングを閉じた"""
+
+
+class ShmRing:
+    """共有メモリ上の単一生産者・単一消費者リングバッファ
+
+    生成側（spec=None）が共有メモリとセマフォを作り、spec を子プロセスに渡して
+    attach させる。読み書き位置は単調増加の u64 で、容量で割った余りが実際の位置。
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, spec: Optional[RingSpec] = None,
+                 context=None):
+        if spec is None:
+            context = context or multiprocessing.get_context()
+            self._shm = shared_memory.SharedMemory(create=True, size=_DATA + capacity)
+            self._shm.buf[:_DATA] = bytes(_DATA)
+            spec = RingSpec(self._shm.name, capacity, context.Semaphore(0), context.Semaphore(0))
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=spec.name)
+            self._owner = False
+        self.spec = spec
+        self.capacity = spec.capacity
+        self._buf = self._shm.buf
+        self._data = self._buf[_DATA:_DATA + self.capacity]
+        # 位置はネイティブの u64 として読み書きする。struct の pack_into は1バイトずつ
+        # 書くため、相手のプロセスから書きかけの値が見えることがある。共有メモリは
+        # ページ境界に置かれるので、ここの要素は8バイト境界に揃った1回の読み書きになる
+        self._positions = self._buf[:_DATA].cast("Q")
+        # 書き手が最後に確認した空き容量（足りなくなるまで読み込み位置を読み直さない）
+        self._free = 0
+
+    @classmethod
+    def attach(cls, spec: RingSpec) -> "ShmRing":
+        return cls(spec=spec)
+
+    # --- ヘッダ ---
+
+    def _load(self, offset: int) -> int:
+        return self._positions[offset // 8]
+
+    def _store(self, offset: int, value: int):
+        self._positions[offset // 8] = value
+
+    # 相手側の位置は 0 <= 書き込み位置 - 読み込み位置 <= 容量 を満たすまで読み直す
+
+    def _load_write_pos(self, read_pos: int) -> int:
+        while True:
+            write_pos = self._load(_WRITE_POS)
+            if 0 <= write_pos - read_pos <= self.capacity:
+                return write_pos
+
+    def _load_read_pos(self, write_pos: int) -> int:
+        while True:
+            read_pos = self._load(_READ_POS)
+            if 0 <= write_pos - read_pos <= self.capacity:
+                return read_pos
+
+    def _flag(self, offset: int) -> int:
+        return _U32.unpack_from(self._buf, offset)[0]
+
+    def _set_flag(self, offset: int, value: int):
+        _U32.pack_into(self._buf, offset, value)
+
+    @property
+    def closed(self) -> bool:
+        return bool(self._flag(_CLOSED))
+
+    def close(self):
+        """書き手の終了を知らせ、眠っている読み手を起こす"""
+        self._set_flag(_CLOSED, 1)
+        self.spec.data_ready.release()
+        self.spec.space_ready.release()
+
+    def release(self):
+        """共有メモリの対応付けを外す（生成側は共有メモリも削除）"""
+        self._data.release()
+        self._positions.release()
+        self._buf = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    # --- 書き手 ---
+
+    def _copy_in(self, position: int, data) -> int:
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        self._data[start:start + first] = data[:first]
+        if first < len(data):
+            self._data[:len(data) - first] = data[first:]
+        return position + len(data)
+
+    def write(self, kind: int, stream_id: int, payload: bytes = b"", timeout: Optional[float] = None):
+        """レコードを1つ書く（空きがなければ読み手が読み進めるまで待つ）"""
+        size = _RECORD.size + len(payload)
+        if size > self.capacity:
+            raise ValueError(f"レコードがリングの容量を超えています: {size} > {self.capacity}")
+        write_pos = self._load(_WRITE_POS)
+        if self._free < size:
+            self._wait_for_space(write_pos, size, timeout)
+
+        start = write_pos % self.capacity
+        if start + size <= self.capacity:
+            _RECORD.pack_into(self._data, start, len(payload), kind, stream_id)
+            self._data[start + _RECORD.size:start + size] = payload
+        else:
+            self._copy_in(write_pos, _RECORD.pack(len(payload), kind, stream_id) + payload)
+        self._free -= size
+        # 本文を書き終えてから位置を公開する
+        self._store(_WRITE_POS, write_pos + size)
+        if self._flag(_READER_WAITING):
+            self.spec.data_ready.release()
+
+    def _wait_for_space(self, write_pos: int, size: int, timeout: Optional[float]):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._free = self.capacity - (write_pos - self._load_read_pos(write_pos))
+            if self._free >= size:
+                return
+            if self.closed:
+                raise RingClosed()
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError("リングバッファに空きができません")
+            self._set_flag(_WRITER_WAITING, 1)
+            if self.capacity - (write_pos - self._load_read_pos(write_pos)) < size:
+                self.spec.space_ready.acquire(timeout=_WAIT_SLICE)
+            self._set_flag(_WRITER_WAITING, 0)
+
+    # --- 読み手 ---
+
+    def _copy_out(self, position: int, length: int) -> bytes:
+        start = position % self.capacity
+        end = start + length
+        if end <= self.capacity:
+            return bytes(self._data[start:end])
+        return bytes(self._data[start:]) + bytes(self._data[:end - self.capacity])
+
+    def read_available(self, timeout: Optional[float] = None) -> List[Tuple[int, int, bytes]]:
+        """書かれているレコードをまとめて読む（なければ timeout まで待ち、閉じられていれば RingClosed）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        read_pos = self._load(_READ_POS)
+        write_pos = self._load_write_pos(read_pos)
+        if write_pos == read_pos:
+            spin_until = time.perf_counter() + _SPIN_SECONDS
+            while write_pos == read_pos and time.perf_counter() < spin_until:
+                write_pos = self._load_write_pos(read_pos)
+        while write_pos == read_pos:
+            if self.closed:
+                raise RingClosed()
+            if deadline is not None and time.monotonic() >= deadline:
+                return []
+            self._set_flag(_READER_WAITING, 1)
+            # フラグを立てた後にもう一度確認してから眠る（書き手の通知の取りこぼし防止）
+            write_pos = self._load_write_pos(read_pos)
+            if write_pos == read_pos:
+                self.spec.data_ready.acquire(timeout=_WAIT_SLICE)
+                write_pos = self._load_write_pos(read_pos)
+            self._set_flag(_READER_WAITING, 0)
+
+        # 読める範囲を1回でコピーしてから解析し、すぐに空きとして返す
+        region = self._copy_out(read_pos, write_pos - read_pos)
+        self._store(_READ_POS, write_pos)
+        records = []
+        offset = 0
+        unpack = _RECORD.unpack_from
+        header = _RECORD.size
+        while offset < len(region):
+            length, kind, stream_id = unpack(region, offset)
+            offset += header
+            records.append((kind, stream_id, region[offset:offset + length]))
+            offset += length
+        if self._flag(_WRITER_WAITING):
+            self.spec.space_ready.release()
+        return records
+
+
+# ---- エンジンプロセス ----
+
+def _engine_main(requests, spec: RingSpec, backend: str, max_workers: int):
+    """子プロセス: リクエストをパイプで受け、訳文のトークンをリングに書く"""
+    from binary_ipc import engine_translate, stub_translate
+
+    ring = ShmRing.attach(spec)
+    translate = stub_translate() if backend == "stub" else engine_translate
+    write_lock = threading.Lock()
+    cancels: Dict[int, threading.Event] = {}
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def send(kind: int, stream_id: int, payload: bytes = b""):
+        # リングは単一生産者なので、翻訳スレッドからの書き込みは直列化する
+        with write_lock:
+            ring.write(kind, stream_id, payload)
+
+    def run(stream_id: int, text: str, source_lang: str, target_lang: str, cancelled: threading.Event):
+        start = time.perf_counter()
+        try:
+            translate(text, source_lang, target_lang,
+                      lambda piece: send(FRAME_TOKEN, stream_id, piece.encode("utf-8")), cancelled)
+            send(FRAME_DONE, stream_id, pack_map({
+                "processing_time": time.perf_counter() - start, "cancelled": cancelled.is_set(),
+            }))
+        except Exception as e:
+            send(FRAME_ERROR, stream_id, str(e).encode("utf-8"))
+        finally:
+            cancels.pop(stream_id, None)
+
+    try:
+        while True:
+            try:
+                message = requests.recv()
+            except EOFError:
+                break
+            if message[0] == "translate":
+                _, stream_id, text, source_lang, target_lang = message
+                cancels[stream_id] = threading.Event()
+                executor.submit(run, stream_id, text, source_lang, target_lang, cancels[stream_id])
+            elif message[0] == "cancel":
+                event = cancels.get(message[1])
+                if event is not None:
+                    event.set()
+            elif message[0] == "stop":
+                break
+    finally:
+        for event in list(cancels.values()):
+            event.set()
+        executor.shutdown(wait=True)
+        ring.close()
+        ring.release()
+
+
+class EngineProcess:
+    """翻訳エンジンを子プロセスで動かし、トークンを共有メモリで受け取るクライアント
+
+    on_token は受信スレッドから呼ばれる（Tk では root.after でメインループに渡す）。
+    """
+
+    def __init__(self, backend: str = "engine", capacity: int = DEFAULT_CAPACITY, max_workers: int = 4):
+        context = multiprocessing.get_context("spawn")
+        self.ring = ShmRing(capacity, context=context)
+        self._requests, child_requests = context.Pipe()
+        self.process = context.Process(
+            target=_engine_main, args=(child_requests, self.ring.spec, backend, max_workers), daemon=True
+        )
+        self.process.start()
+        child_requests.close()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, IPCRequest] = {}
+        self._next_id = 1
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _send(self, message: tuple):
+        with self._send_lock:
+            self._requests.send(message)
+
+    def _read_loop(self):
+        try:
+            while True:
+                for kind, stream_id, payload in self.ring.read_available():
+                    pending = self._pending.get(stream_id)
+                    if pending is None:
+                        continue  # 取り消し済み
+                    if kind == FRAME_TOKEN:
+                        piece = payload.decode("utf-8")
+                        pending.pieces.append(piece)
+                        if pending.on_token:
+                            pending.on_token(piece)
+                        continue
+                    if kind == FRAME_DONE:
+                        pending.info = unpack_map(payload)
+                    else:
+                        pending.error = payload.decode("utf-8")
+                    with self._lock:
+                        self._pending.pop(stream_id, None)
+                    pending.done.set()
+        except RingClosed:
+            pass
+        # エンジンプロセスが終了したら待っている全リクエストを失敗させる
+        with self._lock:
+            pending_all = list(self._pending.values())
+            self._pending.clear()
+        for pending in pending_all:
+            pending.error = pending.error or "エンジンプロセスが終了しました"
+            pending.done.set()
+
+    def submit(self, text: str, source_lang: str, target_lang: str,
+               on_token: Optional[Callable[[str], None]] = None) -> IPCRequest:
+        with self._lock:
+            request = IPCRequest(self._next_id, on_token)
+            self._next_id += 1
+            self._pending[request.id] = request
+        self._send(("translate", request.id, text, source_lang, target_lang))
+        return request
+
+    def translate(self, text: str, source_lang: str, target_lang: str,
+                  on_token: Optional[Callable[[str], None]] = None, timeout: Optional[float] = None) -> str:
+        request = self.submit(text, source_lang, target_lang, on_token)
+        try:
+            return request.result(timeout)
+        except TimeoutError:
+            self.cancel(request.id)
+            raise
+
+    def cancel(self, request_id: int):
+        with self._lock:
+            pending = self._pending.pop(request_id, None)
+        if pending is not None:
+            pending.error = "取り消されました"
+            pending.done.set()
+            self._send(("cancel", request_id))
+
+    def close(self, timeout: float = 5.0):
+        """エンジンプロセスを止め、共有メモリを削除する"""
+        try:
+            self._send(("stop",))
+        except OSError:
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.ring.close()
+        self._reader.join(timeout)
+        self.ring.release()
+
+
+# ---- 計測 ----
+
+_STAMP = struct.Struct("<d")
+
+
+def _produce_ring(spec: RingSpec, count: int, size: int, interval: float):
+    ring = ShmRing.attach(spec)
+    filler = b"x" * max(0, size - _STAMP.size)
+    for i in range(count):
+        ring.write(FRAME_TOKEN, 1, _STAMP.pack(time.perf_counter()) + filler)
+        if interval:
+            time.sleep(interval)
+    ring.write(FRAME_DONE, 1)
+    ring.release()
+
+
+def _produce_pipe(conn, count: int, size: int, interval: float):
+    # チャンクごとに長さ付きで1回 write する（パイプ転送の一般的な形）
+    filler = b"x" * max(0, size - _STAMP.size)
+    for i in range(count):
+        conn.send_bytes(_STAMP.pack(time.perf_counter()) + filler)
+        if interval:
+            time.sleep(interval)
+    conn.send_bytes(b"")
+    conn.close()
+
+
+def _produce_queue(q, count: int, size: int, interval: float):
+    filler = b"x" * max(0, size - _STAMP.size)
+    for i in range(count):
+        q.put(_STAMP.pack(time.perf_counter()) + filler)
+        if interval:
+            time.sleep(interval)
+    q.put(None)
+
+
+def _bench_transport(name: str, count: int, size: int, interval: float) -> Dict[str, float]:
+    """子プロセスから count 個のチャンクを送り、受信側でスループットと遅延を測る"""
+    context = multiprocessing.get_context("spawn")
+    latencies: List[float] = []
+
+    def record(payload: bytes):
+        latencies.append(time.perf_counter() - _STAMP.unpack_from(payload)[0])
+
+    if name == "shm_ring":
+        ring = ShmRing(context=context)
+        process = context.Process(target=_produce_ring, args=(ring.spec, count, size, interval))
+        process.start()
+        start = None
+        done = False
+        while not done:
+            for kind, _, payload in ring.read_available():
+                if kind == FRAME_DONE:
+                    done = True
+                    break
+                start = start or time.perf_counter()
+                record(payload)
+        elapsed = time.perf_counter() - start
+        process.join()
+        ring.release()
+    elif name == "pipe":
+        reader, writer = context.Pipe(duplex=False)
+        process = context.Process(target=_produce_pipe, args=(writer, count, size, interval))
+        process.start()
+        writer.close()
+        start = None
+        while True:
+            payload = reader.recv_bytes()
+            if not payload:
+                break
+            start = start or time.perf_counter()
+            record(payload)
+        elapsed = time.perf_counter() - start
+        reader.close()
+        process.join()
+    else:
+        q = context.Queue()
+        process = context.Process(target=_produce_queue, args=(q, count, size, interval))
+        process.start()
+        start = None
+        while True:
+            payload = q.get()
+            if payload is None:
+                break
+            start = start or time.perf_counter()
+            record(payload)
+        elapsed = time.perf_counter() - start
+        process.join()
+
+    latencies.sort()
+    return {
+        "chunks_per_sec": count / elapsed if elapsed else 0.0,
+        "latency_p50_us": latencies[len(latencies) // 2] * 1e6,
+        "latency_p99_us": latencies[int(len(latencies) * 0.99)] * 1e6,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    arg_parser = argparse.ArgumentParser(description="共有メモリ・リングバッファ")
+    arg_parser.add_argument("--bench", action="store_true", help="パイプ・multiprocessing.Queue と比較")
+    arg_parser.add_argument("--chunks", type=int, default=200000)
+    arg_parser.add_argument("--chunk-bytes", type=int, default=24, help="1チャンクのバイト数（日本語8文字程度）")
+    arg_parser.add_argument("--demo", action="store_true", help="スタブエンジンを子プロセスで動かして翻訳")
+    args = arg_parser.parse_args()
+
+    if args.demo:
+        engine = EngineProcess(backend="stub")
+        engine.translate("Hello from the UI process", "English", "Japanese",
+                         on_token=lambda piece: print(piece, end="", flush=True))
+        print()
+        engine.close()
+    if args.bench:
+        results = {}
+        for transport in ("shm_ring", "pipe", "mp_queue"):
+            throughput = _bench_transport(transport, args.chunks, args.chunk_bytes, 0.0)
+            # 遅延はストリーミング時と同じく間隔をあけて送ったときの値
+            latency = _bench_transport(transport, 2000, args.chunk_bytes, 0.0005)
+            results[transport] = {
+                "chunks_per_sec": round(throughput["chunks_per_sec"]),
+                "latency_p50_us": round(latency["latency_p50_us"], 1),
+                "latency_p99_us": round(latency["latency_p99_us"], 1),
+            }
+        print(json.dumps(results, indent=2))
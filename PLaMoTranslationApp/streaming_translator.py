@@ -2,11 +2,27 @@
 """
 PLaMo Translation with Streaming Support for GUI Integration
 """
+import gc
 import sys
 import os
 import threading
 import time
-from typing import Callable, Optional
+from typing import Callable, List, Optional
+
+import profiling
+from deadlines import DEFAULT_STALL_TIMEOUT, ProgressWatchdog, describe_expiry, get_throughput_estimator
+from glossary import get_glossary
+from postprocess import build_pipeline
+from result_buffer import ResultBuffer
+from scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, get_scheduler
+from segment_dedup import SegmentDeduper
+from token_chunker import plan_chunks, translate_chunked
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
 
 # Add plamo-2-translate-bf16 to path to import our streaming implementation
 plamo_path = os.path.expanduser("~/Desktop/claude-workspace/plamo-2-translate-bf16")
@@ -21,87 +37,408 @@ except ImportError as e:
     print(f"⚠️ PLaMo streaming module not available: {e}")
     PLAMO_AVAILABLE = False
 
+    def detect_language(text: str) -> str:
+        """簡易言語検出（pfml2_utils が無い環境用）"""
+        japanese_chars = any(
+            '\u3040' <= char <= '\u309f' or  # ひらがな
+            '\u30a0' <= char <= '\u30ff' or  # カタカナ
+            '\u4e00' <= char <= '\u9fff'     # 漢字
+            for char in text
+        )
+        return "Japanese" if japanese_chars else "English"
+
+# バックエンド選択: "plamo"（PLaMoTranslationChain）または "cpu"（int8量子化CPU推論）
+DEFAULT_BACKEND = os.environ.get("PLAMO_BACKEND", "plamo")
+
+
+# アイドル時のモデル解放設定（秒、0で無効）
+DEFAULT_IDLE_TIMEOUT = float(os.environ.get("PLAMO_IDLE_TIMEOUT", "900"))
+# システムメモリ使用率がこの値(%)を超えたらアイドル中のモデルを解放
+MEMORY_PRESSURE_PERCENT = float(os.environ.get("PLAMO_MEMORY_PRESSURE_PERCENT", "90"))
+# メモリ不足で解放したあとは、使用率がこの値(%)を下回るか、再読み込みから
+# 一定時間(秒)が経つまで再びメモリ不足では解放しない（解放と再読み込みの繰り返しを防ぐ）
+MEMORY_REARM_PERCENT = float(os.environ.get("PLAMO_MEMORY_REARM_PERCENT", str(MEMORY_PRESSURE_PERCENT - 10)))
+MEMORY_MIN_RESIDENT = float(os.environ.get("PLAMO_MEMORY_MIN_RESIDENT", "600"))
+
+# エンジンの状態
+STATE_NOT_LOADED = "not_loaded"
+STATE_LOADING = "loading"
+STATE_WARMING_UP = "warming_up"
+STATE_READY = "ready"
+STATE_IDLE_UNLOADED = "idle_unloaded"
+STATE_FAILED = "failed"
+
+
+def _process_rss_bytes() -> Optional[int]:
+    """現在のプロセスの常駐メモリ量"""
+    if PSUTIL_AVAILABLE:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _system_memory_percent() -> Optional[float]:
+    """システム全体のメモリ使用率(%)"""
+    if PSUTIL_AVAILABLE:
+        return psutil.virtual_memory().percent
+    try:
+        info = {}
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                info[key] = int(value.split()[0])
+        return 100.0 * (1 - info["MemAvailable"] / info["MemTotal"])
+    except (OSError, KeyError, ValueError, ZeroDivisionError):
+        return None
+
+
+def _release_device_memory():
+    """解放後のメモリをOSへ返却"""
+    gc.collect()
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    mps = getattr(torch, "mps", None)
+    if mps is not None and hasattr(mps, "empty_cache"):
+        try:
+            mps.empty_cache()
+        except RuntimeError:
+            pass
+
 
 class StreamingTranslator:
     """ストリーミング対応の翻訳エンジン"""
     
-    def __init__(self):
+    def __init__(
+        self,
+        backend: Optional[str] = None,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+        reload_timeout: float = 300.0
+    ):
+        self.backend = backend or DEFAULT_BACKEND
         self.chain = None
         self.is_loading = False
         self.is_loaded = False
         
+        # アイドル解放・再読み込み用の状態
+        self.idle_timeout = idle_timeout
+        self.reload_timeout = reload_timeout
+        self.last_used = time.monotonic()
+        self.was_unloaded = False
+        self.loaded_at = 0.0
+        self._memory_armed = True
+        self.load_error: Optional[str] = None
+        self._progress_callback: Optional[Callable[[str], None]] = None
+        self._active = 0
+        self._state_lock = threading.Lock()
+        self._load_done = threading.Event()
+        self._monitor_thread = None
+        self._memory = None
+        self.last_batch_stats: Optional[dict] = None
+    
+    @property
+    def state(self) -> str:
+        """UI表示用のエンジン状態"""
+        if self.is_loaded:
+            return STATE_READY
+        if self.is_loading:
+            return STATE_WARMING_UP if self.was_unloaded else STATE_LOADING
+        if self.was_unloaded:
+            return STATE_IDLE_UNLOADED
+        if self.load_error:
+            return STATE_FAILED
+        return STATE_NOT_LOADED
+    
+    @property
+    def can_translate(self) -> bool:
+        """翻訳要求を受け付けられるか（再読み込み待ちを含む）"""
+        return self.state in (STATE_READY, STATE_LOADING, STATE_WARMING_UP, STATE_IDLE_UNLOADED)
+    
+    def memory_status(self) -> dict:
+        """メモリ・準備状態を取得"""
+        rss = _process_rss_bytes()
+        return {
+            "state": self.state,
+            "rss_mb": rss / (1024 * 1024) if rss is not None else None,
+            "system_memory_percent": _system_memory_percent(),
+            "idle_seconds": time.monotonic() - self.last_used,
+            "active_requests": self._active,
+        }
+    
+    def _create_chain(self):
+        """選択されたバックエンドの翻訳チェーンを生成"""
+        if self.backend == "cpu":
+            from cpu_backend import CPUTranslationChain
+            return CPUTranslationChain()
+        
+        if not PLAMO_AVAILABLE:
+            raise ImportError("PLaMo streaming module not available")
+        return PLaMoTranslationChain()
+    
+    def _notify(self, message: str):
+        if self._progress_callback:
+            self._progress_callback(message)
+        
     def initialize(self, progress_callback: Optional[Callable[[str], None]] = None):
         """翻訳エンジンを初期化（バックグラウンドで実行）"""
+        if progress_callback:
+            self._progress_callback = progress_callback
+        
         def _load():
             try:
-                if progress_callback:
-                    progress_callback("🚀 PLaMo翻訳モデルを読み込み中...")
-                
-                if not PLAMO_AVAILABLE:
-                    raise ImportError("PLaMo streaming module not available")
+                if self.was_unloaded:
+                    self._notify("🔥 翻訳モデルをウォームアップ中...")
+                else:
+                    self._notify("🚀 PLaMo翻訳モデルを読み込み中...")
                 
                 # 環境変数を設定
                 os.environ['TRANSFORMERS_TRUST_REMOTE_CODE'] = '1'
                 
-                if progress_callback:
-                    progress_callback("📦 モデルファイルをロード中...")
+                self._notify("📦 モデルファイルをロード中...")
                 
-                self.chain = PLaMoTranslationChain()
+                if self.chain is not None and hasattr(self.chain, "load_model"):
+                    # トークナイザ等は保持したまま重みだけ再読み込み
+                    self.chain.load_model()
+                else:
+                    self.chain = self._create_chain()
                 self.is_loaded = True
+                self.load_error = None
+                self.last_used = time.monotonic()
+                self.loaded_at = self.last_used
+                self._start_idle_monitor()
                 
-                if progress_callback:
-                    progress_callback("✅ 翻訳エンジン準備完了！")
+                self._notify("✅ 翻訳エンジン準備完了！")
                 
             except Exception as e:
                 self.is_loaded = False
+                self.load_error = str(e)
                 error_msg = f"❌ 翻訳エンジン初期化失敗: {str(e)}"
-                if progress_callback:
-                    progress_callback(error_msg)
+                self._notify(error_msg)
                 print(error_msg)
             finally:
                 self.is_loading = False
+                self._load_done.set()
         
-        if not self.is_loading and not self.is_loaded:
+        with self._state_lock:
+            if self.is_loading or self.is_loaded:
+                return
             self.is_loading = True
-            thread = threading.Thread(target=_load, daemon=True)
-            thread.start()
+            self._load_done.clear()
+        thread = threading.Thread(target=_load, daemon=True)
+        thread.start()
+    
+    def unload(self, reason: str = "idle") -> bool:
+        """モデル重みを解放（翻訳中は解放しない）"""
+        with self._state_lock:
+            if not self.is_loaded or self.is_loading or self._active:
+                return False
+            self.is_loaded = False
+            self.was_unloaded = True
+            if hasattr(self.chain, "release"):
+                self.chain.release()
+            else:
+                self.chain = None
+        _release_device_memory()
+        if reason == "memory":
+            self._memory_armed = False
+        
+        reason_text = "メモリ不足" if reason == "memory" else "アイドル"
+        print(f"💤 {reason_text}のため翻訳モデルを解放しました")
+        self._notify(f"💤 待機中（{reason_text}のためモデル解放）")
+        return True
+    
+    def _start_idle_monitor(self):
+        """アイドル監視スレッドを開始（1度だけ）"""
+        if self._monitor_thread is not None or self.idle_timeout <= 0:
+            return
+        self._monitor_thread = threading.Thread(target=self._idle_monitor, daemon=True)
+        self._monitor_thread.start()
+    
+    def _idle_monitor(self):
+        interval = max(1.0, min(30.0, self.idle_timeout / 4))
+        while True:
+            time.sleep(interval)
+            if not self.is_loaded or self._active:
+                continue
+            if time.monotonic() - self.last_used >= self.idle_timeout:
+                self.unload("idle")
+                continue
+            percent = _system_memory_percent()
+            if percent is None:
+                continue
+            if not self._memory_armed and (
+                percent < MEMORY_REARM_PERCENT
+                or time.monotonic() - self.loaded_at >= MEMORY_MIN_RESIDENT
+            ):
+                self._memory_armed = True
+            if self._memory_armed and percent >= MEMORY_PRESSURE_PERCENT:
+                self.unload("memory")
+    
+    def _acquire(self):
+        with self._state_lock:
+            self._active += 1
+            self.last_used = time.monotonic()
+    
+    def _release(self):
+        with self._state_lock:
+            self._active -= 1
+            self.last_used = time.monotonic()
+    
+    def _translation_memory(self):
+        """翻訳メモリ（開けない環境では None）"""
+        if self._memory is None:
+            try:
+                from translation_memory import get_translation_memory
+                self._memory = get_translation_memory()
+            except Exception as e:
+                print(f"⚠️ 翻訳メモリを開けません: {e}")
+                self._memory = False
+        return self._memory or None
+    
+    def _ensure_ready(self) -> bool:
+        """モデルが解放済みなら再読み込みし、準備完了まで待機"""
+        if self.is_loaded:
+            return True
+        if not self.can_translate:
+            return False
+        self.initialize()
+        self._load_done.wait(self.reload_timeout)
+        return self.is_loaded
     
     def translate_streaming(
         self, 
         text: str, 
         chunk_callback: Callable[[str], None],
         complete_callback: Optional[Callable[[str], None]] = None,
-        error_callback: Optional[Callable[[str], None]] = None
+        error_callback: Optional[Callable[[str], None]] = None,
+        partial_callback: Optional[Callable[[str, str], None]] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        result_buffer: Optional[ResultBuffer] = None,
+        cancel: Optional[threading.Event] = None,
+        remember: bool = True
     ):
-        """ストリーミング翻訳を実行"""
+        """ストリーミング翻訳を実行
+
+        入力長と実測スループットから求めた期限を過ぎるか、出力が一定時間
+        止まった場合は打ち切り、途中結果を partial_callback(途中結果, 理由) で返す
+        （未指定なら error_callback に理由を渡す）。
+        エンジンは priority の順に割り当てられ、一括翻訳より対話的翻訳が先に実行される。
+        result_buffer を渡すと、出力はそのバッファにも追記される（UI と共有する場合）。
+        cancel がセットされると次のチャンクで生成を止め、以後はどのコールバックも呼ばない。
+        remember=False なら結果を翻訳メモリに登録しない（入力途中の文など）。
+        """
+        @profiling.profiled_request("translate_streaming")
         def _translate():
+            # 結果を通知済みか（打ち切りで途中結果を返した後のエラーは通知しない）
+            settled = []
+            self._acquire()
             try:
-                if not self.is_loaded:
-                    if error_callback:
-                        error_callback("❌ 翻訳エンジンが初期化されていません")
-                    return
-                
                 # 言語を自動検出
                 source_lang = detect_language(text)
                 target_lang = "English" if source_lang == "Japanese" else "Japanese"
                 
+                # 翻訳メモリに完全一致があればモデルを使わずに返す
+                memory = self._translation_memory()
+                cached = memory.lookup_exact(text, source_lang, target_lang) if memory else None
+                if cached is not None:
+                    print("📚 翻訳メモリ完全一致 → エンジン呼び出しなし")
+                    if result_buffer is not None:
+                        result_buffer.append(cached)
+                    chunk_callback(cached)
+                    if complete_callback:
+                        complete_callback(cached)
+                    return
+                
+                if not self._ensure_ready():
+                    if error_callback:
+                        error_callback("❌ 翻訳エンジンが初期化されていません")
+                    return
+                
                 print(f"🔄 翻訳開始: {source_lang} → {target_lang}")
                 print(f"📝 入力: {text}")
                 
-                full_result = ""
+                result = result_buffer if result_buffer is not None else ResultBuffer()
                 
-                # ストリーミング翻訳を実行
-                for chunk in self.chain.stream_translate(
-                    text=text,
-                    source_lang=source_lang,
-                    target_lang=target_lang
-                ):
-                    full_result += chunk
-                    chunk_callback(chunk)
-                    # 少し待機してUIの更新を滑らかにする
-                    time.sleep(0.01)
+                # 用語集の用語をプレースホルダで保護
+                protected, glossary_targets = get_glossary().protect(text, source_lang)
+                # 用語復元・改行圧縮・空白除去をチャンク単位で適用
+                pipeline = build_pipeline(glossary_targets)
+                
+                # 打ち切りは監視スレッドから即座に通知し、生成側は次のチャンクで停止する
+                estimator = get_throughput_estimator()
+                settle_lock = threading.Lock()
                 
+                def on_expire(reason):
+                    with settle_lock:
+                        if settled:
+                            return
+                        settled.append(reason)
+                        rest = pipeline.finish()
+                        if rest:
+                            result.append(rest)
+                            chunk_callback(rest)
+                        partial = result.text()
+                    message = describe_expiry(reason, watchdog.limit)
+                    if partial_callback:
+                        partial_callback(partial, message)
+                    elif error_callback:
+                        error_callback(f"❌ {message}")
+                
+                # エンジンの実行枠を優先度順に確保（待ち時間は期限に含めない）
+                with get_scheduler().slot(priority):
+                    watchdog = ProgressWatchdog(
+                        estimator.deadline_for(self.backend, len(protected)),
+                        DEFAULT_STALL_TIMEOUT,
+                        on_expire=on_expire
+                    ).start()
+                
+                    # ストリーミング翻訳を実行（上限トークン数を超える入力はチャンクごと）
+                    stream = self._stream_chunked(protected, source_lang, target_lang)
+                    try:
+                        for chunk in stream:
+                            profiling.mark("first_output")
+                            watchdog.progress()
+                            with settle_lock:
+                                if cancel is not None and cancel.is_set():
+                                    settled.append("cancelled")
+                                if settled:
+                                    break
+                                chunk = pipeline.feed(chunk)
+                                if not chunk:
+                                    continue
+                                result.append(chunk)
+                                chunk_callback(chunk)
+                            # 少し待機してUIの更新を滑らかにする
+                            time.sleep(0.01)
+                    finally:
+                        watchdog.stop()
+                        close = getattr(stream, "close", None)
+                        if close:
+                            close()
+                profiling.mark("backend_done")
+                
+                with settle_lock:
+                    if settled:
+                        return
+                    settled.append(None)
+                    rest = pipeline.finish()
+                    if rest:
+                        result.append(rest)
+                        chunk_callback(rest)
+                
+                full_result = result.text()
                 print(f"✅ 翻訳完了: {full_result}")
+                if watchdog.first_progress is not None:
+                    estimator.record(self.backend, len(protected),
+                                     watchdog.first_progress, watchdog.elapsed)
+                
+                if memory and remember:
+                    memory.add(text, full_result, source_lang, target_lang)
                 
                 if complete_callback:
                     complete_callback(full_result)
@@ -109,30 +446,90 @@ class StreamingTranslator:
             except Exception as e:
                 error_msg = f"❌ 翻訳エラー: {str(e)}"
                 print(error_msg)
-                if error_callback:
+                if error_callback and not settled:
                     error_callback(error_msg)
+            finally:
+                self._release()
         
         # バックグラウンドで翻訳を実行
         thread = threading.Thread(target=_translate, daemon=True)
         thread.start()
     
-    def translate_sync(self, text: str) -> str:
+    def _stream_chunked(self, text: str, source_lang: str, target_lang: str):
+        """チャンクごとに stream_translate を呼び、出力とチャンク間の空白を順に返す"""
+        pieces = plan_chunks(text)
+        for core, trail in pieces:
+            stream = self.chain.stream_translate(text=core, source_lang=source_lang, target_lang=target_lang)
+            try:
+                yield from stream
+            finally:
+                close = getattr(stream, "close", None)
+                if close:
+                    close()
+            if len(pieces) > 1 and trail:
+                yield trail
+    
+    def translate_sync(self, text: str, priority: int = PRIORITY_INTERACTIVE) -> str:
         """同期翻訳（既存コードとの互換性のため）"""
-        if not self.is_loaded:
-            return "❌ 翻訳エンジンが初期化されていません"
-        
+        self._acquire()
         try:
             # 言語を自動検出
             source_lang = detect_language(text)
             target_lang = "English" if source_lang == "Japanese" else "Japanese"
             
-            return self.chain.translate(
-                text=text,
-                source_lang=source_lang,
-                target_lang=target_lang
-            )
+            memory = self._translation_memory()
+            cached = memory.lookup_exact(text, source_lang, target_lang) if memory else None
+            if cached is not None:
+                return cached
+            
+            if not self._ensure_ready():
+                return "❌ 翻訳エンジンが初期化されていません"
+            
+            glossary = get_glossary()
+            protected, glossary_targets = glossary.protect(text, source_lang)
+            with get_scheduler().slot(priority), profiling.span("backend.translate"):
+                raw = translate_chunked(protected, lambda chunk: self.chain.translate(
+                    text=chunk,
+                    source_lang=source_lang,
+                    target_lang=target_lang
+                ))
+            result = build_pipeline(glossary_targets).process(raw)
+            if memory:
+                memory.add(text, result, source_lang, target_lang)
+            return result
         except Exception as e:
             return f"❌ 翻訳エラー: {str(e)}"
+        finally:
+            self._release()
+    
+    def translate_batch(
+        self,
+        segments: List[str],
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        cancel: Optional[threading.Event] = None
+    ) -> List[Optional[str]]:
+        """一括翻訳（セグメントごとにエンジンを確保し直し、対話的翻訳に順番を譲る）
+
+        同じセグメント（正規化後）は1回だけ翻訳し、すべての出現位置に同じ訳文を返す。
+        重複除去の結果は last_batch_stats に残る。
+        """
+        deduper = SegmentDeduper(segments)
+        if deduper.duplicates:
+            print(deduper.describe())
+        translations: List[Optional[str]] = []
+        for index, segment in enumerate(deduper.unique):
+            if cancel is not None and cancel.is_set():
+                translations.extend([None] * (len(deduper.unique) - index))
+                break
+            translations.append(self.translate_sync(segment, priority=PRIORITY_BULK))
+            if progress_callback:
+                progress_callback(index + 1, len(deduper.unique))
+        self.last_batch_stats = deduper.stats()
+        return deduper.expand(translations)
+    
+    def scheduler_metrics(self) -> dict:
+        """優先度クラスごとの待ち行列の長さ・待ち時間"""
+        return get_scheduler().metrics()
 
 
 # グローバルインスタンス（シングルトン）
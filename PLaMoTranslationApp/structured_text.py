@@ -0,0 +1,550 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - Markdown / HTML の構造を保った翻訳
+
+コピーした文書にはコードブロック・URL・マークアップが含まれることが多く、
+そのまま plamo-translate に渡すとトークンを無駄に使い、壊されることもある。
+文書を解析して翻訳すべきテキストノードだけを取り出し、コード・URL・インライン
+コードはエンジンに送らずに残す。ノードは重複を除いて目標トークン数ごとのバッチにまとめて翻訳し、
+元の構造に組み立て直す。バッチはエンジンの実行枠（PLAMO_ENGINE_CONCURRENCY、既定1）の数まで
+並行に送る。既定ではエンジンが1つなので、バッチは順番に翻訳される。
+
+文中のリンク記号・インラインコード・インラインタグは ⟪0⟫ のようなプレースホルダに
+置き換えて送り、訳文中で元に戻す（用語集の ⟦0⟧ とは別の記号）。
+
+測定:
+    python3 structured_text.py --measure
+"""
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from scheduler import get_scheduler
+from segment_dedup import SegmentDeduper
+from token_chunker import DEFAULT_CHUNK_TOKENS, get_tokenizer, pack_segments
+
+FORMAT_PLAIN = "plain"
+FORMAT_MARKDOWN = "markdown"
+FORMAT_HTML = "html"
+
+SPAN_OPEN = "⟪"
+SPAN_CLOSE = "⟫"
+_SPAN_RE = re.compile(f"{SPAN_OPEN}\\s*(\\d+)\\s*{SPAN_CLOSE}")
+
+# 翻訳対象かどうか（プレースホルダを除いて文字を含むか）
+_LETTER_RE = re.compile(r"[^\W\d_]")
+
+# --- インライン要素 ---
+_LINK_RE = re.compile(r"(!?\[)([^\]\n]*)(\]\([^)\n]*\)|\]\[[^\]\n]*\])")
+_INLINE_CODE_RE = re.compile(r"(`+)(?!`).+?(?<!`)\1")
+_INLINE_TAG_RE = re.compile(r"<(?:[A-Za-z/!][^<>\n]*|https?://[^<>\s]+)>")
+_URL_RE = re.compile(r"\b(?:https?://|www\.)[^\s<>()\[\]{}\"'`]+[^\s<>()\[\]{}\"'`.,;:!?]")
+_ENTITY_RE = re.compile(r"&(?:#\d+|#x[0-9A-Fa-f]+|\w+);")
+
+# --- Markdown のブロック要素 ---
+_FENCE_RE = re.compile(r"^ {0,3}(`{3,}|~{3,})")
+_LINE_PREFIX_RE = re.compile(
+    r"^(\s*(?:>\s?)*(?:#{1,6}\s+|[-*+]\s+(?:\[[ xX]\]\s+)?|\d{1,9}[.)]\s+)?)"
+)
+_LIST_ITEM_RE = re.compile(r"^\s*(?:>\s?)*(?:[-*+]|\d{1,9}[.)])\s+")
+_THEMATIC_BREAK_RE = re.compile(r"^ {0,3}(?:(?:\*\s*){3,}|(?:-\s*){3,}|(?:_\s*){3,})$")
+_TABLE_DELIMITER_RE = re.compile(r"^\s*\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?\s*$")
+_TABLE_CELL_SPLIT_RE = re.compile(r"((?<!\\)\|)")
+_LINK_DEFINITION_RE = re.compile(r"^ {0,3}\[[^\]]+\]:\s*\S+")
+_HTML_LINE_RE = re.compile(r"^\s*(?:<[^<>]+>\s*)+$")
+_HEADING_CLOSE_RE = re.compile(r"(\s+#+\s*)$")
+
+# --- HTML ---
+_HTML_TOKEN_RE = re.compile(
+    r"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<![^>]*>|<\?.*?\?>"
+    r"|<(/?)([A-Za-z][\w:-]*)(?:[^>\"']|\"[^\"]*\"|'[^']*')*>",
+    re.DOTALL
+)
+# 文中に現れ、前後の文と一緒に翻訳するタグ
+_INLINE_TAGS = frozenset({
+    "a", "abbr", "b", "bdi", "bdo", "br", "cite", "data", "dfn", "em", "font", "i", "img",
+    "ins", "del", "label", "mark", "q", "s", "small", "span", "strong", "sub", "sup",
+    "time", "u", "wbr",
+})
+# 中身を翻訳しない要素（文中の code / kbd / samp / var は要素ごとプレースホルダにする）
+_VERBATIM_TAGS = frozenset({"script", "style", "pre", "textarea", "svg", "math", "code", "kbd", "samp", "var"})
+_INLINE_VERBATIM_TAGS = frozenset({"code", "kbd", "samp", "var"})
+_HTML_DETECT_RE = re.compile(
+    r"<(?:!doctype|html|head|body|p|div|span|a|h[1-6]|ul|ol|li|table|tr|td|pre|code|br|section|article)\b",
+    re.IGNORECASE
+)
+_MARKDOWN_DETECT_RE = re.compile(
+    r"^ {0,3}(?:#{1,6}\s|```|~~~|[-*+]\s|\d+[.)]\s|>\s?|\|.*\|\s*$)|\[[^\]\n]+\]\([^)\n]+\)|`[^`\n]+`",
+    re.MULTILINE
+)
+
+
+def detect_format(text: str) -> str:
+    """テキストが HTML / Markdown / プレーンテキストのどれらしいか"""
+    if len(_HTML_DETECT_RE.findall(text)) >= 2:
+        return FORMAT_HTML
+    # 番号付きの1行や `x` が1つだけの文章はプレーンテキストとして文脈ごと翻訳する
+    if len(_MARKDOWN_DETECT_RE.findall(text)) >= 2:
+        return FORMAT_MARKDOWN
+    return FORMAT_PLAIN
+
+
+@dataclass
+class TextNode:
+    """翻訳するテキストノード（前後の空白と保護したインライン要素を除いた本文）"""
+    original: str
+    lead: str
+    source: str
+    trail: str
+    spans: List[str] = field(default_factory=list)
+    # 対になるインライン要素（リンクの [ と ](url)、<a> と </a> など）のプレースホルダ番号
+    groups: List[Tuple[int, int]] = field(default_factory=list)
+
+    @property
+    def translatable(self) -> bool:
+        return bool(_LETTER_RE.search(_SPAN_RE.sub("", self.source)))
+
+    def render(self, translated: Optional[str]) -> str:
+        """訳文のプレースホルダを元のインライン要素に戻す（訳文がなければ原文のまま）"""
+        if translated is None:
+            return self.original
+        found = {int(match.group(1)) for match in _SPAN_RE.finditer(translated)}
+        # 対の片方でも落ちた要素は、中の文字列ごと原文のまま付け直す（"[ ](url)" のように崩さない）
+        dropped = set()
+        reattached: List[Tuple[int, str]] = []
+        for first, last in sorted(self.groups, key=lambda group: (group[0], -group[1])):
+            if first in dropped or (first in found and last in found):
+                continue
+            members, text = self._original_group(first, last)
+            dropped.update(members)
+            reattached.append((first, text))
+        used = set()
+
+        def replace(match: "re.Match") -> str:
+            index = int(match.group(1))
+            if index >= len(self.spans) or index in used or index in dropped:
+                return ""
+            used.add(index)
+            return self.spans[index]
+
+        body = _SPAN_RE.sub(replace, translated.strip())
+        # モデルが落としたインライン要素は失わないよう、原文での順に末尾へ付け直す
+        reattached += [(i, span) for i, span in enumerate(self.spans) if i not in used and i not in dropped]
+        if reattached:
+            position = lambda item: self.source.find(f"{SPAN_OPEN}{item[0]}{SPAN_CLOSE}")
+            body = " ".join([body] + [text for _, text in sorted(reattached, key=position)])
+        return f"{self.lead}{body}{self.trail}"
+
+    def _original_group(self, first: int, last: int) -> Tuple[set, str]:
+        """原文のうちプレースホルダ first から last までの部分の (中のプレースホルダ番号, 元の文字列)"""
+        start = self.source.find(f"{SPAN_OPEN}{first}{SPAN_CLOSE}")
+        close = f"{SPAN_OPEN}{last}{SPAN_CLOSE}"
+        end = self.source.find(close, start) + len(close)
+        part = self.source[start:end]
+        members = {int(match.group(1)) for match in _SPAN_RE.finditer(part)}
+        return members, _SPAN_RE.sub(lambda m: self.spans[int(m.group(1))], part)
+
+
+class _SpanCollector:
+    """インライン要素をプレースホルダに置き換える"""
+
+    def __init__(self):
+        self.spans: List[str] = []
+        self.groups: List[Tuple[int, int]] = []
+
+    def placeholder(self, span: str) -> str:
+        self.spans.append(span)
+        return f"{SPAN_OPEN}{len(self.spans) - 1}{SPAN_CLOSE}"
+
+    def protect(self, text: str, markdown: bool) -> str:
+        replace = lambda match: self.placeholder(match.group(0))
+        if markdown:
+            text = _INLINE_CODE_RE.sub(replace, text)
+            # [リンク文字列](URL) は文字列だけを翻訳する
+            text = _LINK_RE.sub(self._protect_link, text)
+            text = _INLINE_TAG_RE.sub(replace, text)
+        else:
+            text = _ENTITY_RE.sub(replace, text)
+        return _URL_RE.sub(replace, text)
+
+    def _protect_link(self, match: "re.Match") -> str:
+        opening = self.placeholder(match.group(1))
+        closing = self.placeholder(match.group(3))
+        self.groups.append((len(self.spans) - 2, len(self.spans) - 1))
+        return f"{opening}{match.group(2)}{closing}"
+
+
+def _make_node(original: str, source: str, collector: _SpanCollector) -> TextNode:
+    stripped = source.strip()
+    if not stripped:
+        return TextNode(original, "", "", "", collector.spans, collector.groups)
+    lead = original[:len(original) - len(original.lstrip())]
+    trail = original[len(original.rstrip()):]
+    return TextNode(original, lead, stripped, trail, collector.spans, collector.groups)
+
+
+class StructuredDocument:
+    """固定部分（str）とテキストノードの並び"""
+
+    def __init__(self, fmt: str):
+        self.format = fmt
+        self.parts: List[Union[str, TextNode]] = []
+
+    def add_verbatim(self, text: str):
+        if not text:
+            return
+        if self.parts and isinstance(self.parts[-1], str):
+            self.parts[-1] += text
+        else:
+            self.parts.append(text)
+
+    def add_node(self, node: TextNode):
+        if node.translatable:
+            self.parts.append(node)
+        else:
+            self.add_verbatim(node.original)
+
+    @property
+    def nodes(self) -> List[TextNode]:
+        return [part for part in self.parts if isinstance(part, TextNode)]
+
+    def render(self, translations: Sequence[Optional[str]]) -> str:
+        """nodes と同じ順の訳文から文書を組み立てる"""
+        out = []
+        it = iter(translations)
+        for part in self.parts:
+            out.append(part if isinstance(part, str) else part.render(next(it)))
+        return "".join(out)
+
+
+def _markdown_line_node(line: str) -> TextNode:
+    """Markdown の1行（行頭の記号を除いた部分）をノードにする"""
+    collector = _SpanCollector()
+    source = collector.protect(line, markdown=True)
+    return _make_node(line, source, collector)
+
+
+def _parse_markdown(text: str) -> StructuredDocument:
+    doc = StructuredDocument(FORMAT_MARKDOWN)
+    fence: Optional[str] = None
+    previous_blank = True
+    in_list = False
+    for line in text.splitlines(keepends=True):
+        body = line.rstrip("\r\n")
+        newline = line[len(body):]
+
+        if fence is not None:
+            doc.add_verbatim(line)
+            stripped = body.strip()
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                fence = None
+            continue
+        match = _FENCE_RE.match(body)
+        if match:
+            fence = match.group(1)
+            doc.add_verbatim(line)
+            previous_blank = False
+            continue
+
+        blank = not body.strip()
+        if blank:
+            doc.add_verbatim(line)
+            previous_blank = True
+            continue
+        if _LIST_ITEM_RE.match(body):
+            in_list = True
+        elif previous_blank and not body.startswith((" ", "\t")):
+            in_list = False
+
+        # インデントによるコードブロック（リストの続きの行は除く）
+        indented_code = previous_blank and not in_list and (body.startswith("    ") or body.startswith("\t"))
+        previous_blank = False
+        if (indented_code or _THEMATIC_BREAK_RE.match(body) or _TABLE_DELIMITER_RE.match(body)
+                or _LINK_DEFINITION_RE.match(body) or _HTML_LINE_RE.match(body)):
+            doc.add_verbatim(line)
+            continue
+
+        if body.lstrip().startswith("|"):
+            # 表の行はセルごとに翻訳する
+            for cell in _TABLE_CELL_SPLIT_RE.split(body):
+                if cell == "|":
+                    doc.add_verbatim(cell)
+                else:
+                    doc.add_node(_markdown_line_node(cell))
+            doc.add_verbatim(newline)
+            continue
+
+        prefix = _LINE_PREFIX_RE.match(body).group(1)
+        content = body[len(prefix):]
+        suffix = ""
+        if prefix.lstrip().startswith("#"):
+            closing = _HEADING_CLOSE_RE.search(content)
+            if closing:
+                suffix = closing.group(1)
+                content = content[:closing.start()]
+        doc.add_verbatim(prefix)
+        doc.add_node(_markdown_line_node(content))
+        doc.add_verbatim(suffix + newline)
+    return doc
+
+
+class _HTMLNodeBuilder:
+    """ブロック境界までのテキストとインラインタグを1つのノードにまとめる"""
+
+    def __init__(self, doc: StructuredDocument):
+        self.doc = doc
+        self.collector = _SpanCollector()
+        self.original: List[str] = []
+        self.source: List[str] = []
+        # 閉じタグを待っているインラインタグ（タグ名, プレースホルダ番号）
+        self.open_tags: List[Tuple[str, int]] = []
+
+    @property
+    def empty(self) -> bool:
+        return not self.original
+
+    def add_text(self, text: str):
+        self.original.append(text)
+        # HTML では空白の並びは1つの空白と同じなので、改行も含めて詰めて1行にする
+        self.source.append(re.sub(r"\s+", " ", self.collector.protect(text, markdown=False)))
+
+    def add_inline(self, markup: str, name: str = "", closing: bool = False):
+        self.original.append(markup)
+        self.source.append(self.collector.placeholder(markup))
+        index = len(self.collector.spans) - 1
+        if not name or markup.endswith("/>"):
+            return
+        if not closing:
+            self.open_tags.append((name, index))
+            return
+        for position in range(len(self.open_tags) - 1, -1, -1):
+            if self.open_tags[position][0] == name:
+                self.collector.groups.append((self.open_tags[position][1], index))
+                del self.open_tags[position:]
+                break
+
+    def flush(self):
+        if self.original:
+            self.doc.add_node(_make_node("".join(self.original), "".join(self.source), self.collector))
+        self.collector = _SpanCollector()
+        self.original = []
+        self.source = []
+        self.open_tags = []
+
+
+def _parse_html(text: str) -> StructuredDocument:
+    doc = StructuredDocument(FORMAT_HTML)
+    builder = _HTMLNodeBuilder(doc)
+    position = 0
+    while position < len(text):
+        match = _HTML_TOKEN_RE.search(text, position)
+        if match is None:
+            builder.add_text(text[position:])
+            break
+        if match.start() > position:
+            builder.add_text(text[position:match.start()])
+        position = match.end()
+        markup = match.group(0)
+        closing, name = match.group(1), (match.group(2) or "").lower()
+
+        if name in _VERBATIM_TAGS and not closing and not markup.endswith("/>"):
+            # 対応する閉じタグまでをそのまま残す
+            end = re.compile(f"</{name}\\s*>", re.IGNORECASE).search(text, position)
+            position = end.end() if end else len(text)
+            element = text[match.start():position]
+            if name in _INLINE_VERBATIM_TAGS and not builder.empty:
+                builder.add_inline(element)
+            else:
+                builder.flush()
+                doc.add_verbatim(element)
+        elif name in _INLINE_TAGS:
+            builder.add_inline(markup, name, bool(closing))
+        else:
+            builder.flush()
+            doc.add_verbatim(markup)
+    builder.flush()
+    return doc
+
+
+def _parse_plain(text: str) -> StructuredDocument:
+    doc = StructuredDocument(FORMAT_PLAIN)
+    for line in text.splitlines(keepends=True):
+        body = line.rstrip("\r\n")
+        collector = _SpanCollector()
+        doc.add_node(_make_node(body, _URL_RE.sub(lambda m: collector.placeholder(m.group(0)), body), collector))
+        doc.add_verbatim(line[len(body):])
+    return doc
+
+
+def parse_document(text: str, fmt: Optional[str] = None) -> StructuredDocument:
+    """文書を固定部分とテキストノードに分解（fmt を省略すると自動判定）"""
+    fmt = fmt or detect_format(text)
+    if fmt == FORMAT_HTML:
+        return _parse_html(text)
+    if fmt == FORMAT_MARKDOWN:
+        return _parse_markdown(text)
+    return _parse_plain(text)
+
+
+def translate_document(
+    text: str,
+    translate_fn: Callable[[str], str],
+    fmt: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    batch_tokens: int = DEFAULT_CHUNK_TOKENS
+) -> Tuple[str, Dict[str, Union[int, float, str]]]:
+    """構造を保って翻訳する
+
+    translate_fn は改行区切りの複数行を受け取り、同じ行数の訳文を返す関数。
+    行数が合わないバッチは1ノードずつ翻訳し直す。
+    max_workers を省略するとエンジンスケジューラの同時実行数を使う（枠を超えて並べても
+    スケジューラで待たされるだけのため）。
+    """
+    if max_workers is None:
+        max_workers = get_scheduler().concurrency
+    doc = parse_document(text, fmt)
+    nodes = doc.nodes
+    deduper = SegmentDeduper([node.source for node in nodes])
+    batches = pack_segments(deduper.unique, batch_tokens)
+    engine_calls = [0] * len(batches)
+
+    def run_batch(index: int) -> List[str]:
+        batch = batches[index]
+        engine_calls[index] += 1
+        lines = [line for line in translate_fn("\n".join(batch)).split("\n") if line.strip()]
+        if len(lines) == len(batch):
+            return lines
+        if len(batch) == 1:
+            return [" ".join(lines)]
+        engine_calls[index] += len(batch)
+        return [translate_fn(segment).replace("\n", " ") for segment in batch]
+
+    translations: List[Optional[str]] = []
+    workers = max(1, min(max_workers, len(batches)))
+    if workers == 1:
+        for index in range(len(batches)):
+            translations.extend(run_batch(index))
+    elif batches:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for lines in executor.map(run_batch, range(len(batches))):
+                translations.extend(lines)
+
+    result = doc.render(deduper.expand(translations))
+    sent = "\n".join(deduper.unique)
+    tokens_total, tokens_sent = get_tokenizer().count_batch([text, sent])
+    stats = {
+        "format": doc.format,
+        "nodes": len(nodes),
+        "unique": len(deduper.unique),
+        "batches": len(batches),
+        "engine_calls": sum(engine_calls),
+        "chars_total": len(text),
+        "chars_sent": len(sent),
+        "tokens_total": tokens_total,
+        "tokens_sent": tokens_sent,
+        "tokens_saved_ratio": 1 - tokens_sent / tokens_total if tokens_total else 0.0,
+    }
+    return result, stats
+
+
+def describe_stats(stats: Dict[str, Union[int, float, str]]) -> str:
+    """ログ用の1行要約"""
+    return (f"🧩 構造認識翻訳（{stats['format']}）: {stats['nodes']}ノード→{stats['batches']}バッチ、"
+            f"送信トークン {stats['tokens_sent']}/{stats['tokens_total']}"
+            f"（{stats['tokens_saved_ratio']:.0%}削減）")
+
+
+_SAMPLE_MARKDOWN = """# Getting started
+
+Install the package with `pip install plamo-translate` and run the server.
+See the [installation guide](https://example.com/docs/install) for details.
+
+```python
+from plamo_translate import Translator
+
+translator = Translator(model="plamo-2-translate")
+for chunk in translator.stream("Hello, world!"):
+    print(chunk, end="", flush=True)
+```
+
+## Configuration
+
+| Option | Description |
+|--------|-------------|
+| `--from` | Source language. |
+| `--to` | Target language. |
+
+- The server listens on http://localhost:8000/mcp by default.
+- Use `PLAMO_SERVER_URL` to point the client at another server.
+
+Translate a file from the command line:
+
+    $ plamo-translate --from English --to Japanese < input.txt
+"""
+
+_SAMPLE_HTML = """<html><head><style>body { font-family: sans-serif; }</style>
+<script>window.dataLayer = window.dataLayer || [];</script></head>
+<body><h1>Release notes</h1>
+<p>This release adds <strong>streaming output</strong> and fixes a crash in <code>translate_batch()</code>.
+Read the <a href="https://example.com/changelog">full changelog</a> for details.</p>
+<pre>plamo-translate --from English --to Japanese --stream</pre>
+<ul><li>Faster startup</li><li>Lower memory usage</li></ul></body></html>
+"""
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from mcp_stub import StubConfig
+
+    arg_parser = argparse.ArgumentParser(description="Markdown / HTML の構造を保った翻訳")
+    arg_parser.add_argument("file", nargs="?", help="翻訳する文書（省略時は標準入力）")
+    arg_parser.add_argument("--format", choices=[FORMAT_MARKDOWN, FORMAT_HTML, FORMAT_PLAIN])
+    arg_parser.add_argument("--measure", action="store_true",
+                            help="サンプル文書で送信トークン数と並列化の効果を測定（スタブ使用）")
+    arg_parser.add_argument("--repeat", type=int, default=20, help="--measure で連結するサンプルの数")
+    arg_parser.add_argument("--workers", type=int,
+                            help="同時に送るバッチ数（省略時はエンジンの同時実行数。--measure では4）")
+    args = arg_parser.parse_args()
+
+    if args.measure:
+        args.workers = args.workers or 4
+        stub = StubConfig(latency_ms=0, per_char_ms=0.2)
+
+        def stub_translate(source: str) -> str:
+            time.sleep(0.05)
+            stub.sleep(len(source))
+            return "\n".join(f"[訳]{line}" for line in source.split("\n"))
+
+        for name, sample in (("Markdown", _SAMPLE_MARKDOWN), ("HTML", _SAMPLE_HTML)):
+            # コピーごとに文面を変え、重複除去ではなく構造認識だけの効果を測る
+            document = "\n".join(
+                re.sub(r"\b(server|release|details|language|startup|usage)\b", f"\\g<1> {i}", sample)
+                for i in range(args.repeat)
+            )
+            start = time.perf_counter()
+            stub_translate(document)
+            whole = time.perf_counter() - start
+            timings = {}
+            for workers in (1, args.workers):
+                start = time.perf_counter()
+                result, stats = translate_document(document, stub_translate, max_workers=workers)
+                timings[workers] = time.perf_counter() - start
+            print(f"📄 {name}（{len(document)}文字）")
+            print(f"  {describe_stats(stats)}")
+            print(f"  全文をそのまま翻訳: {whole * 1000:.0f}ms / 構造認識 1並列: {timings[1] * 1000:.0f}ms"
+                  f" / {args.workers}並列: {timings[args.workers] * 1000:.0f}ms")
+        sys.exit(0)
+
+    from translation_client import get_translation_client
+
+    source_text = open(args.file, encoding="utf-8").read() if args.file else sys.stdin.read()
+    client = get_translation_client()
+    translated_text, document_stats = translate_document(
+        source_text, client.translate_sync, args.format, max_workers=args.workers
+    )
+    print(describe_stats(document_stats), file=sys.stderr)
+    print(translated_text)
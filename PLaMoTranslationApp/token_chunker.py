@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - トークン数に基づくチャンク分割
+
+文字数や行で区切ると、チャンクが小さすぎて呼び出しごとのオーバーヘッドが支配的に
+なるか、大きすぎてコンテキストからあふれる。PLaMo のトークナイザ（1度だけ読み込んで
+使い回す）で文ごとのトークン数をまとめて数え、連続する文を目標トークン数に近い
+チャンクへ詰める。段落の途中では、詰めきれない場合を除いて区切らない。
+
+transformers やトークナイザのファイルがない環境では、文字種から求めた概算で数える。
+
+上限（PLAMO_MAX_CHUNK_TOKENS）を超える入力は、アプリの翻訳経路（translator.py・
+StreamingTranslator）でも plan_chunks / translate_chunked でチャンクごとに翻訳する。
+
+ベンチマーク:
+    python3 token_chunker.py --paragraphs 20000
+"""
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Sequence, Tuple
+
+try:
+    from transformers import AutoTokenizer
+    TRANSFORMERS_AVAILABLE = True
+except ImportError:
+    TRANSFORMERS_AVAILABLE = False
+
+DEFAULT_TOKENIZER = os.environ.get("PLAMO_TOKENIZER", "pfnet/plamo-2-translate")
+# 1チャンクの目標トークン数と上限（上限を超える文は途中で分ける）
+DEFAULT_CHUNK_TOKENS = int(os.environ.get("PLAMO_CHUNK_TOKENS", "512"))
+DEFAULT_MAX_CHUNK_TOKENS = int(os.environ.get("PLAMO_MAX_CHUNK_TOKENS", "1024"))
+# 段落の途中で区切るのは、チャンクがこの割合に満たない場合だけ
+PARAGRAPH_FILL_RATIO = 0.5
+# トークナイザに1回で渡す文の数
+_ENCODE_BATCH = 1024
+
+_APPROX_TOKEN_RE = re.compile(r"[A-Za-z]+|\d+|\S")
+_PARAGRAPH_RE = re.compile(r"(?<=\n)\s*\n")
+_SENTENCE_END_RE = re.compile(r"(?:[。！？!?]+[」』）)\"']*|\.(?=\s|$)|\n)\s*")
+_BREAK_CHARS = " \t、，,;；:："
+
+
+class ApproxTokenizer:
+    """トークナイザがない環境での概算（英字は4文字、数字は3文字で1トークン、その他は1文字1トークン）"""
+
+    name = "approx"
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        counts = []
+        for text in texts:
+            total = 0
+            for token in _APPROX_TOKEN_RE.findall(text):
+                first = token[0]
+                if first.isascii() and first.isalpha():
+                    total += (len(token) + 3) // 4
+                elif first.isdigit():
+                    total += (len(token) + 2) // 3
+                else:
+                    total += 1
+            counts.append(total)
+        return counts
+
+
+class HFTokenizer:
+    """transformers のトークナイザ（高速版ならバッチ単位で並列にエンコードされる）"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tokenizer = AutoTokenizer.from_pretrained(name, trust_remote_code=True)
+
+    def count_batch(self, texts: Sequence[str]) -> List[int]:
+        counts: List[int] = []
+        for start in range(0, len(texts), _ENCODE_BATCH):
+            encoded = self._tokenizer(
+                list(texts[start:start + _ENCODE_BATCH]),
+                add_special_tokens=False,
+                return_attention_mask=False
+            )
+            counts.extend(len(ids) for ids in encoded["input_ids"])
+        return counts
+
+
+_tokenizer_instance = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer():
+    """トークン数を数えるトークナイザのシングルトン（読み込めなければ概算）"""
+    global _tokenizer_instance
+    if _tokenizer_instance is None:
+        with _tokenizer_lock:
+            if _tokenizer_instance is None:
+                tokenizer = ApproxTokenizer()
+                if TRANSFORMERS_AVAILABLE:
+                    try:
+                        tokenizer = HFTokenizer(DEFAULT_TOKENIZER)
+                        print(f"🔤 トークナイザ読み込み: {DEFAULT_TOKENIZER}")
+                    except Exception as e:
+                        print(f"⚠️ トークナイザを読み込めないため概算を使用: {e}")
+                _tokenizer_instance = tokenizer
+    return _tokenizer_instance
+
+
+def count_tokens(text: str) -> int:
+    return get_tokenizer().count_batch([text])[0]
+
+
+@dataclass
+class Chunk:
+    text: str
+    tokens: int
+
+
+def split_sentences(paragraph: str) -> List[str]:
+    """文に分割（後ろの空白・改行は直前の文に含め、連結すると元に戻る）"""
+    sentences = []
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(paragraph):
+        if match.end() > start:
+            sentences.append(paragraph[start:match.end()])
+            start = match.end()
+    if start < len(paragraph):
+        sentences.append(paragraph[start:])
+    return sentences
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """空行で段落に分割（空行は直前の段落に含める）"""
+    paragraphs = []
+    start = 0
+    for match in _PARAGRAPH_RE.finditer(text):
+        paragraphs.append(text[start:match.end()])
+        start = match.end()
+    if start < len(text):
+        paragraphs.append(text[start:])
+    return paragraphs
+
+
+def _split_long(sentence: str, tokens: int, max_tokens: int) -> List[str]:
+    """上限を超える文を、トークン数に比例した位置に近い空白・読点で分ける"""
+    pieces = -(-tokens // max_tokens)
+    step = len(sentence) / pieces
+    parts = []
+    start = 0
+    for i in range(1, pieces):
+        target = int(step * i)
+        cut = target
+        for offset in range(int(step / 4)):
+            if target + offset < len(sentence) and sentence[target + offset] in _BREAK_CHARS:
+                cut = target + offset + 1
+                break
+            if target - offset > start and sentence[target - offset] in _BREAK_CHARS:
+                cut = target - offset + 1
+                break
+        if cut > start:
+            parts.append(sentence[start:cut])
+            start = cut
+    parts.append(sentence[start:])
+    return parts
+
+
+class _Packer:
+    def __init__(self, target_tokens: int):
+        self.target_tokens = target_tokens
+        self.chunks: List[Chunk] = []
+        self._texts: List[str] = []
+        self._tokens = 0
+
+    def room(self) -> int:
+        return self.target_tokens - self._tokens
+
+    def add(self, text: str, tokens: int):
+        if self._texts and tokens > self.room():
+            self.flush()
+        self._texts.append(text)
+        self._tokens += tokens
+
+    def flush(self):
+        if self._texts:
+            self.chunks.append(Chunk("".join(self._texts), self._tokens))
+        self._texts = []
+        self._tokens = 0
+
+    @property
+    def filled(self) -> float:
+        return self._tokens / self.target_tokens
+
+
+def pack_chunks(
+    text: str,
+    target_tokens: int = DEFAULT_CHUNK_TOKENS,
+    max_tokens: int = DEFAULT_MAX_CHUNK_TOKENS,
+    tokenizer=None
+) -> List[Chunk]:
+    """連続する文を target_tokens に近いチャンクへ詰める（連結すると元のテキストに戻る）"""
+    tokenizer = tokenizer or get_tokenizer()
+    paragraphs = [split_sentences(p) for p in split_paragraphs(text)]
+    # 全文のトークン数を1回のバッチで数える
+    counts = iter(tokenizer.count_batch([s for sentences in paragraphs for s in sentences]))
+    packer = _Packer(target_tokens)
+    for sentences in paragraphs:
+        sentence_tokens = [next(counts) for _ in sentences]
+        total = sum(sentence_tokens)
+        if total <= packer.room():
+            packer.add("".join(sentences), total)
+            continue
+        if total <= target_tokens and packer.filled >= PARAGRAPH_FILL_RATIO:
+            # 段落ごと次のチャンクへ
+            packer.flush()
+            packer.add("".join(sentences), total)
+            continue
+        for sentence, tokens in zip(sentences, sentence_tokens):
+            if tokens <= max_tokens:
+                packer.add(sentence, tokens)
+                continue
+            parts = _split_long(sentence, tokens, max_tokens)
+            for part, part_tokens in zip(parts, tokenizer.count_batch(parts)):
+                packer.add(part, part_tokens)
+    packer.flush()
+    return packer.chunks
+
+
+def plan_chunks(
+    text: str,
+    target_tokens: int = DEFAULT_CHUNK_TOKENS,
+    max_tokens: int = DEFAULT_MAX_CHUNK_TOKENS,
+    tokenizer=None
+) -> List[Tuple[str, str]]:
+    """1回で翻訳する (本文, 後ろの空白) の列。上限以下の入力は分けずに [(text, "")] を返す"""
+    # トークン数は文字数を超えないため、短い入力はトークナイザを使わずに判定する
+    if len(text) <= max_tokens:
+        return [(text, "")]
+    tokenizer = tokenizer or get_tokenizer()
+    if tokenizer.count_batch([text])[0] <= max_tokens:
+        return [(text, "")]
+    pieces = []
+    for chunk in pack_chunks(text, target_tokens, max_tokens, tokenizer):
+        core = chunk.text.strip()
+        if core:
+            pieces.append((core, chunk.text[len(chunk.text.rstrip()):]))
+        elif pieces:
+            pieces[-1] = (pieces[-1][0], pieces[-1][1] + chunk.text)
+    return pieces or [(text, "")]
+
+
+def translate_chunked(text: str, translate_fn: Callable[[str], str], **kwargs) -> str:
+    """上限を超える入力はチャンクごとに translate_fn で翻訳し、段落・改行を保って連結する"""
+    pieces = plan_chunks(text, **kwargs)
+    if len(pieces) == 1:
+        return translate_fn(pieces[0][0])
+    return "".join(translate_fn(core).strip() + trail for core, trail in pieces)
+
+
+def pack_segments(
+    segments: Sequence[str],
+    target_tokens: int = DEFAULT_CHUNK_TOKENS,
+    tokenizer=None
+) -> List[List[str]]:
+    """分割済みのセグメント（行など）を順番を保ったまま target_tokens ごとのグループにまとめる"""
+    tokenizer = tokenizer or get_tokenizer()
+    groups: List[List[str]] = []
+    room = 0
+    for segment, tokens in zip(segments, tokenizer.count_batch(segments)):
+        if groups and tokens <= room:
+            groups[-1].append(segment)
+            room -= tokens
+        else:
+            groups.append([segment])
+            room = target_tokens - tokens
+    return groups
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import statistics
+    import time
+
+    arg_parser = argparse.ArgumentParser(description="トークン数に基づくチャンク分割のベンチマーク")
+    arg_parser.add_argument("--paragraphs", type=int, default=20000)
+    arg_parser.add_argument("--target", type=int, default=DEFAULT_CHUNK_TOKENS)
+    arg_parser.add_argument("--file", help="合成コーパスの代わりに使うテキストファイル")
+    args = arg_parser.parse_args()
+
+    if args.file:
+        corpus = open(args.file, encoding="utf-8").read()
+    else:
+        gen = random.Random(7)
+        words = ("the model translation server request token stream latency memory batch "
+                 "context window sentence paragraph document cache").split()
+        ja = ["翻訳結果を表示します", "モデルを読み込んでいます", "サーバーに接続しました", "文書を段落に分割する",
+              "トークン数を数える", "応答が遅い場合は再試行します"]
+
+        def sentence() -> str:
+            if gen.random() < 0.5:
+                return " ".join(gen.choices(words, k=gen.randint(6, 24))).capitalize() + ". "
+            return "、".join(gen.choices(ja, k=gen.randint(1, 4))) + "。"
+
+        corpus = "\n\n".join(
+            "".join(sentence() for _ in range(gen.randint(1, 8))).strip() for _ in range(args.paragraphs)
+        )
+
+    tokenizer = get_tokenizer()
+    print(f"📚 コーパス: {len(corpus) / 1e6:.1f}M文字 / トークナイザ: {tokenizer.name}")
+
+    start = time.perf_counter()
+    chunks = pack_chunks(corpus, args.target, tokenizer=tokenizer)
+    elapsed = time.perf_counter() - start
+    assert "".join(c.text for c in chunks) == corpus
+    fill = [c.tokens / args.target for c in chunks[:-1]]
+    print(f"📦 トークン詰め: {len(chunks)}チャンク / {len(chunks) / elapsed:,.0f} chunks/s"
+          f"（{elapsed * 1000:.0f}ms）/ 充填率 平均 {statistics.mean(fill):.0%}"
+          f"・最小 {min(fill):.0%} / 上限超過 {sum(c.tokens > DEFAULT_MAX_CHUNK_TOKENS for c in chunks)}")
+
+    # 文ごとに1回ずつ数える場合との比較
+    sentences = [s for p in split_paragraphs(corpus) for s in split_sentences(p)][:20000]
+    start = time.perf_counter()
+    for s in sentences:
+        tokenizer.count_batch([s])
+    one_by_one = time.perf_counter() - start
+    start = time.perf_counter()
+    tokenizer.count_batch(sentences)
+    batched = time.perf_counter() - start
+    print(f"🔤 {len(sentences)}文のトークン数: 1文ずつ {one_by_one * 1000:.0f}ms / まとめて {batched * 1000:.0f}ms")
+
+    # 文字数・行による分割との比較（同じ平均サイズになる文字数で区切る）
+    chars_per_chunk = len(corpus) // max(1, len(chunks))
+    by_chars = [corpus[i:i + chars_per_chunk] for i in range(0, len(corpus), chars_per_chunk)]
+    by_lines = [line for line in corpus.split("\n") if line.strip()]
+    for name, pieces in (("トークン詰め", [c.text for c in chunks]), ("文字数", by_chars), ("行", by_lines)):
+        counts = tokenizer.count_batch(pieces)
+        mid_sentence = sum(1 for piece in pieces[:-1] if not piece.rstrip().endswith(("。", ".", "!", "?", "！", "？")))
+        print(f"  {name}で分割: {len(pieces)}チャンク / 目標の{statistics.mean(counts) / args.target:.0%}"
+              f"（標準偏差 {statistics.pstdev(counts):.0f}トークン）/ 上限超過 "
+              f"{sum(c > DEFAULT_MAX_CHUNK_TOKENS for c in counts)} / 文の途中で分割 {mid_sentence}")
@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 翻訳サーバー（/mcp）のクライアント
+
+StreamingTranslator と同じ translate_streaming / translate_sync / translate_batch を、
+起動済みの翻訳サーバー（または mcp_router.py）への HTTP で実装する。
+
+- 接続はプールして keep-alive で再利用する（リクエストごとに TCP 接続を張らない）
+- ストリーミング応答（NDJSON の {"delta": ...} 行）をチャンクごとに通知する
+  （サーバーが通常の JSON で返した場合は全文を1チャンクとして扱う）
+- 一括翻訳は同時送信数を max_in_flight 件に抑え、結果は入力順に返す
+- サーバーに接続できない場合はローカルの plamo-translate CLI で翻訳し、
+  しばらくはサーバーを試さない
+
+例:
+    python3 translation_client.py --stub --batch 200 --max-in-flight 8
+    python3 translation_client.py --url http://127.0.0.1:30000 "こんにちは"
+"""
+import http.client
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional
+
+from deadlines import DeadlineExceeded, describe_expiry, run_cli_streaming
+from glossary import get_glossary
+from mcp_stub import MCP_PATH, build_request, parse_url
+from postprocess import build_pipeline
+from result_buffer import ResultBuffer
+from scheduler import PRIORITY_INTERACTIVE
+from segment_dedup import SegmentDeduper
+from streaming_translator import detect_language
+
+DEFAULT_SERVER_URL = os.environ.get("PLAMO_SERVER_URL", "http://127.0.0.1:30000")
+# プールする接続数（同時に送れるリクエスト数の上限）
+DEFAULT_POOL_SIZE = int(os.environ.get("PLAMO_CLIENT_POOL", "8"))
+DEFAULT_TIMEOUT = float(os.environ.get("PLAMO_CLIENT_TIMEOUT", "120"))
+# サーバーに接続できなかった後、CLI だけを使う秒数
+SERVER_RETRY_AFTER = float(os.environ.get("PLAMO_CLIENT_RETRY_AFTER", "10"))
+PLAMO_CLI = os.environ.get("PLAMO_CLI", "/opt/homebrew/bin/plamo-translate")
+
+
+class ServerUnavailable(Exception):
+    """翻訳サーバーに接続できない（CLI にフォールバックする）"""
+
+
+class ConnectionPool:
+    """keep-alive の HTTP 接続プール（空き接続は後入れ先出しで再利用）"""
+
+    def __init__(self, host: str, port: int, size: int = DEFAULT_POOL_SIZE, timeout: float = DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def connection(self) -> Iterator[http.client.HTTPConnection]:
+        """接続を借りる。例外で抜けた接続は壊れている可能性があるので捨てる"""
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+                self.reused += 1
+            except queue.Empty:
+                conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+                self.created += 1
+            try:
+                yield conn
+            except BaseException:
+                conn.close()
+                raise
+            self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class TranslationClient:
+    """翻訳サーバーのクライアント（StreamingTranslator と同じ呼び出し方）"""
+
+    def __init__(
+        self,
+        url: str = DEFAULT_SERVER_URL,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+        cli_fallback: bool = True
+    ):
+        host, port = parse_url(url)
+        self.url = url
+        self.pool = ConnectionPool(host, port, pool_size, timeout)
+        self.cli_fallback = cli_fallback
+        self._server_down_until = 0.0
+        self.server_requests = 0
+        self.cli_requests = 0
+        self.last_batch_stats: Optional[dict] = None
+
+    # ---- 送信 ----
+
+    def _post(self, body: dict, on_delta: Optional[Callable[[str], None]]) -> str:
+        """/mcp に送信して訳文を返す。接続できなければ ServerUnavailable"""
+        if time.monotonic() < self._server_down_until:
+            raise ServerUnavailable(f"{self.url} は応答していません")
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        for attempt in range(2):
+            try:
+                with self.pool.connection() as conn:
+                    if conn.sock is None:
+                        # 接続できない場合だけ CLI に切り替える（送信後の失敗で二重に翻訳しない）
+                        try:
+                            conn.connect()
+                        except OSError as e:
+                            self._server_down_until = time.monotonic() + SERVER_RETRY_AFTER
+                            raise ServerUnavailable(f"{self.url}: {e}") from e
+                    conn.request("POST", MCP_PATH, body=data, headers={"Content-Type": "application/json"})
+                    response = conn.getresponse()
+                    return self._read_response(response, on_delta)
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # サーバー側で閉じられた keep-alive 接続を使った場合は1度だけ送り直す
+                if attempt:
+                    raise
+        raise AssertionError("unreachable")
+
+    def _read_response(self, response: http.client.HTTPResponse, on_delta: Optional[Callable[[str], None]]) -> str:
+        self.server_requests += 1
+        if response.status != 200:
+            detail = response.read().decode("utf-8", "replace")
+            raise RuntimeError(f"HTTP {response.status}: {detail}")
+        if "ndjson" not in response.getheader("Content-Type", ""):
+            translated = json.loads(response.read())["translated_text"]
+            if on_delta:
+                on_delta(translated)
+            return translated
+        translated = None
+        while True:
+            line = response.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if "delta" in message:
+                if on_delta:
+                    on_delta(message["delta"])
+            else:
+                translated = message["translated_text"]
+        if translated is None:
+            raise RuntimeError("ストリーミング応答が途中で終了しました")
+        return translated
+
+    def _translate_cli(self, text: str, source_lang: str, target_lang: str,
+                       on_delta: Optional[Callable[[str], None]]) -> str:
+        self.cli_requests += 1
+        return run_cli_streaming(
+            [PLAMO_CLI, "--from", source_lang, "--to", target_lang],
+            text,
+            on_chunk=on_delta,
+            backend="cli"
+        )
+
+    def _translate(self, text: str, stream: bool, on_delta: Optional[Callable[[str], None]] = None) -> str:
+        """用語集で保護した原文をサーバー（不可なら CLI）で翻訳し、生の訳文を返す"""
+        source_lang = detect_language(text)
+        target_lang = "English" if source_lang == "Japanese" else "Japanese"
+        try:
+            return self._post(build_request(text, source_lang, target_lang, stream=stream), on_delta)
+        except ServerUnavailable as e:
+            if not self.cli_fallback:
+                raise
+            print(f"⚠️ {e} → CLIで翻訳")
+            return self._translate_cli(text, source_lang, target_lang, on_delta)
+
+    # ---- StreamingTranslator 互換 API ----
+
+    def translate_streaming(
+        self,
+        text: str,
+        chunk_callback: Callable[[str], None],
+        complete_callback: Optional[Callable[[str], None]] = None,
+        error_callback: Optional[Callable[[str], None]] = None,
+        partial_callback: Optional[Callable[[str, str], None]] = None,
+        priority: int = PRIORITY_INTERACTIVE,
+        result_buffer: Optional[ResultBuffer] = None
+    ):
+        """ストリーミング翻訳を実行（priority はサーバー側で扱わないため互換のためだけに受け取る）"""
+        def _translate():
+            result = result_buffer if result_buffer is not None else ResultBuffer()
+            protected, glossary_targets = get_glossary().protect(text, detect_language(text))
+            pipeline = build_pipeline(glossary_targets)
+
+            def on_delta(chunk: str):
+                chunk = pipeline.feed(chunk)
+                if chunk:
+                    result.append(chunk)
+                    chunk_callback(chunk)
+
+            def flush():
+                rest = pipeline.finish()
+                if rest:
+                    result.append(rest)
+                    chunk_callback(rest)
+
+            try:
+                self._translate(protected, stream=True, on_delta=on_delta)
+                flush()
+                if complete_callback:
+                    complete_callback(result.text())
+            except DeadlineExceeded as e:
+                flush()
+                message = describe_expiry(e.reason, e.limit)
+                if partial_callback:
+                    partial_callback(result.text(), message)
+                elif error_callback:
+                    error_callback(f"❌ {message}")
+            except Exception as e:
+                error_msg = f"❌ 翻訳エラー: {str(e)}"
+                print(error_msg)
+                if error_callback:
+                    error_callback(error_msg)
+
+        thread = threading.Thread(target=_translate, daemon=True)
+        thread.start()
+
+    def translate_sync(self, text: str, priority: int = PRIORITY_INTERACTIVE) -> str:
+        """同期翻訳（失敗時は StreamingTranslator と同じくエラーメッセージを返す）"""
+        try:
+            protected, glossary_targets = get_glossary().protect(text, detect_language(text))
+            raw = self._translate(protected, stream=False)
+            return build_pipeline(glossary_targets).process(raw)
+        except Exception as e:
+            return f"❌ 翻訳エラー: {str(e)}"
+
+    def translate_batch(
+        self,
+        segments: List[str],
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        cancel: Optional[threading.Event] = None,
+        max_in_flight: int = 4
+    ) -> List[Optional[str]]:
+        """一括翻訳（同時送信は max_in_flight 件まで、結果は入力順。取り消し後の分は None）
+
+        同じセグメント（正規化後）は1回だけサーバーに送り、訳文をすべての出現位置に戻す。
+        """
+        deduper = SegmentDeduper(segments)
+        if deduper.duplicates:
+            print(deduper.describe())
+        unique = deduper.unique
+        results: List[Optional[str]] = [None] * len(unique)
+        done = 0
+        done_lock = threading.Lock()
+
+        def work(index: int):
+            nonlocal done
+            if cancel is not None and cancel.is_set():
+                return
+            results[index] = self.translate_sync(unique[index])
+            with done_lock:
+                done += 1
+                completed = done
+            if progress_callback:
+                progress_callback(completed, len(unique))
+
+        with ThreadPoolExecutor(max_workers=max(1, max_in_flight)) as executor:
+            for future in [executor.submit(work, i) for i in range(len(unique))]:
+                future.result()
+        self.last_batch_stats = deduper.stats()
+        return deduper.expand(results)
+
+    def stats(self) -> dict:
+        return {
+            "server_requests": self.server_requests,
+            "cli_requests": self.cli_requests,
+            "connections_created": self.pool.created,
+            "connections_reused": self.pool.reused,
+        }
+
+    def close(self):
+        self.pool.close()
+
+
+# グローバルインスタンス（シングルトン）
+_client_instance: Optional[TranslationClient] = None
+
+
+def get_translation_client() -> TranslationClient:
+    """翻訳サーバークライアントのシングルトンインスタンスを取得"""
+    global _client_instance
+    if _client_instance is None:
+        _client_instance = TranslationClient()
+    return _client_instance
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from loadgen import DEFAULT_CORPUS
+    from mcp_stub import StubConfig, StubServer
+
+    arg_parser = argparse.ArgumentParser(description="翻訳サーバークライアント")
+    arg_parser.add_argument("text", nargs="?", help="翻訳するテキスト（省略時は一括翻訳の計測）")
+    arg_parser.add_argument("--url", default=DEFAULT_SERVER_URL)
+    arg_parser.add_argument("--stub", action="store_true", help="スタブサーバーを起動してそこに送る")
+    arg_parser.add_argument("--batch", type=int, default=200, help="一括翻訳の件数")
+    arg_parser.add_argument("--max-in-flight", type=int, default=8)
+    args = arg_parser.parse_args()
+
+    stub = None
+    url = args.url
+    if args.stub:
+        stub = StubServer(config=StubConfig(latency_ms=0, per_char_ms=0)).start()
+        url = stub.url
+
+    if args.text:
+        client = TranslationClient(url)
+        finished = threading.Event()
+        client.translate_streaming(
+            args.text,
+            chunk_callback=lambda chunk: print(chunk, end="", flush=True),
+            complete_callback=lambda result: finished.set(),
+            error_callback=lambda error: (print(error), finished.set()),
+            partial_callback=lambda partial, message: (print(f"\n⏱️ {message}"), finished.set())
+        )
+        finished.wait()
+        print()
+    else:
+        segments = [DEFAULT_CORPUS[i % len(DEFAULT_CORPUS)] for i in range(args.batch)]
+
+        # 比較: リクエストごとに新しい接続
+        host, port = parse_url(url)
+        start = time.perf_counter()
+        for segment in segments:
+            conn = http.client.HTTPConnection(host, port, timeout=DEFAULT_TIMEOUT)
+            body = json.dumps(build_request(segment, "English", "Japanese"), ensure_ascii=False)
+            conn.request("POST", MCP_PATH, body=body.encode("utf-8"),
+                         headers={"Content-Type": "application/json"})
+            conn.getresponse().read()
+            conn.close()
+        fresh = time.perf_counter() - start
+
+        client = TranslationClient(url, cli_fallback=False)
+        start = time.perf_counter()
+        for segment in segments:
+            client.translate_sync(segment)
+        pooled = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = client.translate_batch(segments, max_in_flight=args.max_in_flight)
+        batched = time.perf_counter() - start
+        errors = sum(1 for r in results if r is None or r.startswith("❌"))
+
+        print(f"📦 {len(segments)}件")
+        print(f"  接続を毎回作成（逐次）: {fresh * 1000:.0f}ms")
+        print(f"  接続プール（逐次）    : {pooled * 1000:.0f}ms")
+        print(f"  接続プール（同時{args.max_in_flight}件）: {batched * 1000:.0f}ms（エラー {errors}件）")
+        print(f"  {client.stats()}")
+        client.close()
+
+    if stub is not None:
+        stub.stop()
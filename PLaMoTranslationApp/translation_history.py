@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 検索可能な翻訳履歴
+
+完了した翻訳を SQLite に追記し、原文・訳文の全文検索索引（FTS5）を張る。
+書き込みは専用スレッドがまとめてコミットし、検索も別スレッドで実行して
+結果をコールバックで返すため、Tk のメインループを止めない。
+日本語は単語区切りがないため trigram トークナイザを使う（使えない環境では unicode61）。
+
+ベンチマーク:
+    python3 translation_history.py --entries 300000
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from compressed_text import CompressedText
+
+DEFAULT_HISTORY_PATH = os.environ.get(
+    "PLAMO_HISTORY_PATH",
+    os.path.expanduser("~/.plamo_translator/history.sqlite3")
+)
+# trigram 索引で検索できる最小文字数
+_TRIGRAM_MIN = 3
+
+
+def _like_pattern(term: str) -> str:
+    """LIKE の部分一致パターン（% と _ はそのままの文字として扱う）"""
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+@dataclass
+class HistoryEntry:
+    """翻訳履歴の1件"""
+    id: int
+    created: float
+    source: str
+    target: str
+    source_lang: str
+    target_lang: str
+
+
+class TranslationHistory:
+    """非同期追記・全文検索つきの翻訳履歴"""
+
+    def __init__(self, path: str = DEFAULT_HISTORY_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self._writes: "queue.Queue" = queue.Queue()
+        self._searches: "queue.Queue" = queue.Queue()
+        self._local = threading.local()
+        self._text: Optional[CompressedText] = None
+        self._write_conn = self._connect()
+        self.tokenizer = self._init_schema()
+        # 原文・訳文は辞書付きで圧縮して保存し、索引には伸張した文を渡す
+        self._text = CompressedText(
+            self._write_conn, path,
+            sample_sql="SELECT source, target FROM history ORDER BY id DESC LIMIT 2000"
+        )
+        self._text.register_function(self._write_conn)
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+        self._searcher = threading.Thread(target=self._search_loop, daemon=True)
+        self._searcher.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if self._text is not None:
+            self._text.register_function(conn)
+        return conn
+
+    def _init_schema(self) -> str:
+        conn = self._write_conn
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS history ("
+                " id INTEGER PRIMARY KEY,"
+                " created REAL NOT NULL,"
+                " source TEXT NOT NULL,"
+                " target TEXT NOT NULL,"
+                " source_lang TEXT,"
+                " target_lang TEXT)"
+            )
+            row = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'history_fts'"
+            ).fetchone()
+            if row:
+                trigger = conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE name = 'history_ai'"
+                ).fetchone()
+                if trigger and "plamo_text" not in trigger[0]:
+                    # 圧縮導入前のトリガーを、伸張してから索引するものに置き換える
+                    conn.execute("DROP TRIGGER history_ai")
+                    conn.execute("DROP TRIGGER history_ad")
+                    self._create_triggers(conn)
+                return "trigram" if "trigram" in row[0] else "unicode61"
+            for tokenizer in ("trigram", "unicode61"):
+                try:
+                    conn.execute(
+                        "CREATE VIRTUAL TABLE history_fts USING fts5("
+                        " source, target, content='history', content_rowid='id',"
+                        f" tokenize='{tokenizer}')"
+                    )
+                except sqlite3.OperationalError:
+                    continue
+                self._create_triggers(conn)
+                return tokenizer
+        raise RuntimeError("SQLite FTS5 is not available")
+
+    @staticmethod
+    def _create_triggers(conn: sqlite3.Connection):
+        """外部コンテンツ表の索引をトリガーで同期（圧縮された値は plamo_text で伸張）"""
+        conn.execute(
+            "CREATE TRIGGER history_ai AFTER INSERT ON history BEGIN"
+            " INSERT INTO history_fts(rowid, source, target)"
+            " VALUES (new.id, plamo_text(new.source), plamo_text(new.target)); END"
+        )
+        conn.execute(
+            "CREATE TRIGGER history_ad AFTER DELETE ON history BEGIN"
+            " INSERT INTO history_fts(history_fts, rowid, source, target)"
+            " VALUES ('delete', old.id, plamo_text(old.source), plamo_text(old.target)); END"
+        )
+
+    # --- 書き込み（専用スレッド） ---
+
+    def append(self, source: str, target: str, source_lang: str = "", target_lang: str = ""):
+        """完了した翻訳を追記（呼び出し側はブロックしない）"""
+        if source.strip() and target.strip():
+            self._writes.put((time.time(), source, target, source_lang, target_lang))
+
+    def flush(self, timeout: float = 5.0):
+        """キュー内の書き込みが完了するまで待つ"""
+        done = threading.Event()
+        self._writes.put(done)
+        done.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            item = self._writes.get()
+            batch = []
+            waiters = []
+            # 溜まっている分をまとめて1トランザクションで書く
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                try:
+                    item = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    with self._write_conn:
+                        self._write_conn.executemany(
+                            "INSERT INTO history (created, source, target, source_lang, target_lang)"
+                            " VALUES (?, ?, ?, ?, ?)",
+                            [(created, self._text.encode(source), self._text.encode(target), *langs)
+                             for created, source, target, *langs in batch]
+                        )
+                except sqlite3.Error as e:
+                    print(f"⚠️ 履歴の保存に失敗: {e}")
+            for waiter in waiters:
+                waiter.set()
+
+    # --- 検索 ---
+
+    def search(self, query: str, limit: int = 50) -> List[HistoryEntry]:
+        """全文検索（新しい順）。空の検索語は最近の履歴を返す"""
+        conn = self._reader()
+        query = query.strip()
+        columns = "h.id, h.created, h.source, h.target, h.source_lang, h.target_lang"
+        if not query:
+            rows = conn.execute(
+                f"SELECT {columns} FROM history h ORDER BY h.id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        else:
+            terms = query.split()
+            trigram = self.tokenizer == "trigram"
+            short = [t for t in terms if trigram and len(t) < _TRIGRAM_MIN]
+            indexed = [t for t in terms if not (trigram and len(t) < _TRIGRAM_MIN)]
+            # trigram で引けない短い語は部分一致で絞り込む（すべての語を AND で満たす）
+            like = " AND ".join(
+                "(plamo_text(h.source) LIKE ? ESCAPE '\\' OR plamo_text(h.target) LIKE ? ESCAPE '\\')"
+                for _ in short
+            )
+            like_params = [p for t in short for p in (_like_pattern(t),) * 2]
+            if indexed:
+                match = " ".join('"' + term.replace('"', '""') + '"' for term in indexed)
+                rows = conn.execute(
+                    f"SELECT {columns} FROM history_fts f JOIN history h ON h.id = f.rowid"
+                    f" WHERE history_fts MATCH ?{' AND ' + like if like else ''}"
+                    " ORDER BY h.id DESC LIMIT ?",
+                    (match, *like_params, limit)
+                ).fetchall()
+            else:
+                # 短い語だけの検索は最近の履歴から探す
+                rows = conn.execute(
+                    f"SELECT {columns} FROM (SELECT * FROM history ORDER BY id DESC LIMIT 20000) h"
+                    f" WHERE {like} ORDER BY h.id DESC LIMIT ?",
+                    (*like_params, limit)
+                ).fetchall()
+        decode = self._text.decode
+        return [HistoryEntry(id_, created, decode(source), decode(target), source_lang, target_lang)
+                for id_, created, source, target, source_lang, target_lang in rows]
+
+    def search_async(self, query: str, callback: Callable[[str, List[HistoryEntry]], None],
+                     limit: int = 50):
+        """検索スレッドで実行し、(検索語, 結果) をコールバックで返す"""
+        self._searches.put((query, callback, limit))
+
+    def _reader(self) -> sqlite3.Connection:
+        """スレッドごとの読み取り用接続"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _search_loop(self):
+        while True:
+            query, callback, limit = self._searches.get()
+            # 入力中に溜まった古い検索は捨てて最新だけ実行
+            try:
+                while True:
+                    query, callback, limit = self._searches.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                results = self.search(query, limit)
+            except sqlite3.Error as e:
+                print(f"⚠️ 履歴検索エラー: {e}")
+                results = []
+            try:
+                callback(query, results)
+            except Exception as e:
+                # 閉じたウィンドウなどへの通知に失敗しても検索スレッドは止めない
+                print(f"⚠️ 履歴検索の結果通知に失敗: {e}")
+
+    def __len__(self) -> int:
+        return self._reader().execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+
+# グローバルインスタンス（シングルトン）
+_history_instance = None
+
+
+def get_translation_history() -> TranslationHistory:
+    """翻訳履歴のシングルトンインスタンスを取得"""
+    global _history_instance
+    if _history_instance is None:
+        _history_instance = TranslationHistory()
+    return _history_instance
+
+
+def open_history_window(root, on_select: Optional[Callable[[HistoryEntry], None]] = None,
+                        font=("BIZ UDPGothic", 12)):
+    """履歴検索ウィンドウを開く（結果はバックグラウンド検索から root.after で反映）"""
+    import tkinter as tk
+
+    history = get_translation_history()
+    window = tk.Toplevel(root)
+    window.title("🕘 翻訳履歴")
+    window.geometry("700x450")
+
+    search_var = tk.StringVar()
+    entry = tk.Entry(window, textvariable=search_var, font=font)
+    entry.pack(fill=tk.X, padx=10, pady=(10, 5))
+
+    status = tk.Label(window, text="", font=(font[0], 10), fg="#888888")
+    status.pack(anchor=tk.W, padx=10)
+
+    listbox = tk.Listbox(window, font=font, activestyle="none")
+    listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 5))
+
+    preview = tk.Text(window, height=6, font=font, wrap=tk.WORD, state=tk.DISABLED)
+    preview.pack(fill=tk.X, padx=10, pady=(0, 10))
+
+    state = {"entries": [], "after_id": None, "started": 0.0}
+
+    def show_results(query, entries):
+        if not window.winfo_exists() or query != search_var.get():
+            return  # 古い検索結果は捨てる
+        elapsed = (time.perf_counter() - state["started"]) * 1000
+        state["entries"] = entries
+        listbox.delete(0, tk.END)
+        for item in entries:
+            stamp = time.strftime("%m/%d %H:%M", time.localtime(item.created))
+            listbox.insert(tk.END, f"{stamp}  {item.source[:40]!s} → {item.target[:40]!s}".replace("\n", " "))
+        status.config(text=f"{len(entries)}件 ({elapsed:.0f}ms)")
+
+    def on_results(query, entries):
+        root.after(0, lambda: show_results(query, entries))
+
+    def run_search():
+        state["after_id"] = None
+        state["started"] = time.perf_counter()
+        history.search_async(search_var.get(), on_results)
+
+    def on_change(*_):
+        # 入力が落ち着いてから検索（デバウンス）
+        if state["after_id"] is not None:
+            window.after_cancel(state["after_id"])
+        state["after_id"] = window.after(150, run_search)
+
+    def on_listbox_select(_event):
+        selection = listbox.curselection()
+        if not selection:
+            return
+        item = state["entries"][selection[0]]
+        preview.config(state=tk.NORMAL)
+        preview.delete("1.0", tk.END)
+        preview.insert("1.0", f"{item.source}\n\n{item.target}")
+        preview.config(state=tk.DISABLED)
+
+    def on_listbox_activate(_event):
+        selection = listbox.curselection()
+        if selection and on_select:
+            on_select(state["entries"][selection[0]])
+
+    search_var.trace_add("write", on_change)
+    listbox.bind("<<ListboxSelect>>", on_listbox_select)
+    listbox.bind("<Double-Button-1>", on_listbox_activate)
+    listbox.bind("<Return>", on_listbox_activate)
+    entry.focus_set()
+    run_search()
+    return window
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import tempfile
+
+    arg_parser = argparse.ArgumentParser(description="翻訳履歴 検索レイテンシ測定")
+    arg_parser.add_argument("--entries", type=int, default=100000)
+    arg_parser.add_argument("--queries", type=int, default=200)
+    args = arg_parser.parse_args()
+
+    gen = random.Random(7)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = ["".join(gen.choice(letters) for _ in range(gen.randint(3, 9))) for _ in range(20000)]
+    kana = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = TranslationHistory(os.path.join(tmp, "history.sqlite3"))
+        start = time.perf_counter()
+        for _ in range(args.entries):
+            history.append(" ".join(gen.choice(words) for _ in range(12)),
+                           "".join(gen.choice(kana) for _ in range(30)), "English", "Japanese")
+        history.flush(timeout=600)
+        print(f"📥 追記: {args.entries}件 {time.perf_counter() - start:.1f}秒"
+              f" (tokenizer={history.tokenizer})")
+
+        latencies = []
+        for _ in range(args.queries):
+            query = gen.choice(words) if gen.random() < 0.5 else "".join(gen.choice(kana) for _ in range(3))
+            start = time.perf_counter()
+            history.search(query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        print(f"🔍 検索: p50={latencies[len(latencies) // 2]:.2f}ms "
+              f"p99={latencies[int(len(latencies) * 0.99)]:.2f}ms")
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - 翻訳メモリ（完全一致 + MinHash/LSH あいまい一致）
+
+過去の翻訳結果を SQLite に保存し、同じ文は即座に、よく似た文は
+類似度付きの候補として返す。あいまい検索は文字3-gramの MinHash を
+バンド分割した LSH キーを索引にしているため、件数が増えても
+1回の検索は索引引き数回と候補数十件の類似度計算で済む。
+
+ベンチマーク:
+    python3 translation_memory.py --segments 100000
+"""
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+import zlib
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from compressed_text import CompressedText
+
+DEFAULT_DB_PATH = os.environ.get(
+    "PLAMO_TM_PATH",
+    os.path.expanduser("~/.plamo_translator/translation_memory.sqlite3")
+)
+# 類似訳として提示する最小類似度（文字3-gramのJaccard係数）
+DEFAULT_FUZZY_THRESHOLD = float(os.environ.get("PLAMO_TM_FUZZY_THRESHOLD", "0.8"))
+
+NUM_PERM = 32
+BANDS = 8
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+MAX_CANDIDATES = 50
+# 定型文が大量にあるとバケットが肥大化するため、1検索で読む索引行数を制限
+MAX_BAND_ROWS = 2000
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(0x504C614D6F)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERM)
+]
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+@dataclass
+class TMMatch:
+    """翻訳メモリの検索結果"""
+    source: str
+    target: str
+    similarity: float
+
+    @property
+    def is_exact(self) -> bool:
+        return self.similarity >= 1.0
+
+
+def normalize(text: str) -> str:
+    """完全一致用の正規化（NFKC・空白の統一。"Polish" と "polish" は別の文として扱う）"""
+    return _SPACE_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def fuzzy_normalize(text: str) -> str:
+    """類似検索用の正規化（normalize に加えて大文字・小文字を区別しない）"""
+    return normalize(text).casefold()
+
+
+def _hash64(*parts: str) -> int:
+    """SQLite の INTEGER に収まる符号付き64bitハッシュ"""
+    digest = hashlib.blake2b("\x1f".join(parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def shingles(normalized: str) -> set:
+    """文字n-gramの集合（短い文は全体を1要素とする）"""
+    if len(normalized) <= SHINGLE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE] for i in range(len(normalized) - SHINGLE + 1)}
+
+
+def minhash(grams: Iterable[str]) -> List[int]:
+    """MinHash シグネチャ"""
+    hashes = [zlib.crc32(g.encode("utf-8")) for g in grams]
+    prime = _MERSENNE_PRIME
+    return [min((a * h + b) % prime for h in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_keys(signature: Sequence[int], lang_key: str) -> List[int]:
+    """LSH のバンドごとの索引キー"""
+    return [
+        _hash64(lang_key, str(band), ",".join(map(str, signature[band * ROWS:(band + 1) * ROWS])))
+        for band in range(BANDS)
+    ]
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class TranslationMemory:
+    """SQLite ベースの翻訳メモリ"""
+
+    def __init__(self, path: str = DEFAULT_DB_PATH, fuzzy_threshold: float = DEFAULT_FUZZY_THRESHOLD,
+                 cache_size: int = 1024):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.fuzzy_threshold = fuzzy_threshold
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[int, str]" = OrderedDict()
+        self._cache_size = cache_size
+        self._init_schema()
+        # 原文・訳文は保存済みの文から作った辞書で圧縮して保存
+        self._text = CompressedText(
+            self._conn, path,
+            sample_sql="SELECT source, target FROM segments ORDER BY id DESC LIMIT 2000"
+        )
+
+    def _init_schema(self):
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS segments ("
+                " id INTEGER PRIMARY KEY,"
+                " key INTEGER NOT NULL UNIQUE,"
+                " source TEXT NOT NULL,"
+                " target TEXT NOT NULL,"
+                " source_lang TEXT NOT NULL,"
+                " target_lang TEXT NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS segment_bands ("
+                " band_key INTEGER NOT NULL,"
+                " segment_id INTEGER NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS segment_bands_key ON segment_bands(band_key)"
+            )
+
+    @staticmethod
+    def _lang_key(source_lang: str, target_lang: str) -> str:
+        return f"{source_lang}>{target_lang}"
+
+    def _remember(self, key: int, target: str):
+        self._cache[key] = target
+        self._cache.move_to_end(key)
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def add(self, source: str, target: str, source_lang: str, target_lang: str):
+        """翻訳結果を登録（同じ原文は訳文を上書き）"""
+        self.add_many([(source, target)], source_lang, target_lang)
+
+    def add_many(self, pairs: Iterable[Tuple[str, str]], source_lang: str, target_lang: str):
+        """翻訳結果をまとめて登録"""
+        lang_key = self._lang_key(source_lang, target_lang)
+        rows = []
+        for source, target in pairs:
+            norm = normalize(source)
+            if not norm or not target.strip():
+                continue
+            key = _hash64(lang_key, norm)
+            rows.append((key, source, target, band_keys(minhash(shingles(norm.casefold())), lang_key)))
+        if not rows:
+            return
+
+        now = time.time()
+        with self._lock, self._conn:
+            for key, source, target, bands in rows:
+                existing = self._conn.execute(
+                    "SELECT id FROM segments WHERE key = ?", (key,)
+                ).fetchone()
+                if existing:
+                    self._conn.execute(
+                        "UPDATE segments SET target = ?, created = ? WHERE id = ?",
+                        (self._text.encode(target), now, existing[0])
+                    )
+                else:
+                    cursor = self._conn.execute(
+                        "INSERT INTO segments (key, source, target, source_lang, target_lang, created)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (key, self._text.encode(source), self._text.encode(target),
+                         source_lang, target_lang, now)
+                    )
+                    self._conn.executemany(
+                        "INSERT INTO segment_bands (band_key, segment_id) VALUES (?, ?)",
+                        [(band, cursor.lastrowid) for band in bands]
+                    )
+                self._remember(key, target)
+
+    def lookup_exact(self, source: str, source_lang: str, target_lang: str) -> Optional[str]:
+        """完全一致（正規化後）の訳文"""
+        key = _hash64(self._lang_key(source_lang, target_lang), normalize(source))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            row = self._conn.execute("SELECT target FROM segments WHERE key = ?", (key,)).fetchone()
+            if row:
+                target = self._text.decode(row[0])
+                self._remember(key, target)
+                return target
+        return None
+
+    def lookup(self, source: str, source_lang: str, target_lang: str,
+               threshold: Optional[float] = None) -> Optional[TMMatch]:
+        """完全一致、なければ閾値以上で最も類似した過去の翻訳"""
+        exact = self.lookup_exact(source, source_lang, target_lang)
+        if exact is not None:
+            return TMMatch(source, exact, 1.0)
+
+        threshold = self.fuzzy_threshold if threshold is None else threshold
+        lang_key = self._lang_key(source_lang, target_lang)
+        norm = fuzzy_normalize(source)
+        if not norm:
+            return None
+        grams = shingles(norm)
+        bands = band_keys(minhash(grams), lang_key)
+
+        placeholders = ",".join("?" * len(bands))
+        with self._lock:
+            ids = [row[0] for row in self._conn.execute(
+                f"SELECT segment_id FROM segment_bands WHERE band_key IN ({placeholders}) LIMIT ?",
+                (*bands, MAX_BAND_ROWS)
+            )]
+            if not ids:
+                return None
+            # バンド衝突数の多い候補から類似度を確認
+            candidates = [sid for sid, _ in Counter(ids).most_common(MAX_CANDIDATES)]
+            rows = self._conn.execute(
+                f"SELECT source, target FROM segments WHERE id IN ({','.join('?' * len(candidates))})",
+                candidates
+            ).fetchall()
+
+        best = None
+        for candidate_source, candidate_target in rows:
+            candidate_source = self._text.decode(candidate_source)
+            candidate_target = self._text.decode(candidate_target)
+            similarity = jaccard(grams, shingles(fuzzy_normalize(candidate_source)))
+            # 完全一致でなかった候補（大文字・小文字だけが違う文など）は is_exact にしない
+            similarity = min(similarity, 0.99)
+            if similarity >= threshold and (best is None or similarity > best.similarity):
+                best = TMMatch(candidate_source, candidate_target, similarity)
+        return best
+
+    def translate_segments(
+        self,
+        text: str,
+        translate_fn: Callable[[str], str],
+        source_lang: str,
+        target_lang: str
+    ) -> Tuple[str, Dict[str, int]]:
+        """行単位で翻訳メモリを引き、未登録の行だけをエンジンに送る
+
+        文書内で同じ行が繰り返される場合（表・ログなど）は、未登録の行を重複除去して
+        1種類につき1行だけ送り、訳文をすべての出現位置に戻す。
+        """
+        from segment_dedup import SegmentDeduper
+
+        stats = {"segments": 0, "hits": 0, "engine_calls": 0, "unique": 0, "duplicates": 0}
+        whole = self.lookup_exact(text, source_lang, target_lang)
+        if whole is not None:
+            stats["segments"] = stats["hits"] = 1
+            return whole, stats
+
+        lines = text.split("\n")
+        results: List[Optional[str]] = []
+        missing: List[int] = []
+        for i, line in enumerate(lines):
+            if not line.strip():
+                results.append(line)
+                continue
+            stats["segments"] += 1
+            hit = self.lookup_exact(line, source_lang, target_lang)
+            if hit is None:
+                missing.append(i)
+            else:
+                stats["hits"] += 1
+            results.append(hit)
+
+        if missing:
+            stats["engine_calls"] = 1
+            deduper = SegmentDeduper([lines[i] for i in missing])
+            stats["unique"] = len(deduper.unique)
+            stats["duplicates"] = deduper.duplicates
+            if len(missing) == stats["segments"] and not deduper.duplicates:
+                # 全行が新規で重複もなければ文脈を保つため全文をそのまま翻訳
+                translated = translate_fn(text)
+                self.add(text, translated, source_lang, target_lang)
+                self._add_aligned(lines, translated, source_lang, target_lang)
+                return translated, stats
+
+            translated = translate_fn("\n".join(deduper.unique))
+            translated_lines = [t for t in translated.split("\n") if t.strip()]
+            if len(translated_lines) != len(deduper.unique):
+                # 行対応が取れない場合は全文翻訳にフォールバック
+                stats["engine_calls"] += 1
+                translated = translate_fn(text)
+                self.add(text, translated, source_lang, target_lang)
+                return translated, stats
+            for i, translated_line in zip(missing, deduper.expand(translated_lines)):
+                results[i] = translated_line
+            self.add_many(zip(deduper.unique, translated_lines), source_lang, target_lang)
+
+        result = "\n".join(r for r in results if r is not None)
+        self.add(text, result, source_lang, target_lang)
+        return result, stats
+
+    def _add_aligned(self, lines: List[str], translated: str, source_lang: str, target_lang: str):
+        """原文と訳文の行数が一致する場合、行単位でも登録"""
+        source_lines = [line for line in lines if line.strip()]
+        target_lines = [line for line in translated.split("\n") if line.strip()]
+        if len(source_lines) > 1 and len(source_lines) == len(target_lines):
+            self.add_many(zip(source_lines, target_lines), source_lang, target_lang)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# グローバルインスタンス（シングルトン）
+_memory_instance = None
+
+
+def get_translation_memory() -> TranslationMemory:
+    """翻訳メモリのシングルトンインスタンスを取得"""
+    global _memory_instance
+    if _memory_instance is None:
+        _memory_instance = TranslationMemory()
+    return _memory_instance
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    arg_parser = argparse.ArgumentParser(description="翻訳メモリ 検索レイテンシ測定")
+    arg_parser.add_argument("--segments", type=int, default=20000)
+    arg_parser.add_argument("--queries", type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    gen = random.Random(42)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = ["".join(gen.choice(letters) for _ in range(gen.randint(3, 9))) for _ in range(5000)]
+
+    def sentence():
+        return "Please " + " ".join(gen.choice(words) for _ in range(gen.randint(6, 14))) + "."
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tm = TranslationMemory(os.path.join(tmp, "tm.sqlite3"))
+        sources = [sentence() for _ in range(args.segments)]
+        start = time.perf_counter()
+        for offset in range(0, len(sources), 5000):
+            batch = sources[offset:offset + 5000]
+            tm.add_many(((s, f"訳: {s}") for s in batch), "English", "Japanese")
+        print(f"📥 登録: {len(tm)}件 {time.perf_counter() - start:.1f}秒")
+
+        def measure(label, queries):
+            latencies = []
+            hits = 0
+            for q in queries:
+                start = time.perf_counter()
+                if tm.lookup(q, "English", "Japanese"):
+                    hits += 1
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            p50 = latencies[len(latencies) // 2]
+            p99 = latencies[int(len(latencies) * 0.99)]
+            print(f"🔍 {label}: p50={p50:.2f}ms p99={p99:.2f}ms ヒット率={hits / len(queries):.0%}")
+
+        tm._cache.clear()
+        measure("完全一致", [gen.choice(sources) for _ in range(args.queries)])
+        measure("あいまい一致", [gen.choice(sources).replace("Please", "Kindly please", 1)
+                                for _ in range(args.queries)])
+        measure("新規文", [sentence() for _ in range(args.queries)])
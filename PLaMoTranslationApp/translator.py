@@ -5,26 +5,34 @@ PLaMo翻訳アプリ
 
 import tkinter as tk
 from tkinter import scrolledtext
-import subprocess
 import threading
-import pyperclip
 import time
-try:
-    from pynput import keyboard
-    PYNPUT_AVAILABLE = True
-except ImportError:
-    PYNPUT_AVAILABLE = False
 import sys
 import os
 
-# BudouX for adaptive Japanese text formatting (optional)
-try:
-    import budoux
-    BUDOUX_AVAILABLE = True
-    parser = budoux.load_default_japanese_parser()
-except ImportError:
-    BUDOUX_AVAILABLE = False
-    parser = None
+# 共有グローバルホットキーエンジン
+from hotkey_engine import get_hotkey_engine, PYNPUT_AVAILABLE
+# 翻訳メモリ（過去の翻訳の再利用）
+from translation_memory import get_translation_memory
+# 用語集（製品名・専門用語の固定）
+from glossary import get_glossary
+# 検索可能な翻訳履歴
+from translation_history import get_translation_history, open_history_window
+# 入力長に応じた期限と停止検出
+from deadlines import DeadlineExceeded, run_cli_streaming
+# オプトインのプロファイリング（--profile / PLAMO_PROFILE_DIR）
+import profiling
+# Tk メインループの遅延監視
+from ui_watchdog import LoopLagMonitor
+# プロセスを起動しないクリップボード（NSPasteboard / Tk / 常駐ヘルパー）
+from clipboard import get_clipboard
+# Markdown / HTML の構造を保った翻訳
+from structured_text import FORMAT_PLAIN, describe_stats, detect_format, translate_document
+# コンテキストに収まらない長文のトークン数による分割
+from token_chunker import translate_chunked
+
+# ストリーミング後処理パイプライン（改行圧縮・空白除去・BudouX文節分割）
+from postprocess import build_pipeline, display_pieces, strip_breaks
 
 
 class PLaMoTranslator:
@@ -33,6 +41,12 @@ class PLaMoTranslator:
         self.root.title("PLaMo翻訳")
         self.root.geometry("800x500")
         
+        # 翻訳メモリと用語集、翻訳履歴
+        self.translation_memory = get_translation_memory()
+        self.glossary = get_glossary()
+        self.history = get_translation_history()
+        self.clipboard = get_clipboard(self.root)
+        
         # メインフレーム（左右分割）
         main_frame = tk.Frame(self.root)
         main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -114,11 +128,11 @@ class PLaMoTranslator:
         self.result_text.config(yscrollcommand=result_scrollbar.set)
         result_scrollbar.config(command=self.result_text.yview)
         
-        # Command+C監視用の変数
-        self.c_press_times = []
-        
         # スクロール同期用フラグ
         self.sync_in_progress = False
+        # 最新の翻訳の番号（古い翻訳の結果を表示しないため）
+        self.translation_id = 0
+        self.progress_started = False
         
         # テキストエリアのスクロールイベントバインド（マウスホイール）
         self.input_text.bind('<MouseWheel>', self.on_input_mousewheel)
@@ -136,6 +150,16 @@ class PLaMoTranslator:
         left_frame.bind('<Enter>', lambda e: left_frame.focus_set())
         right_frame.bind('<Enter>', lambda e: right_frame.focus_set())
         
+        # 翻訳履歴の検索（Command+Y / Ctrl+Y）
+        for sequence in ('<Command-y>', '<Control-y>'):
+            try:
+                self.root.bind(sequence, self.open_history)
+            except tk.TclError:
+                pass
+        
+        # メインループの遅延監視（UI停止はコンソールに記録）
+        self.lag_monitor = LoopLagMonitor(self.root).start()
+        
         # グローバルキーボード監視を開始
         if PYNPUT_AVAILABLE:
             try:
@@ -151,7 +175,7 @@ class PLaMoTranslator:
     def load_clipboard(self):
         """クリップボード読み込み"""
         try:
-            clipboard_content = pyperclip.paste()
+            clipboard_content = self.clipboard.paste()
             print(f"📋 クリップボード: '{clipboard_content}'")
             
             if clipboard_content:
@@ -167,7 +191,7 @@ class PLaMoTranslator:
     def load_and_translate(self):
         """クリップボード読み込み＋即座に翻訳"""
         try:
-            clipboard_content = pyperclip.paste()
+            clipboard_content = self.clipboard.paste()
             if clipboard_content:
                 print("📋 クリップボード読み込み → 自動翻訳開始")
                 
@@ -195,58 +219,20 @@ class PLaMoTranslator:
             self.translate()
     
     def start_global_hotkey(self):
-        """グローバルホットキー監視を開始"""
-        def on_key_press(key):
-            try:
-                # Command+Cの検出 (macOS)
-                if hasattr(key, 'char') and key.char == 'c':
-                    # 現在押されているキーを確認
-                    if keyboard.Key.cmd in self.pressed_keys or keyboard.Key.ctrl in self.pressed_keys:
-                        self.on_cmd_c_global()
-            except AttributeError:
-                pass
-        
-        def on_key_down(key):
-            self.pressed_keys.add(key)
-        
-        def on_key_up(key):
-            if key in self.pressed_keys:
-                self.pressed_keys.remove(key)
-        
-        # 現在押されているキーを追跡
-        self.pressed_keys = set()
-        
-        # グローバルキーボードリスナーを開始
-        self.key_listener = keyboard.Listener(
-            on_press=on_key_down,
-            on_release=on_key_up
-        )
-        self.key_listener.start()
-        
-        # キー入力監視（より詳細）
-        self.hotkey_listener = keyboard.Listener(on_press=on_key_press)
-        self.hotkey_listener.start()
+        """グローバルホットキー監視を開始（共有エンジンに登録）"""
+        self.hotkey_engine = get_hotkey_engine()
+        self.hotkey_engine.add_callback(self.on_cmd_c_global)
+        self.hotkey_engine.start()
     
     def on_cmd_c_global(self):
-        """グローバルCommand+C押下を検出"""
-        current_time = time.time()
-        self.c_press_times.append(current_time)
-        
-        # 古い記録を削除（1秒以上前）
-        self.c_press_times = [t for t in self.c_press_times if current_time - t < 1.0]
-        
-        print(f"📋 グローバルCommand+C検出 ({len(self.c_press_times)}回目)")
+        """グローバルCommand+C 2回押下を検出（リスナースレッドから呼ばれる）"""
+        print("🚀 Command+C 2回検出 → 自動翻訳開始")
         
-        # 1秒以内に2回押された場合
-        if len(self.c_press_times) >= 2:
-            print("🚀 Command+C 2回検出 → 自動翻訳開始")
-            self.c_press_times = []  # リセット
-            
-            # メインスレッドで実行
-            self.root.after(200, self.load_and_translate)
+        # メインスレッドで実行
+        self.root.after(200, self.load_and_translate)
     
     def translate(self):
-        """翻訳実行"""
+        """翻訳実行（CLI はワーカースレッドで実行し、結果は Tk スレッドに戻して表示）"""
         text = self.input_text.get("1.0", tk.END).strip()
         print(f"🔄 翻訳開始: '{text}'")
         
@@ -260,78 +246,139 @@ class PLaMoTranslator:
         if current_result != "翻訳中...":
             self.result_text.delete("1.0", tk.END)
             self.result_text.insert("1.0", "翻訳中...")
-            self.result_text.update()  # UIを即座更新
         
+        # 新しい翻訳を始めたら、実行中の古い翻訳の結果は表示しない
+        self.translation_id += 1
+        self.progress_started = False
+        threading.Thread(
+            target=self._translate_worker, args=(text, self.translation_id), daemon=True
+        ).start()
+    
+    def _post(self, translation_id, fn, *args):
+        """ワーカースレッドから Tk スレッドで fn を実行（古い翻訳の結果は捨てる）"""
+        def _apply():
+            if translation_id == self.translation_id:
+                fn(*args)
+        self.root.after(0, _apply)
+    
+    @profiling.profiled_request("translate_sync")
+    def _translate_worker(self, text, translation_id):
+        """ワーカースレッドで翻訳（期限まで待ってもGUIは止まらない）"""
         try:
             print("📡 PLaMo CLI実行...")
-            print(f"📋 コマンド: plamo-translate --from English --to Japanese --no-stream")
+            print(f"📋 コマンド: plamo-translate --from English --to Japanese")
             print(f"📝 入力テキスト: '{text}'")
             
-            # PLaMo CLIを同期実行（絶対パス使用）
-            plamo_path = '/opt/homebrew/bin/plamo-translate'
-            result = subprocess.run(
-                [plamo_path, '--from', 'English', '--to', 'Japanese', '--no-stream'],
-                input=text,
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            print(f"📊 リターンコード: {result.returncode}")
-            print(f"📤 stdout: '{result.stdout}'")
-            print(f"📤 stderr: '{result.stderr}'")
-            
-            # 結果をすぐに表示
-            if result.returncode == 0:
-                translated = result.stdout.strip()
-                # PLaMoが出力する二重改行を単一改行に変換
-                translated = translated.replace('\n\n', '\n')
-                print(f"✅ 翻訳成功: '{translated}'")
+            def run_cli(source, stream=False):
+                # 用語集の用語をプレースホルダで保護
+                protected, glossary_targets = self.glossary.protect(source, 'English')
                 
-                # BudouXで自然な改行機会を挿入
-                if BUDOUX_AVAILABLE and parser and translated:
-                    try:
-                        # まず改行で段落を分割
-                        paragraphs = translated.split('\n')
-                        self.result_text.delete("1.0", tk.END)
-                        
-                        for p_idx, paragraph in enumerate(paragraphs):
-                            if paragraph.strip():  # 空でない段落のみ処理
-                                # 各段落をBudouXで分割
-                                segments = parser.parse(paragraph.strip())
-                                # セグメントを挿入
-                                for i, segment in enumerate(segments):
-                                    self.result_text.insert(tk.END, segment, "normal")
-                                    if i < len(segments) - 1:
-                                        self.result_text.insert(tk.END, " ", "tiny_space")
-                            
-                            # 段落間に空行を挿入（最後の段落以外）
-                            if p_idx < len(paragraphs) - 1:
-                                self.result_text.insert(tk.END, '\n\n', "normal")
-                        print(f"🎨 BudouX改行機会適用 ({len(paragraphs)}段落)")
-                        return  # 早期リターンして通常の挿入をスキップ
-                    except Exception as e:
-                        print(f"⚠️ BudouX処理エラー: {e}")
+                # 出力が届くたびに、用語を復元した新しい部分だけを途中結果に追加する
+                pipeline = build_pipeline(glossary_targets)
                 
-                # BudouXが失敗した場合の通常挿入
-                self.result_text.delete("1.0", tk.END)
-                self.result_text.insert("1.0", translated, "normal")
-            else:
-                error = result.stderr.strip() or "翻訳エラー"
-                print(f"❌ 翻訳失敗: '{error}'")
-                self.result_text.delete("1.0", tk.END)
-                self.result_text.insert("1.0", f"❌ {error}")
+                def on_chunk(chunk):
+                    piece = pipeline.feed(chunk)
+                    if piece:
+                        self._post(translation_id, self.append_progress, piece)
                 
-        except subprocess.TimeoutExpired:
-            print("⏰ タイムアウト")
-            self.result_text.delete("1.0", tk.END)
-            self.result_text.insert("1.0", "❌ タイムアウト")
+                # PLaMo CLIを実行（絶対パス使用）
+                # 固定タイムアウトではなく、入力長から求めた期限と出力の停止で打ち切る
+                plamo_path = '/opt/homebrew/bin/plamo-translate'
+                try:
+                    output = run_cli_streaming(
+                        [plamo_path, '--from', 'English', '--to', 'Japanese'],
+                        protected,
+                        on_chunk=on_chunk if stream else None
+                    )
+                except DeadlineExceeded as e:
+                    e.partial = self.glossary.restore(e.partial.strip(), glossary_targets)
+                    raise
+                if stream:
+                    # 次のCLI呼び出しの途中結果は改行してから続ける
+                    self._post(translation_id, self.append_progress, pipeline.finish() + "\n")
+                
+                print(f"📤 stdout: '{output}'")
+                return self.glossary.restore(output.strip(), glossary_targets)
+            
+            def run_with_memory(source, stream=False):
+                # 翻訳メモリにない行だけをCLIで翻訳
+                # 上限トークン数を超える入力はチャンクごとに CLI に送る
+                translated, tm_stats = self.translation_memory.translate_segments(
+                    source, lambda segment: translate_chunked(segment, lambda chunk: run_cli(chunk, stream)),
+                    'English', 'Japanese'
+                )
+                if tm_stats["hits"]:
+                    print(f"📚 翻訳メモリ: {tm_stats['hits']}/{tm_stats['segments']}セグメント再利用"
+                          f"（CLI呼び出し {tm_stats['engine_calls']}回）")
+                if tm_stats["duplicates"]:
+                    print(f"♻️ 重複除去: {tm_stats['unique'] + tm_stats['duplicates']}→{tm_stats['unique']}行をCLIに送信")
+                return translated
+            
+            if detect_format(text) == FORMAT_PLAIN:
+                # 結果をすぐに表示（二重改行の圧縮とBudouXの改行機会を一度の走査で適用）
+                translated = build_pipeline(segment=True).process(run_with_memory(text, stream=True))
+            else:
+                # Markdown / HTML はテキストノードだけを翻訳し、構造はそのまま残す
+                # （バッチはエンジンの実行枠の数まで並行に送る。既定の1枠では順番に翻訳）
+                translated, doc_stats = translate_document(text, run_with_memory)
+                print(describe_stats(doc_stats))
+            print(f"✅ 翻訳成功: '{strip_breaks(translated)}'")
+            self._post(translation_id, self.insert_processed, translated)
+            self.history.append(text, strip_breaks(translated), 'English', 'Japanese')
+            
+        except DeadlineExceeded as e:
+            # 途中まで翻訳された結果は捨てずに表示する
+            print(f"⏰ {e}（{len(e.partial)}文字の途中結果）")
+            partial = build_pipeline(segment=True).process(e.partial) if e.partial else ""
+            self._post(translation_id, self.show_partial, partial, str(e))
         except Exception as e:
             print(f"💥 エラー: {e}")
+            self._post(translation_id, self.show_error, str(e))
+    
+    def append_progress(self, piece):
+        """翻訳途中の出力を追加（最初の出力で「翻訳中...」を消す）"""
+        if not self.progress_started:
             self.result_text.delete("1.0", tk.END)
-            self.result_text.insert("1.0", f"❌ {str(e)}")
-        finally:
-            pass  # ボタンがないので何もしない
+            self.progress_started = True
+        self.result_text.insert(tk.END, piece, "normal")
+        self.result_text.see(tk.END)
+    
+    def show_partial(self, partial, message):
+        """期限切れ・停止時の途中結果を表示"""
+        self.result_text.delete("1.0", tk.END)
+        if partial:
+            self.insert_processed(partial)
+            self.result_text.insert(tk.END, f"\n\n⏱️ {message}（途中結果）")
+        else:
+            self.result_text.insert("1.0", f"❌ {message}")
+    
+    def show_error(self, message):
+        self.result_text.delete("1.0", tk.END)
+        self.result_text.insert("1.0", f"❌ {message}")
+    
+    def open_history(self, event=None):
+        """翻訳履歴の検索ウィンドウを開く"""
+        open_history_window(self.root, on_select=self.show_history_entry)
+        return "break"
+    
+    def show_history_entry(self, entry):
+        """履歴の翻訳を入力・結果エリアに復元"""
+        self.input_text.delete("1.0", tk.END)
+        self.input_text.insert("1.0", entry.source)
+        self.result_text.config(state=tk.NORMAL)
+        self.result_text.delete("1.0", tk.END)
+        self.result_text.insert("1.0", entry.target, "normal")
+        self.result_text.config(state=tk.DISABLED)
+    
+    @profiling.profiled("ui.insert")
+    def insert_processed(self, text):
+        """後処理済みテキストを挿入（文節区切りは極小スペース、段落間は空行）"""
+        self.result_text.delete("1.0", tk.END)
+        for piece, tiny in display_pieces(text):
+            if tiny:
+                self.result_text.insert(tk.END, piece, "tiny_space")
+            else:
+                self.result_text.insert(tk.END, piece.replace('\n', '\n\n'), "normal")
     
     def insert_segments_with_tiny_spaces(self, segments):
         """BudouXセグメントを極小スペースで挿入（改行保持）"""
@@ -414,5 +461,6 @@ class PLaMoTranslator:
         self.root.mainloop()
 
 if __name__ == "__main__":
+    profiling.configure_from_argv()
     app = PLaMoTranslator()
     app.run()
\ No newline at end of file
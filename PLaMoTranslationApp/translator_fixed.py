@@ -5,26 +5,33 @@ PLaMo翻訳アプリ - 既存CLIストリーミング対応版
 
 import tkinter as tk
 from tkinter import scrolledtext
-import subprocess
 import threading
-import pyperclip
 import time
-try:
-    from pynput import keyboard
-    PYNPUT_AVAILABLE = True
-except ImportError:
-    PYNPUT_AVAILABLE = False
 import sys
 import os
 
-# BudouX for adaptive Japanese text formatting (optional)
-try:
-    import budoux
-    BUDOUX_AVAILABLE = True
-    parser = budoux.load_default_japanese_parser()
-except ImportError:
-    BUDOUX_AVAILABLE = False
-    parser = None
+# 共有グローバルホットキーエンジン
+from hotkey_engine import get_hotkey_engine, PYNPUT_AVAILABLE
+# 翻訳メモリ（過去の翻訳の再利用）
+from translation_memory import get_translation_memory
+# 用語集（製品名・専門用語の固定）
+from glossary import get_glossary
+# 検索可能な翻訳履歴
+from translation_history import get_translation_history, open_history_window
+# 入力長に応じた期限と停止検出
+from deadlines import DeadlineExceeded, run_cli_streaming
+# オプトインのプロファイリング（--profile / PLAMO_PROFILE_DIR）
+import profiling
+# Tk メインループの遅延監視
+from ui_watchdog import LoopLagMonitor
+# プロセスを起動しないクリップボード（NSPasteboard / Tk / 常駐ヘルパー）
+from clipboard import get_clipboard
+
+# 翻訳結果のチャンクバッファ（追記 O(1)、全文は必要時に1度だけ結合）
+from result_buffer import ResultBuffer
+
+# ストリーミング後処理パイプライン（改行圧縮・空白除去・BudouX文節分割）
+from postprocess import build_pipeline, display_pieces, strip_breaks
 
 
 class PLaMoTranslator:
@@ -36,6 +43,16 @@ class PLaMoTranslator:
         # 翻訳中フラグ
         self.is_translating = False
         
+        # 表示中の翻訳結果（文節区切りなし、翻訳スレッドと共有）
+        self.result_buffer = ResultBuffer()
+        
+        # 翻訳メモリと用語集、翻訳履歴
+        self.translation_memory = get_translation_memory()
+        self.glossary = get_glossary()
+        self.history = get_translation_history()
+        self.clipboard = get_clipboard(self.root)
+        self.current_source = ("", "", "")
+        
         # フォント設定（最初に設定）
         self.base_font_size = 12
         self.min_font_size = 8
@@ -106,6 +123,15 @@ class PLaMoTranslator:
             fg="#00aa00"
         )
         self.status_label.pack(side=tk.RIGHT)
+
+        # UI遅延の表示（メインループの遅延監視）
+        self.lag_label = tk.Label(
+            button_frame,
+            text="",
+            font=(self.font_family, 9),
+            fg="#aaaaaa"
+        )
+        self.lag_label.pack(side=tk.RIGHT, padx=(0, 10))
         
         # 右側フレーム（結果エリア）
         right_frame = tk.Frame(main_frame, width=380)
@@ -130,6 +156,18 @@ class PLaMoTranslator:
         )
         self.copy_button.pack(side=tk.RIGHT)
         
+        # 履歴ボタン
+        self.history_button = tk.Button(
+            result_header_frame,
+            text="🕘 履歴",
+            command=self.open_history,
+            font=(self.font_family, 10),
+            relief=tk.RAISED,
+            padx=8,
+            pady=2
+        )
+        self.history_button.pack(side=tk.RIGHT, padx=(0, 5))
+        
         # 結果テキストエリアとスクロールバーのフレーム（高さ固定）
         result_frame = tk.Frame(right_frame, height=400)
         result_frame.pack(fill=tk.BOTH, expand=True, pady=(5, 0))
@@ -164,10 +202,6 @@ class PLaMoTranslator:
         self.result_text.config(yscrollcommand=result_scrollbar.set)
         result_scrollbar.config(command=self.result_text.yview)
         
-        # Command+C監視用の変数
-        self.cmd_c_times = []  # Command+Cが押された時刻のリスト
-        self.last_c_with_cmd = 0  # 最後にCommand+Cが押された時刻
-        
         # スクロール同期用フラグ
         self.sync_in_progress = False
         
@@ -205,6 +239,9 @@ class PLaMoTranslator:
         self.root.bind('<KeyPress-Control_R>', lambda e: setattr(self, 'cmd_pressed', True))
         self.root.bind('<KeyRelease-Control_R>', lambda e: setattr(self, 'cmd_pressed', False))
         
+        # メインループの遅延監視（ステータスバーに表示）
+        self.lag_monitor = LoopLagMonitor(self.root, label=self.lag_label).start()
+        
         # グローバルキーボード監視を開始
         if PYNPUT_AVAILABLE:
             try:
@@ -230,7 +267,8 @@ class PLaMoTranslator:
         )
         return "Japanese" if japanese_chars else "English"
 
-    def translate_streaming(self, text):
+    @profiling.profiled_request("translate_streaming")
+    def translate_streaming(self, text, buffer):
         """ストリーミング翻訳実行"""
         # 言語を自動検出
         source_lang = self.detect_language(text)
@@ -239,59 +277,59 @@ class PLaMoTranslator:
         print(f"🔄 ストリーミング翻訳開始: {source_lang} → {target_lang}")
         print(f"📝 入力テキスト: '{text}'")
         
+        # 用語集の用語をプレースホルダで保護
+        protected_text, glossary_targets = self.glossary.protect(text, source_lang)
+        
+        # 出力を逐次整形（用語復元・改行圧縮・空白除去・日本語はBudouX文節分割）
+        pipeline = build_pipeline(glossary_targets, segment=(target_lang == "Japanese"))
+        
+        def on_chunk(chunk):
+            # 整形済みの確定部分だけを表示（判断待ちの文字は保留）
+            chunk = pipeline.feed(chunk)
+            if chunk:
+                buffer.append(strip_breaks(chunk))
+                # UIに文字を追加（メインスレッドで実行）
+                self.root.after(0, lambda c=chunk: self.append_char(c))
+        
+        def flush_pipeline():
+            rest = pipeline.finish()
+            if rest:
+                buffer.append(strip_breaks(rest))
+                self.root.after(0, lambda c=rest: self.append_char(c))
+            return buffer.text()
+        
         try:
-            # PLaMo CLIをストリーミングモード（--no-streamオプションを削除）で実行
-            plamo_path = '/opt/homebrew/bin/plamo-translate'
-            
-            # Popenを使用してリアルタイム出力を取得
-            process = subprocess.Popen(
-                [plamo_path, '--from', source_lang, '--to', target_lang],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                bufsize=0  # バッファなし
-            )
-            
-            # 入力テキストを送信
-            process.stdin.write(text)
-            process.stdin.close()
-            
             # 結果エリアをクリア
             self.root.after(0, self.clear_result)
             
-            # ストリーミング出力を読み取り
-            full_result = ""
-            while True:
-                char = process.stdout.read(1)
-                if not char:
-                    break
-                
-                full_result += char
-                # UIに文字を追加（メインスレッドで実行）
-                self.root.after(0, lambda c=char: self.append_char(c))
-                
-                # 少し待機してUIの更新を滑らかにする
-                time.sleep(0.01)
+            # PLaMo CLIをストリーミングモードで実行（出力が止まるか期限を過ぎたら打ち切り）
+            plamo_path = '/opt/homebrew/bin/plamo-translate'
+            run_cli_streaming(
+                [plamo_path, '--from', source_lang, '--to', target_lang],
+                protected_text,
+                on_chunk=on_chunk
+            )
             
-            # プロセス終了まで待機
-            return_code = process.wait()
+            full_result = flush_pipeline()
+            print(f"✅ ストリーミング翻訳完了: '{full_result}'")
             
-            if return_code != 0:
-                stderr_output = process.stderr.read()
-                error_msg = f"❌ 翻訳エラー: {stderr_output}"
-                self.root.after(0, lambda: self.show_error(error_msg))
-                return
-            
-            print(f"✅ ストリーミング翻訳完了: '{full_result.strip()}'")
+            # 翻訳メモリに登録
+            self.translation_memory.add(text, full_result, source_lang, target_lang)
             
             # 翻訳完了処理
-            self.root.after(0, self.on_translation_complete)
+            self.root.after(0, lambda: self.on_translation_complete(full_result))
             
-        except subprocess.TimeoutExpired:
-            error_msg = "❌ 翻訳がタイムアウトしました"
-            print(error_msg)
-            self.root.after(0, lambda: self.show_error(error_msg))
+        except DeadlineExceeded as e:
+            # 途中結果は表示したまま残す（翻訳メモリ・履歴には登録しない）
+            partial = flush_pipeline()
+            print(f"⏰ {e}（{len(partial)}文字の途中結果）")
+            if partial:
+                # e は except ブロックを出ると消えるため、メッセージを先に取り出しておく
+                message = str(e)
+                self.root.after(0, lambda: self.on_translation_partial(partial, message))
+            else:
+                error_msg = f"❌ {e}"
+                self.root.after(0, lambda: self.show_error(error_msg))
         except Exception as e:
             error_msg = f"❌ 翻訳エラー: {str(e)}"
             print(error_msg)
@@ -303,29 +341,64 @@ class PLaMoTranslator:
         self.result_text.delete("1.0", tk.END)
         self.result_text.config(state=tk.DISABLED)
 
+    @profiling.profiled("ui.insert")
     def append_char(self, char):
         """文字を結果エリアに追加"""
         self.result_text.config(state=tk.NORMAL)
-        self.result_text.insert(tk.END, char, "streaming")
+        for piece, tiny in display_pieces(char):
+            self.result_text.insert(tk.END, piece, "tiny_space" if tiny else "streaming")
         self.result_text.config(state=tk.DISABLED)
         self.result_text.see(tk.END)  # 自動スクロール
 
-    def on_translation_complete(self):
+    def on_translation_complete(self, full_result=""):
         """翻訳完了時の処理"""
-        # ストリーミング色を通常色に変更
-        self.result_text.config(state=tk.NORMAL)
-        content = self.result_text.get("1.0", tk.END)
-        self.result_text.delete("1.0", tk.END)
-        self.result_text.insert("1.0", content, "normal")
-        self.result_text.config(state=tk.DISABLED)
+        # ストリーミング色を通常色に変更（再挿入せずタグだけ付け替える）
+        source, source_lang, target_lang = self.current_source
+        self.history.append(source, full_result, source_lang, target_lang)
+        self.result_text.tag_remove("streaming", "1.0", tk.END)
+        self.result_text.tag_add("normal", "1.0", tk.END)
         
         # UI状態をリセット
         self.is_translating = False
         self.translate_button.config(text="🔄 翻訳実行", state=tk.NORMAL)
         self.status_label.config(text="✅ 翻訳完了", fg="#00aa00")
 
+    def on_translation_partial(self, partial, reason):
+        """期限切れ・停止検出で打ち切られたときの処理（途中結果を残す）"""
+        self.result_text.tag_remove("streaming", "1.0", tk.END)
+        self.result_text.tag_add("normal", "1.0", tk.END)
+        
+        self.is_translating = False
+        self.translate_button.config(text="🔄 翻訳実行", state=tk.NORMAL)
+        self.status_label.config(text=f"⏱️ 途中結果: {reason}", fg="#cc7700")
+
+    def open_history(self, event=None):
+        """翻訳履歴の検索ウィンドウを開く"""
+        open_history_window(self.root, on_select=self.show_history_entry)
+        return "break"
+    
+    def show_history_entry(self, entry):
+        """履歴の翻訳を入力・結果エリアに復元"""
+        self.input_text.delete("1.0", tk.END)
+        self.input_text.insert("1.0", entry.source)
+        self.result_text.config(state=tk.NORMAL)
+        self.result_text.delete("1.0", tk.END)
+        self.result_text.insert("1.0", entry.target, "normal")
+        self.result_text.config(state=tk.DISABLED)
+        self.result_buffer = ResultBuffer(entry.target)
+
+    def show_memory_result(self, translated, status):
+        """翻訳メモリの訳文を表示"""
+        self.result_text.config(state=tk.NORMAL)
+        self.result_text.delete("1.0", tk.END)
+        self.result_text.insert("1.0", translated, "normal")
+        self.result_text.config(state=tk.DISABLED)
+        self.result_buffer = ResultBuffer(translated)
+        self.status_label.config(text=status, fg="#00aa00")
+
     def show_error(self, error_msg):
         """エラーメッセージを表示"""
+        self.result_buffer = ResultBuffer()
         self.result_text.config(state=tk.NORMAL)
         self.result_text.delete("1.0", tk.END)
         self.result_text.insert("1.0", error_msg, "normal")
@@ -338,9 +411,10 @@ class PLaMoTranslator:
     def copy_result(self):
         """翻訳結果をクリップボードにコピー"""
         try:
-            result_text = self.result_text.get("1.0", tk.END).strip()
+            # 文節区切りの極小スペースを含まないプレーンテキストを優先（ウィジェットから再取得しない）
+            result_text = self.result_buffer.text() or self.result_text.get("1.0", tk.END).strip()
             if result_text and result_text != "❌ テキストがありません":
-                pyperclip.copy(result_text)
+                self.clipboard.copy(result_text)
                 
                 # コピー成功の視覚的フィードバック
                 original_text = self.copy_button.config('text')[-1]
@@ -371,13 +445,31 @@ class PLaMoTranslator:
             self.result_text.config(state=tk.DISABLED)
             return
         
+        # 翻訳メモリを確認（完全一致ならエンジンを呼ばない）
+        source_lang = self.detect_language(text)
+        target_lang = "English" if source_lang == "Japanese" else "Japanese"
+        match = self.translation_memory.lookup(text, source_lang, target_lang)
+        if match and match.is_exact:
+            print("📚 翻訳メモリ完全一致 → エンジン呼び出しなし")
+            self.show_memory_result(match.target, "📚 翻訳メモリから表示")
+            return
+        
         # UI状態を更新
         self.is_translating = True
+        self.current_source = (text, source_lang, target_lang)
         self.translate_button.config(text="⏸️ 翻訳中...", state=tk.DISABLED)
         self.status_label.config(text="🔄 翻訳中...", fg="#0066cc")
         
-        # バックグラウンドで翻訳を実行
-        thread = threading.Thread(target=self.translate_streaming, args=(text,), daemon=True)
+        if match:
+            # 類似訳を候補として先に表示し、ストリーミング結果で置き換える
+            print(f"💡 類似訳あり (類似度 {match.similarity:.0%})")
+            self.show_memory_result(match.target, f"💡 類似訳 {match.similarity:.0%} → 翻訳中...")
+        
+        # バックグラウンドで翻訳を実行（結果バッファは翻訳スレッドと共有）
+        self.result_buffer = ResultBuffer()
+        thread = threading.Thread(
+            target=self.translate_streaming, args=(text, self.result_buffer), daemon=True
+        )
         thread.start()
 
     # 以下、既存のメソッドをそのまま継承
@@ -449,7 +541,7 @@ class PLaMoTranslator:
     def load_and_translate(self):
         """クリップボードからテキストを読み込んで翻訳"""
         try:
-            clipboard_text = pyperclip.paste()
+            clipboard_text = self.clipboard.paste()
             if clipboard_text and clipboard_text.strip():
                 # 入力エリアにクリップボードの内容を設定
                 self.input_text.delete("1.0", tk.END)
@@ -468,34 +560,16 @@ class PLaMoTranslator:
             print(f"⚠️ クリップボード読み込みエラー: {e}")
     
     
+    def on_cmd_c_global(self):
+        """Command+C 2回押下を検出（リスナースレッドから呼ばれる）"""
+        print("🚀 Command+C x2 検出！自動翻訳を開始...")
+        self.root.after(0, self.load_and_translate)
+    
     def start_global_hotkey(self):
-        """グローバルホットキー監視開始"""
-        from pynput.keyboard import GlobalHotKeys
-        
-        # Command+Cのホットキーを登録
-        def on_cmd_c():
-            current_time = time.time()
-            self.cmd_c_times.append(current_time)
-            
-            # 3秒以内のCommand+C押下のみを保持
-            self.cmd_c_times = [t for t in self.cmd_c_times if current_time - t <= 3.0]
-            
-            # 1秒以内に2回Command+Cが押された場合
-            recent_presses = [t for t in self.cmd_c_times if current_time - t <= 1.0]
-            if len(recent_presses) >= 2:
-                print("🚀 Command+C x2 検出！自動翻訳を開始...")
-                threading.Thread(target=self.load_and_translate, daemon=True).start()
-                self.cmd_c_times.clear()  # リセット
-        
-        # ホットキーを設定
-        hotkeys = {
-            '<cmd>+c': on_cmd_c,
-            '<ctrl>+c': on_cmd_c  # Windows/Linux用
-        }
-        
-        self.hotkey_listener = GlobalHotKeys(hotkeys)
-        self.hotkey_listener.daemon = True
-        self.hotkey_listener.start()
+        """グローバルホットキー監視開始（共有エンジンに登録）"""
+        self.hotkey_engine = get_hotkey_engine()
+        self.hotkey_engine.add_callback(self.on_cmd_c_global)
+        self.hotkey_engine.start()
     
     def run(self):
         """アプリケーション実行"""
@@ -503,5 +577,6 @@ class PLaMoTranslator:
 
 
 if __name__ == "__main__":
+    profiling.configure_from_argv()
     app = PLaMoTranslator()
     app.run()
\ No newline at end of file
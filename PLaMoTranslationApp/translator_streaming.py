@@ -7,27 +7,28 @@ import tkinter as tk
 from tkinter import scrolledtext
 import subprocess
 import threading
-import pyperclip
 import time
-try:
-    from pynput import keyboard
-    PYNPUT_AVAILABLE = True
-except ImportError:
-    PYNPUT_AVAILABLE = False
 import sys
 import os
 
-# BudouX for adaptive Japanese text formatting (optional)
-try:
-    import budoux
-    BUDOUX_AVAILABLE = True
-    parser = budoux.load_default_japanese_parser()
-except ImportError:
-    BUDOUX_AVAILABLE = False
-    parser = None
+# 共有グローバルホットキーエンジン
+from hotkey_engine import get_hotkey_engine, PYNPUT_AVAILABLE
+
+# ストリーミング後処理パイプライン（改行圧縮・空白除去・BudouX文節分割）
+from postprocess import StreamPipeline, PhraseSegmenter, display_pieces
 
 # ストリーミング翻訳エンジンをインポート
-from streaming_translator import get_translator
+from streaming_translator import get_translator, detect_language
+# 検索可能な翻訳履歴
+from translation_history import get_translation_history, open_history_window
+# オプトインのプロファイリング（--profile / PLAMO_PROFILE_DIR）
+import profiling
+# Tk メインループの遅延監視
+from ui_watchdog import LoopLagMonitor
+# プロセスを起動しないクリップボード（NSPasteboard / Tk / 常駐ヘルパー）
+from clipboard import get_clipboard
+# 入力しながらのライブ翻訳（デバウンス・変更文のみ・取り消し）
+from live_translate import LiveTranslator, streaming_translate_fn
 
 
 class PLaMoTranslatorStreaming:
@@ -39,6 +40,13 @@ class PLaMoTranslatorStreaming:
         # ストリーミング翻訳エンジンを取得
         self.translator = get_translator()
         self.is_translating = False
+        self.history = get_translation_history()
+        self.clipboard = get_clipboard(self.root)
+        self.current_source = ""
+        self.current_langs = ("", "")
+        # 日本語出力の文節分割（BudouX）
+        self.segmenter = None
+        self.warming_up = False
         
         # メインフレーム（左右分割）
         main_frame = tk.Frame(self.root)
@@ -92,6 +100,29 @@ class PLaMoTranslatorStreaming:
         )
         self.translate_button.pack(side=tk.LEFT)
         
+        # 履歴ボタン
+        self.history_button = tk.Button(
+            button_frame,
+            text="🕘 履歴",
+            command=self.open_history,
+            font=("BIZ UDPGothic", 12),
+            relief=tk.FLAT,
+            padx=10,
+            pady=5
+        )
+        self.history_button.pack(side=tk.LEFT, padx=(5, 0))
+        
+        # ライブ翻訳（入力しながら翻訳）の切り替え
+        self.live_var = tk.BooleanVar(value=False)
+        self.live_check = tk.Checkbutton(
+            button_frame,
+            text="⚡ ライブ",
+            variable=self.live_var,
+            command=self.toggle_live,
+            font=("BIZ UDPGothic", 11)
+        )
+        self.live_check.pack(side=tk.LEFT, padx=(5, 0))
+        
         # ストリーミング状態表示
         self.status_label = tk.Label(
             button_frame,
@@ -100,6 +131,15 @@ class PLaMoTranslatorStreaming:
             fg="#888888"
         )
         self.status_label.pack(side=tk.RIGHT)
+
+        # UI遅延の表示（メインループの遅延監視）
+        self.lag_label = tk.Label(
+            button_frame,
+            text="",
+            font=("BIZ UDPGothic", 9),
+            fg="#aaaaaa"
+        )
+        self.lag_label.pack(side=tk.RIGHT, padx=(0, 10))
         
         # 右側フレーム（結果エリア）
         right_frame = tk.Frame(main_frame, width=380)
@@ -144,9 +184,6 @@ class PLaMoTranslatorStreaming:
         self.result_text.config(yscrollcommand=result_scrollbar.set)
         result_scrollbar.config(command=self.result_text.yview)
         
-        # Command+C監視用の変数
-        self.c_press_times = []
-        
         # スクロール同期用フラグ
         self.sync_in_progress = False
         
@@ -166,9 +203,18 @@ class PLaMoTranslatorStreaming:
         left_frame.bind('<Enter>', lambda e: left_frame.focus_set())
         right_frame.bind('<Enter>', lambda e: right_frame.focus_set())
         
+        # ライブ翻訳: キー入力をデバウンスし、変わった文だけを翻訳する
+        self.live = LiveTranslator(
+            streaming_translate_fn(self.translator), self.show_live_result, root=self.root
+        )
+        self.input_text.bind('<KeyRelease>', self.on_input_key)
+        
         # 翻訳エンジンを初期化
         self.initialize_translator()
         
+        # メインループの遅延監視（ステータスバーに表示）
+        self.lag_monitor = LoopLagMonitor(self.root, label=self.lag_label).start()
+        
         # グローバルキーボード監視を開始
         if PYNPUT_AVAILABLE:
             try:
@@ -193,7 +239,10 @@ class PLaMoTranslatorStreaming:
         self.status_label.config(text=message)
         if "準備完了" in message:
             self.status_label.config(fg="#00aa00")  # 緑色
-            self.translate_button.config(state=tk.NORMAL)
+            if not self.is_translating:
+                self.translate_button.config(state=tk.NORMAL)
+        elif "待機中" in message:
+            self.status_label.config(fg="#888888")  # 灰色（次回翻訳時に再読み込み）
         elif "失敗" in message or "エラー" in message:
             self.status_label.config(fg="#aa0000")  # 赤色
             self.translate_button.config(state=tk.DISABLED)
@@ -202,32 +251,70 @@ class PLaMoTranslatorStreaming:
         """翻訳チャンクを受信したときの処理"""
         self.root.after(0, lambda: self.append_translation_chunk(chunk))
     
+    @profiling.profiled("ui.insert")
     def append_translation_chunk(self, chunk):
         """翻訳チャンクをUIに追加"""
         self.result_text.config(state=tk.NORMAL)
-        self.result_text.insert(tk.END, chunk, "streaming")
+        if self.warming_up:
+            # ウォームアップ表示を最初のチャンクで置き換える
+            self.warming_up = False
+            self.result_text.delete("1.0", tk.END)
+            self.update_status("🔄 翻訳中...")
+        if self.segmenter:
+            chunk = self.segmenter.feed(chunk)
+        self.insert_pieces(chunk, "streaming")
         self.result_text.config(state=tk.DISABLED)
         self.result_text.see(tk.END)  # 自動スクロール
     
+    def insert_pieces(self, text, tag):
+        """文節区切りを極小スペースに変換して挿入"""
+        for piece, tiny in display_pieces(text):
+            self.result_text.insert(tk.END, piece, "tiny_space" if tiny else tag)
+    
     def on_translation_complete(self, full_result):
         """翻訳完了時の処理"""
         self.root.after(0, lambda: self.finalize_translation(full_result))
     
     def finalize_translation(self, full_result):
         """翻訳完了後の処理"""
-        # ストリーミング表示を通常表示に変更
-        self.result_text.config(state=tk.NORMAL)
-        content = self.result_text.get("1.0", tk.END)
-        self.result_text.delete("1.0", tk.END)
-        self.result_text.insert("1.0", content, "normal")
-        self.result_text.config(state=tk.DISABLED)
+        self.settle_result()
         
         self.is_translating = False
         self.translate_button.config(text="🔄 翻訳実行", state=tk.NORMAL)
         self.update_status("✅ 翻訳完了")
         
+        self.history.append(self.current_source, full_result, *self.current_langs)
         print(f"✅ 翻訳完了: {full_result}")
     
+    def on_translation_partial(self, partial, reason):
+        """期限切れ・停止検出で打ち切られたときの処理"""
+        self.root.after(0, lambda: self.handle_translation_partial(partial, reason))
+    
+    def handle_translation_partial(self, partial, reason):
+        """途中結果を表示したまま翻訳を終了（履歴には登録しない）"""
+        self.settle_result()
+        if not partial:
+            self.handle_translation_error(f"❌ {reason}")
+            return
+        
+        self.is_translating = False
+        self.translate_button.config(text="🔄 翻訳実行", state=tk.NORMAL)
+        self.update_status(f"⏱️ 途中結果: {reason}")
+        self.status_label.config(fg="#cc7700")
+    
+    def settle_result(self):
+        """保留中の文節を確定し、ストリーミング表示を通常表示に変更（タグの付け替えのみ）"""
+        self.result_text.config(state=tk.NORMAL)
+        if self.warming_up:
+            self.warming_up = False
+            self.result_text.delete("1.0", tk.END)
+        if self.segmenter:
+            self.insert_pieces(self.segmenter.finish(), "streaming")
+            self.segmenter = None
+        self.result_text.tag_remove("streaming", "1.0", tk.END)
+        self.result_text.tag_add("normal", "1.0", tk.END)
+        self.result_text.config(state=tk.DISABLED)
+    
     def on_translation_error(self, error):
         """翻訳エラー時の処理"""
         self.root.after(0, lambda: self.handle_translation_error(error))
@@ -243,10 +330,35 @@ class PLaMoTranslatorStreaming:
         self.translate_button.config(text="🔄 翻訳実行", state=tk.NORMAL)
         self.update_status("❌ 翻訳エラー")
     
+    def toggle_live(self):
+        """ライブ翻訳の切り替え"""
+        if self.live_var.get():
+            self.live.schedule(self.input_text.get("1.0", "end-1c"))
+        else:
+            self.live.stop()
+    
+    def on_input_key(self, event):
+        """入力エリアのキー入力（ライブ翻訳中のみ翻訳を予約）"""
+        if self.live_var.get() and not self.is_translating:
+            self.live.schedule(self.input_text.get("1.0", "end-1c"))
+    
+    @profiling.profiled("ui.insert")
+    def show_live_result(self, pieces):
+        """ライブ翻訳の結果を表示（確定した文は通常表示、翻訳中の文はストリーミング表示）"""
+        if self.is_translating or not self.live_var.get():
+            return
+        self.result_text.config(state=tk.NORMAL)
+        self.result_text.delete("1.0", tk.END)
+        for text, stable in pieces:
+            self.result_text.insert(tk.END, text, "normal" if stable else "streaming")
+        self.result_text.config(state=tk.DISABLED)
+    
     def translate(self):
         """ストリーミング翻訳実行"""
         if self.is_translating:
             return
+        # ライブ翻訳の実行中の分は取り消して全文翻訳を優先する
+        self.live.stop()
         
         text = self.input_text.get("1.0", tk.END).strip()
         print(f"🔄 ストリーミング翻訳開始: '{text}'")
@@ -258,7 +370,7 @@ class PLaMoTranslatorStreaming:
             self.result_text.config(state=tk.DISABLED)
             return
         
-        if not self.translator.is_loaded:
+        if not self.translator.can_translate:
             self.result_text.config(state=tk.NORMAL)
             self.result_text.delete("1.0", tk.END)
             self.result_text.insert("1.0", "❌ 翻訳エンジンが初期化されていません")
@@ -267,12 +379,28 @@ class PLaMoTranslatorStreaming:
         
         # UI状態を更新
         self.is_translating = True
+        self.current_source = text
         self.translate_button.config(text="⏸️ 翻訳中...", state=tk.DISABLED)
-        self.update_status("🔄 翻訳中...")
+        
+        # 翻訳エンジンと同じ判定で言語を決める（履歴に記録する）
+        source_lang = detect_language(text)
+        target_lang = "English" if source_lang == "Japanese" else "Japanese"
+        self.current_langs = (source_lang, target_lang)
+        
+        # 日本語への翻訳ではBudouXで文節の改行機会を挿入
+        target_is_japanese = target_lang == "Japanese"
+        self.segmenter = StreamPipeline([PhraseSegmenter()]) if target_is_japanese else None
         
         # 結果エリアをクリア
         self.result_text.config(state=tk.NORMAL)
         self.result_text.delete("1.0", tk.END)
+        self.warming_up = not self.translator.is_loaded
+        if not self.warming_up:
+            self.update_status("🔄 翻訳中...")
+        else:
+            # アイドル解放後はバックグラウンドで再読み込みしてから翻訳する
+            self.update_status("🔥 ウォームアップ中...")
+            self.result_text.insert("1.0", "🔥 翻訳モデルをウォームアップ中...", "normal")
         self.result_text.config(state=tk.DISABLED)
         
         # ストリーミング翻訳を開始
@@ -280,9 +408,24 @@ class PLaMoTranslatorStreaming:
             text=text,
             chunk_callback=self.on_translation_chunk,
             complete_callback=self.on_translation_complete,
-            error_callback=self.on_translation_error
+            error_callback=self.on_translation_error,
+            partial_callback=self.on_translation_partial
         )
     
+    def open_history(self, event=None):
+        """翻訳履歴の検索ウィンドウを開く"""
+        open_history_window(self.root, on_select=self.show_history_entry)
+        return "break"
+    
+    def show_history_entry(self, entry):
+        """履歴の翻訳を入力・結果エリアに復元"""
+        self.input_text.delete("1.0", tk.END)
+        self.input_text.insert("1.0", entry.source)
+        self.result_text.config(state=tk.NORMAL)
+        self.result_text.delete("1.0", tk.END)
+        self.result_text.insert("1.0", entry.target, "normal")
+        self.result_text.config(state=tk.DISABLED)
+    
     # 以下、既存のメソッドをそのまま継承
     def on_input_mousewheel(self, event):
         """入力エリアのマウスホイールイベント"""
@@ -319,7 +462,7 @@ class PLaMoTranslatorStreaming:
     def load_and_translate(self):
         """クリップボードからテキストを読み込んで翻訳"""
         try:
-            clipboard_text = pyperclip.paste()
+            clipboard_text = self.clipboard.paste()
             if clipboard_text and clipboard_text.strip():
                 # 入力エリアにクリップボードの内容を設定
                 self.input_text.delete("1.0", tk.END)
@@ -337,34 +480,16 @@ class PLaMoTranslatorStreaming:
         except Exception as e:
             print(f"⚠️ クリップボード読み込みエラー: {e}")
     
-    def on_key_press(self, key):
-        """キー押下イベント"""
-        try:
-            if key == keyboard.Key.cmd and hasattr(keyboard.Key, 'cmd'):
-                # Command+C の検出
-                current_time = time.time()
-                self.c_press_times.append(current_time)
-                
-                # 3秒以内のCommand+C押下のみを保持
-                self.c_press_times = [t for t in self.c_press_times if current_time - t <= 3.0]
-                
-                # 1秒以内に2回Command+Cが押された場合
-                recent_presses = [t for t in self.c_press_times if current_time - t <= 1.0]
-                if len(recent_presses) >= 2:
-                    print("🚀 Command+C x2 検出！自動翻訳を開始...")
-                    threading.Thread(target=self.load_and_translate, daemon=True).start()
-                    self.c_press_times.clear()  # リセット
-        except Exception as e:
-            print(f"⚠️ キーイベント処理エラー: {e}")
+    def on_cmd_c_global(self):
+        """Command+C 2回押下を検出（リスナースレッドから呼ばれる）"""
+        print("🚀 Command+C x2 検出！自動翻訳を開始...")
+        self.root.after(0, self.load_and_translate)
     
     def start_global_hotkey(self):
-        """グローバルホットキー監視開始"""
-        def on_press(key):
-            self.on_key_press(key)
-        
-        listener = keyboard.Listener(on_press=on_press)
-        listener.daemon = True
-        listener.start()
+        """グローバルホットキー監視開始（共有エンジンに登録）"""
+        self.hotkey_engine = get_hotkey_engine()
+        self.hotkey_engine.add_callback(self.on_cmd_c_global)
+        self.hotkey_engine.start()
     
     def run(self):
         """アプリケーション実行"""
@@ -372,5 +497,6 @@ class PLaMoTranslatorStreaming:
 
 
 if __name__ == "__main__":
+    profiling.configure_from_argv()
     app = PLaMoTranslatorStreaming()
     app.run()
\ No newline at end of file
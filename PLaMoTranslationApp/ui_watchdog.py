@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+PLaMo翻訳アプリ - Tk メインループの遅延監視
+
+メインループに一定間隔のハートビートを登録し、予定時刻からの遅れ（ループ遅延）を
+常時計測する。ハートビートが閾値以上止まった場合は UI 停止として記録し、
+停止中に監視スレッドからメインスレッドのスタックを採取して、原因となった
+コールバック（Tk から呼ばれた関数）と実行中の位置を残す。
+
+統計はステータスバーに表示でき、PLAMO_UI_METRICS を設定すると終了時に JSON で保存する。
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+# この時間(ms)以上ハートビートが止まったら UI 停止として記録
+DEFAULT_STALL_MS = float(os.environ.get("PLAMO_UI_STALL_MS", "200"))
+DEFAULT_INTERVAL_MS = 50
+# 終了時に統計を書き出すパス
+UI_METRICS_PATH = os.environ.get("PLAMO_UI_METRICS")
+
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+_LAG_SAMPLES = 1200
+_RECENT_STALLS = 50
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _describe_stack(frame) -> Dict[str, Optional[str]]:
+    """Tk から呼ばれたコールバックと、その中で実行中のアプリ側の位置"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()  # 外側 → 内側
+
+    callback = None
+    for parent, child in zip(frames, frames[1:]):
+        # tkinter の CallWrapper.__call__ が直接呼んだ関数がコールバック
+        if parent.f_code.co_name == "__call__" and "tkinter" in parent.f_code.co_filename:
+            callback = child
+    location = None
+    for frame in reversed(frames):
+        if frame.f_code.co_filename.startswith(_APP_DIR) and frame.f_code.co_filename != __file__:
+            location = frame
+            break
+    return {
+        "callback": _frame_name(callback) if callback else None,
+        "location": _frame_name(location) if location else None,
+        "innermost": _frame_name(frames[-1]) if frames else None,
+    }
+
+
+class LoopLagMonitor:
+    """Tk メインループの遅延と停止を計測"""
+
+    def __init__(
+        self,
+        root,
+        interval_ms: float = DEFAULT_INTERVAL_MS,
+        stall_ms: float = DEFAULT_STALL_MS,
+        label=None
+    ):
+        self.root = root
+        self.interval = interval_ms / 1000
+        self.stall = stall_ms / 1000
+        self.label = label
+        self.lags: deque = deque(maxlen=_LAG_SAMPLES)
+        self.stalls: deque = deque(maxlen=_RECENT_STALLS)
+        self.stall_count = 0
+        self.stall_total = 0.0
+        self.worst_stall = 0.0
+        self._expected = 0.0
+        self._last_beat = time.monotonic()
+        self._culprit: Optional[Dict[str, Optional[str]]] = None
+        self._main_ident = threading.main_thread().ident
+        self._stopped = threading.Event()
+        self._last_label_update = 0.0
+
+    def start(self) -> "LoopLagMonitor":
+        self._expected = self._last_beat = time.monotonic() + self.interval
+        self.root.after(int(self.interval * 1000), self._tick)
+        threading.Thread(target=self._watch, daemon=True).start()
+        if UI_METRICS_PATH:
+            atexit.register(self.dump, UI_METRICS_PATH)
+        return self
+
+    def stop(self):
+        self._stopped.set()
+
+    def _tick(self):
+        if self._stopped.is_set():
+            return
+        now = time.monotonic()
+        lag = max(0.0, now - self._expected)
+        gap = now - self._last_beat
+        self.lags.append(lag)
+        self._last_beat = now
+        if gap >= self.stall:
+            self._record_stall(gap)
+        self._expected = now + self.interval
+        self.root.after(int(self.interval * 1000), self._tick)
+        if self.label is not None and now - self._last_label_update >= 1.0:
+            self._last_label_update = now
+            self.label.config(text=self.status_text())
+
+    def _watch(self):
+        """メインループが止まっている間にメインスレッドのスタックを採取"""
+        while not self._stopped.wait(self.stall / 2):
+            if self._culprit is not None:
+                continue
+            if time.monotonic() - self._last_beat >= self.stall:
+                frame = sys._current_frames().get(self._main_ident)
+                if frame is not None:
+                    self._culprit = _describe_stack(frame)
+
+    def _record_stall(self, gap: float):
+        culprit = self._culprit or {"callback": None, "location": None, "innermost": None}
+        self._culprit = None
+        self.stall_count += 1
+        self.stall_total += gap
+        self.worst_stall = max(self.worst_stall, gap)
+        self.stalls.append(dict(at=time.time(), duration_ms=gap * 1000, **culprit))
+        print(f"🐢 UI停止 {gap * 1000:.0f}ms: {culprit['callback'] or '不明'}"
+              f" @ {culprit['location'] or culprit['innermost']}")
+
+    def stats(self) -> Dict:
+        lags = sorted(self.lags)
+
+        def percentile(p: float) -> float:
+            return lags[min(len(lags) - 1, int(len(lags) * p))] * 1000 if lags else 0.0
+
+        return {
+            "lag_p50_ms": percentile(0.5),
+            "lag_p95_ms": percentile(0.95),
+            "lag_p99_ms": percentile(0.99),
+            "lag_max_ms": lags[-1] * 1000 if lags else 0.0,
+            "stall_threshold_ms": self.stall * 1000,
+            "stalls": self.stall_count,
+            "stall_total_ms": self.stall_total * 1000,
+            "worst_stall_ms": self.worst_stall * 1000,
+            "recent_stalls": list(self.stalls),
+        }
+
+    def status_text(self) -> str:
+        """ステータスバー用の短い表示"""
+        stats = self.stats()
+        text = f"UI遅延 p95 {stats['lag_p95_ms']:.0f}ms"
+        if self.stall_count:
+            text += f" / 停止 {self.stall_count}回 (最大 {stats['worst_stall_ms']:.0f}ms)"
+        return text
+
+    def dump(self, path: str):
+        """統計を JSON で保存"""
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.stats(), f, indent=2, ensure_ascii=False)
+        except OSError as e:
+            print(f"⚠️ UI統計の保存に失敗: {e}")